@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+CLI 啟動時間測量
+以 python -X importtime 執行各命令列入口的 --help，統計匯入時間與最重的模組，
+並檢查 --help 是否載入了 torch、librosa、pyannote 等重量級套件
+
+使用範例：
+  python benchmarks/import_time.py                         # 測量全部入口
+  python benchmarks/import_time.py --entry split_dataset   # 只測量指定入口
+  python benchmarks/import_time.py --repeat 5 --json out.json
+  python benchmarks/import_time.py --check                 # 有入口載入重量級套件時結束碼為 1
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 入口名稱 -> (腳本, 參數)
+ENTRY_POINTS = {
+    'speaker_db_manager': ('src/speaker_db_manager.py', ['--help']),
+    'database_cleanup': ('src/database_cleanup.py', ['--help']),
+    'split_dataset': ('src/split_dataset.py', ['--help']),
+    'utterance_index': ('src/utterance_index.py', ['--help']),
+    'export_shards': ('src/export_shards.py', ['--help']),
+    'uvr5_cli': ('src/uvr5_cli.py', ['--help']),
+    'pyannote_speaker_segmentation': ('src/pyannote_speaker_segmentation.py', ['--help']),
+    'episode_worker': ('src/episode_worker.py', ['--help']),
+}
+
+# --help 不應載入的套件（頂層模組名稱）
+HEAVY_MODULES = ('torch', 'torchaudio', 'librosa', 'pyannote', 'audio_separator', 'speechbrain', 'onnxruntime')
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """
+    解析 -X importtime 輸出
+
+    Returns:
+        List[Dict]: 每個匯入的 {'module', 'self_us', 'cumulative_us', 'depth'}
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            imports.append({
+                'module': name.strip(),
+                'self_us': int(self_us),
+                'cumulative_us': int(cumulative_us),
+                'depth': (len(name) - len(name.lstrip(' ')) - 1) // 2
+            })
+        except ValueError:
+            continue
+    return imports
+
+
+def measure_entry(name: str, python: str) -> Dict:
+    """執行一次入口並回傳匯入統計"""
+    script, script_args = ENTRY_POINTS[name]
+    env = {**os.environ, 'PYTHONIOENCODING': 'UTF-8'}
+    start = time.perf_counter()
+    completed = subprocess.run([python, '-X', 'importtime', script, *script_args],
+                               cwd=PROJECT_ROOT, env=env, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    imports = parse_importtime(completed.stderr)
+    top_level = [item for item in imports if item['depth'] == 0]
+    loaded = {item['module'].split('.')[0] for item in imports}
+    return {
+        'returncode': completed.returncode,
+        'wall_ms': wall_ms,
+        'import_ms': sum(item['cumulative_us'] for item in top_level) / 1000,
+        'module_count': len(imports),
+        'heavy_modules': sorted(loaded.intersection(HEAVY_MODULES)),
+        'heaviest': [(item['module'], item['cumulative_us'] / 1000)
+                     for item in sorted(top_level, key=lambda item: -item['cumulative_us'])[:5]]
+    }
+
+
+def benchmark(entries: List[str], repeat: int, python: str) -> Dict[str, Dict]:
+    """每個入口執行 repeat 次，取中位數（第一次執行同時預熱 .pyc 快取）"""
+    results = {}
+    for name in entries:
+        runs = [measure_entry(name, python) for _ in range(repeat)]
+        last = runs[-1]
+        results[name] = {
+            'script': ENTRY_POINTS[name][0],
+            'returncode': last['returncode'],
+            'wall_ms': round(statistics.median(run['wall_ms'] for run in runs), 1),
+            'import_ms': round(statistics.median(run['import_ms'] for run in runs), 1),
+            'module_count': last['module_count'],
+            'heavy_modules': last['heavy_modules'],
+            'heaviest': [(module, round(ms, 1)) for module, ms in last['heaviest']]
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="測量 CLI 入口的啟動與匯入時間")
+    parser.add_argument('--entry', action='append', choices=sorted(ENTRY_POINTS),
+                        help='只測量指定入口（可重複指定）')
+    parser.add_argument('--repeat', type=int, default=3, help='每個入口執行次數（取中位數）')
+    parser.add_argument('--python', default=sys.executable, help='Python 直譯器')
+    parser.add_argument('--json', help='將結果寫入 JSON 檔')
+    parser.add_argument('--check', action='store_true', help='有入口在 --help 時載入重量級套件則結束碼為 1')
+    args = parser.parse_args()
+
+    results = benchmark(args.entry or list(ENTRY_POINTS), max(1, args.repeat), args.python)
+
+    print(f"{'入口':<32}{'總時間':>10}{'匯入':>10}{'模組數':>8}  重量級套件")
+    for name, result in results.items():
+        status = '' if result['returncode'] == 0 else f"  (結束碼 {result['returncode']})"
+        heavy = ', '.join(result['heavy_modules']) or '-'
+        print(f"{name:<32}{result['wall_ms']:>8.0f}ms{result['import_ms']:>8.0f}ms"
+              f"{result['module_count']:>8}  {heavy}{status}")
+        for module, ms in result['heaviest']:
+            print(f"    {module:<40}{ms:>8.1f}ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📄 結果已寫入 {args.json}")
+
+    offenders = [name for name, result in results.items() if result['heavy_modules']]
+    if args.check and offenders:
+        print(f"❌ 以下入口在 --help 時載入重量級套件: {', '.join(offenders)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+處理流程各階段的效能測試
+以合成集數（synthetic_episode.py）測量各階段的時間，不需要下載模型、不需要 GPU：
+
+- decode：decode_episode_audio（原始取樣率 + 16kHz）
+- load_subtitles：字幕解析
+- diarization_processing：從已知輪替建立的 diarization 結果提取說話人片段並過濾
+- generate_final_segments：generate_final_segments_with_subtitles
+- extract_embeddings：extract_speaker_level_embeddings（以固定投影的頻譜模型取代 embedding 模型）
+- db_match_<N>：資料庫有 N 個說話人時 find_similar_speaker 的比對時間
+- segment_audio_files：切割並寫出片段
+- split_dataset：split_by_files 切分上一步的輸出
+
+結果寫成 JSON；每個階段換算為「每單位毫秒」（每句字幕、每個片段、每秒音訊…），
+與 thresholds.json 的上限及 --baseline 的前次結果比較，超出時以 --check 回傳結束碼 1。
+每個階段先不計時執行一次，排除延遲載入（librosa 重取樣器等）的一次性成本。
+
+thresholds.json 為參考主機實測值的 3 倍（只攔截明顯退步）；baseline.json 為同一主機的實測結果，
+以預設設定執行時可用 --baseline 做較嚴格的比較
+
+使用範例：
+  python benchmarks/pipeline_stages.py                                # 預設 10 分鐘、4 個說話人
+  python benchmarks/pipeline_stages.py --quick                        # 2 分鐘、資料庫 10 / 1k
+  python benchmarks/pipeline_stages.py --json out.json --check
+  python benchmarks/pipeline_stages.py --baseline benchmarks/baseline.json --check
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_THRESHOLDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thresholds.json')
+DEFAULT_DB_SIZES = [10, 1000, 100000]
+EMBEDDING_DIM = 256
+DB_QUERIES = 5
+
+
+class StubEmbeddingModel:
+    """以固定亂數投影的對數功率頻譜當作 embedding：計算量小、結果可重現，且能區分合成說話人"""
+
+    def __init__(self, dim: int = EMBEDDING_DIM, n_fft: int = 512, seed: int = 0):
+        import torch
+
+        generator = torch.Generator().manual_seed(seed)
+        self.n_fft = n_fft
+        self.window = torch.hann_window(n_fft)
+        self.projection = torch.randn(n_fft // 2 + 1, dim, generator=generator) / (n_fft // 2 + 1) ** 0.5
+
+    def __call__(self, waveform):
+        import torch
+
+        waveform = waveform.reshape(waveform.shape[0], -1)
+        spectrum = torch.stft(waveform, self.n_fft, hop_length=self.n_fft // 2,
+                              window=self.window.to(waveform.device), return_complex=True)
+        log_power = torch.log(spectrum.abs().pow(2).mean(dim=-1) + 1e-8)
+        return log_power @ self.projection.to(waveform.device)
+
+
+@contextlib.contextmanager
+def quiet():
+    """被測函式的輸出與進度條導向 /dev/null（格式化成本仍計入時間）"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            contextlib.redirect_stderr(devnull):
+        yield
+
+
+def time_stage(func: Callable, repeat: int, setup: Optional[Callable] = None, warmup: int = 1) -> Dict:
+    """
+    先不計時執行 warmup 次（延遲載入的模組、重取樣器與 JIT 的一次性成本），再執行 repeat 次
+    （每次之前呼叫 setup，不計時），回傳各次的牆鐘與 CPU 時間
+    """
+    wall, cpu, result = [], [], None
+    for run in range(warmup + repeat):
+        if setup is not None:
+            setup()
+        with quiet():
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            result = func()
+            if run >= warmup:
+                wall.append(time.perf_counter() - wall_start)
+                cpu.append(time.process_time() - cpu_start)
+    return {'runs_s': [round(value, 5) for value in wall],
+            'median_s': round(statistics.median(wall), 5),
+            'min_s': round(min(wall), 5),
+            'cpu_median_s': round(statistics.median(cpu), 5),
+            'result': result}
+
+
+def _finish(stage: Dict, items: float, unit: str) -> Dict:
+    stage.pop('result', None)
+    stage['items'] = items
+    stage['unit'] = unit
+    stage['ms_per_item'] = round(stage['median_s'] * 1000 / items, 4) if items else None
+    return stage
+
+
+def populate_database(db, size: int, seed: int = 0):
+    """直接寫入 size 個隨機單位向量（不經過 add_speaker，避免建立時間與輸出淹沒測量）"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    with db.session(), db._connect() as conn:
+        for begin in range(0, size, 10000):
+            count = min(10000, size - begin)
+            vectors = rng.standard_normal((count, EMBEDDING_DIM)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            conn.executemany(
+                "INSERT INTO speakers (embedding, embedding_dim, segment_count, notes) VALUES (?, ?, ?, ?)",
+                ((db._serialize_embedding(vector), EMBEDDING_DIM, 0, 'benchmark') for vector in vectors))
+
+
+def run_benchmarks(work_dir: str, duration: float, speakers: int, db_sizes: List[int], repeat: int,
+                   music: bool, seed: int) -> Dict:
+    import numpy as np
+    import torch
+    from pyannote.core import Annotation, Segment
+
+    import pyannote_speaker_segmentation as segmentation
+    import speaker_level_segmentation as sls
+    import split_dataset
+    from speaker_database import SpeakerDatabase
+    from synthetic_episode import generate_episode
+
+    with quiet():
+        segmentation.init_runtime()
+    device = torch.device('cpu')
+    stages = {}
+
+    print(f"🎬 產生合成集數: {duration:.0f}s, {speakers} 個說話人{'（含背景音樂）' if music else ''}")
+    episode = generate_episode(os.path.join(work_dir, 'episode'), duration, speakers, seed, music)
+
+    def report(name: str, stage: Dict, items: float, unit: str):
+        stages[name] = _finish(stage, items, unit)
+        print(f"  {name:<28}{stage['median_s'] * 1000:>10.1f}ms"
+              f"{stage['ms_per_item'] if stage['ms_per_item'] is not None else 0:>12.3f} ms/{unit}")
+
+    stage = time_stage(lambda: segmentation.decode_episode_audio(episode['audio_file']), repeat)
+    decoded = stage['result']
+    report('decode', stage, duration, 'audio_s')
+
+    stage = time_stage(lambda: segmentation.load_subtitles(episode['subtitle_file']), repeat)
+    subtitles = stage['result']
+    report('load_subtitles', stage, len(subtitles), 'subtitle')
+
+    diarization = Annotation(uri='benchmark')
+    for start, end, label in episode['turns']:
+        diarization[Segment(start, end)] = label
+
+    def process_diarization():
+        speaker_segments = sls.extract_speaker_segments_from_diarization(diarization, episode['audio_file'])
+        return {speaker: segments for speaker, segments in speaker_segments.items()
+                if sls.calculate_total_duration(segments) >= 5.0}
+
+    stage = time_stage(process_diarization, repeat)
+    valid_speakers = stage['result']
+    report('diarization_processing', stage, len(episode['turns']), 'turn')
+
+    local_to_global_map = {speaker: index + 1 for index, speaker in enumerate(sorted(valid_speakers))}
+    stage = time_stage(lambda: sls.generate_final_segments_with_subtitles(
+        subtitles, diarization, local_to_global_map, 1.0, 15.0), repeat)
+    final_segments = stage['result']
+    report('generate_final_segments', stage, len(subtitles), 'subtitle')
+
+    model = StubEmbeddingModel()
+    speech_seconds = sum(sls.calculate_total_duration(segments) for segments in valid_speakers.values())
+    stage = time_stage(lambda: sls.extract_speaker_level_embeddings(
+        valid_speakers, episode['audio_file'], model, device, decoded['audio_16k']), repeat)
+    embeddings = stage['result']
+    report('extract_embeddings', stage, speech_seconds, 'speech_s')
+
+    queries = list(embeddings.values())[:DB_QUERIES] or [np.ones(EMBEDDING_DIM, dtype=np.float32)]
+    for size in db_sizes:
+        db_path = os.path.join(work_dir, f'speakers_{size}.db')
+        with quiet():
+            db = SpeakerDatabase(db_path)
+        populate_database(db, size, seed)
+
+        def match():
+            with db.session():
+                return [db.find_similar_speaker(query, 0.4) for query in queries]
+
+        report(f'db_match_{size}', time_stage(match, repeat), len(queries), 'query')
+
+    output_dir = os.path.join(work_dir, 'output')
+    stage = time_stage(
+        lambda: segmentation.segment_audio_files(final_segments, episode['audio_file'], output_dir,
+                                                 subtitles, episode['episode_num'], decoded),
+        repeat, setup=lambda: shutil.rmtree(output_dir, ignore_errors=True))
+    report('segment_audio_files', stage, len(final_segments), 'segment')
+
+    split_dir = os.path.join(work_dir, 'split')
+    file_count = sum(len(split_dataset.get_speaker_files(output_dir, speaker))
+                     for speaker in split_dataset.get_all_speakers(output_dir))
+
+    def reset_split():
+        shutil.rmtree(split_dir, ignore_errors=True)
+        random.seed(seed)
+
+    stage = time_stage(lambda: split_dataset.split_by_files(output_dir, split_dir, 0.2), repeat,
+                       setup=reset_split)
+    report('split_dataset', stage, file_count, 'file')
+
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'host': socket.gethostname(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'config': {'duration': duration, 'speakers': speakers, 'db_sizes': db_sizes, 'repeat': repeat,
+                   'music': music, 'seed': seed, 'turns': len(episode['turns']),
+                   'subtitles': len(subtitles), 'segments': len(final_segments)},
+        'stages': stages
+    }
+
+
+def check_regressions(results: Dict, thresholds: Optional[Dict], baseline: Optional[Dict],
+                      tolerance: float) -> List[str]:
+    """超出 thresholds.json 上限（ms/單位）或比 baseline 慢超過 tolerance 的階段"""
+    problems = []
+    limits = (thresholds or {}).get('max_ms_per_item', {})
+    if baseline and baseline.get('config', {}).get('duration') != results['config']['duration']:
+        # 部分階段（例如 generate_final_segments）的每單位成本隨集數長度變化
+        print(f"⚠️ 基準的集數長度 ({baseline.get('config', {}).get('duration')}s) 與本次 "
+              f"({results['config']['duration']}s) 不同，比較結果僅供參考")
+    for name, stage in results['stages'].items():
+        value = stage['ms_per_item']
+        if value is None:
+            continue
+        limit = limits.get(name)
+        if limit is not None and value > limit:
+            problems.append(f"{name}: {value:.3f} ms/{stage['unit']} > 上限 {limit}")
+        previous = (baseline or {}).get('stages', {}).get(name, {}).get('ms_per_item')
+        if previous and value > previous * (1 + tolerance):
+            problems.append(f"{name}: {value:.3f} ms/{stage['unit']} 比基準 {previous:.3f} 慢 "
+                            f"{(value / previous - 1) * 100:.0f}%（容許 {tolerance * 100:.0f}%）")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以合成集數測量處理流程各階段的效能（CPU、離線）")
+    parser.add_argument('--duration', type=float, default=600.0, help='合成集數長度（秒）')
+    parser.add_argument('--speakers', type=int, default=4, help='說話人數')
+    parser.add_argument('--db-sizes', type=int, nargs='+', default=DEFAULT_DB_SIZES, help='資料庫說話人數')
+    parser.add_argument('--repeat', type=int, default=3, help='每個階段執行次數（取中位數）')
+    parser.add_argument('--music', action='store_true', help='合成集數加入背景音樂')
+    parser.add_argument('--seed', type=int, default=0, help='亂數種子')
+    parser.add_argument('--quick', action='store_true', help='2 分鐘集數、資料庫 10 / 1000、每階段 1 次')
+    parser.add_argument('--json', help='將結果寫入 JSON 檔')
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS, help='各階段上限（ms/單位）設定檔')
+    parser.add_argument('--baseline', help='前次結果 JSON，比較各階段 ms/單位')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='相對 baseline 容許變慢的比例')
+    parser.add_argument('--check', action='store_true', help='有階段超出上限或退步時結束碼為 1')
+    parser.add_argument('--keep', help='保留合成資料與輸出的目錄（預設使用暫存目錄並於結束後刪除）')
+    args = parser.parse_args()
+
+    if args.quick:
+        args.duration, args.db_sizes, args.repeat = 120.0, [10, 1000], 1
+    # 只在 CPU 上測量，且不嘗試連線下載
+    os.environ.setdefault('CUDA_VISIBLE_DEVICES', '')
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+    os.environ.setdefault('TELEMETRY_DIR', 'off')
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix='tts_benchmark_')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        results = run_benchmarks(work_dir, args.duration, args.speakers, sorted(set(args.db_sizes)),
+                                 max(1, args.repeat), args.music, args.seed)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    thresholds = None
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds, 'r', encoding='utf-8') as f:
+            thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    problems = check_regressions(results, thresholds, baseline, args.tolerance)
+    results['regressions'] = problems
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📄 結果已寫入 {args.json}")
+
+    if problems:
+        print("⚠️ 效能退步:")
+        for problem in problems:
+            print(f"  - {problem}")
+    else:
+        print("✅ 所有階段都在上限內")
+    return 1 if args.check and problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
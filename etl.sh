@@ -213,7 +213,7 @@ smart_process_menu() {
             
             if [[ "$continue_processing" =~ ^[Nn]$ ]]; then
                 echo "✅ 僅完成 UVR5 人聲分離"
-                echo "💡 提示：處理後的檔案已覆蓋原檔案，備份檔案為 .bak"
+                echo "💡 提示：處理後的檔案已覆蓋原檔案，原始檔案保留於 .uvr5_originals/"
                 pause_for_input
                 return
             fi
@@ -226,7 +226,7 @@ smart_process_menu() {
             echo "   3. 或使用選單選項 4 手動切分已處理的資料"
             echo ""
             echo "📁 UVR5 處理完成的檔案位置：$input_path (已覆蓋原檔案)"
-            echo "🔄 備份檔案：原檔案名.bak"
+            echo "🔄 原始檔案：$input_path/.uvr5_originals/ (處理狀態記錄於 .uvr5_manifest.db)"
             
             pause_for_input
             ;;
@@ -51,6 +51,27 @@ run_python_script() {
     return $result
 }
 
+# Function to run pyannote speaker segmentation for one episode
+# With EPISODE_WORKER=true the job goes to the long-running episode worker (started on first use),
+# so models are loaded once instead of once per episode
+run_pyannote_segmentation() {
+    local python_cmd="$1"
+    shift
+    
+    if [ "${EPISODE_WORKER:-false}" = "true" ]; then
+        local spool_dir="${EPISODE_WORKER_SPOOL:-data/.episode_worker}"
+        if ! $python_cmd src/episode_worker.py --spool "$spool_dir" status > /dev/null 2>&1; then
+            echo "🚀 啟動常駐集數處理程序 (日誌: $spool_dir/worker.log)"
+            mkdir -p "$spool_dir"
+            PYTHONIOENCODING=UTF-8 nohup $python_cmd src/episode_worker.py --spool "$spool_dir" serve \
+                >> "$spool_dir/worker.log" 2>&1 &
+        fi
+        PYTHONIOENCODING=UTF-8 $python_cmd src/episode_worker.py --spool "$spool_dir" submit -- "$@"
+    else
+        PYTHONIOENCODING=UTF-8 $python_cmd src/pyannote_speaker_segmentation.py "$@"
+    fi
+}
+
 # Function to validate episode number input
 validate_episode_input() {
     local input="$1"
@@ -129,7 +129,7 @@ process_single_episode() {
             segmentation_args="$segmentation_args --min_speaker_duration $MIN_SPEAKER_DURATION"
         fi
         
-        PYTHONIOENCODING=UTF-8 $python_cmd src/pyannote_speaker_segmentation.py \
+        run_pyannote_segmentation "$python_cmd" \
             "$audio_file" \
             "$subtitle_file" \
             --episode_num "$episode_num" \
@@ -289,7 +289,8 @@ split_dataset() {
     $python_cmd "src/split_dataset.py" \
         --processed_dir "$processed_dir" \
         --split_dir "$output_dir" \
-        --test_ratio "$test_ratio"
+        --test_ratio "$test_ratio" \
+        --link_mode "${SPLIT_LINK_MODE:-copy}"
     
     if [ $? -eq 0 ]; then
         echo "✅ 資料集切分完成"
@@ -368,7 +369,8 @@ process_and_split() {
     $python_cmd "src/split_dataset.py" \
         --processed_dir "$processed_dir" \
         --split_dir "$split_dir" \
-        --test_ratio "$test_ratio"
+        --test_ratio "$test_ratio" \
+        --link_mode "${SPLIT_LINK_MODE:-copy}"
     
     if [ $? -eq 0 ]; then
         echo "✅ 資料集切分完成"
@@ -544,7 +546,8 @@ split_dataset_episode() {
         --split_dir "$output_dir" \
         --method "episode" \
         --episode_num "$episode_num" \
-        --test_ratio "$test_ratio"
+        --test_ratio "$test_ratio" \
+        --link_mode "${SPLIT_LINK_MODE:-copy}"
     
     if [ $? -eq 0 ]; then
         echo "✅ 資料集切分完成"
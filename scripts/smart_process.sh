@@ -212,7 +212,7 @@ finally:
     # 執行 pyannote 處理（使用 .env 中的參數）
     echo "🚀 執行 pyannote 處理..."
     echo "🎵 使用音檔: $(basename "$processed_audio_file")"
-    if $python_cmd "src/pyannote_speaker_segmentation.py" \
+    if run_pyannote_segmentation "$python_cmd" \
         "$processed_audio_file" "$subtitle_file" \
         --episode_num "$episode_num" \
         --output_dir "$output_dir"; then
@@ -263,7 +263,8 @@ smart_process_episode() {
         --split_dir "$split_dir" \
         --method "episode" \
         --episode_num "$episode_num" \
-        --test_ratio "$test_ratio"; then
+        --test_ratio "$test_ratio" \
+        --link_mode "${SPLIT_LINK_MODE:-copy}"; then
         echo "✅ 切分完成"
     else
         echo "❌ 切分失敗"
@@ -447,7 +448,7 @@ smart_process_episode_with_uvr5() {
         log_step_start "$episode_num" "pyannote處理"
         
         # 執行 pyannote 處理
-        if $python_cmd "src/pyannote_speaker_segmentation.py" \
+        if run_pyannote_segmentation "$python_cmd" \
             "$uvr5_output_file" "$subtitle_file" \
             --episode_num "$episode_num" \
             --output_dir "$pyannote_output_dir"; then
@@ -489,7 +490,8 @@ smart_process_episode_with_uvr5() {
             --split_dir "$split_dir" \
             --method "episode" \
             --episode_num "$episode_num" \
-            --test_ratio "$test_ratio"; then
+            --test_ratio "$test_ratio" \
+            --link_mode "${SPLIT_LINK_MODE:-copy}"; then
             echo "  ✅ 切分完成"
             log_step_end "$episode_num" "切分資料集" "$split_start_time"
         else
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+硬體自動調校
+以合成音訊在本機測量 segmentation 與 embedding 模型在不同執行緒數與 batch 大小下的吞吐量，
+將最佳設定寫成每台主機各自的設定檔，pyannote_speaker_segmentation 載入時自動套用
+
+設定檔內容：
+- threads：CPU 運算執行緒（OMP/MKL 與 torch intra-op）、inter-op 執行緒
+- batch_sizes：各裝置（cpu / cuda）的 segmentation_batch_size 與 embedding_batch_size
+
+設定檔位置：AUTOTUNE_PROFILE（空白 = data/autotune/<主機名稱>.json，off = 停用）
+
+使用範例：
+  python src/autotune.py run                       # 測量並寫入本機設定檔
+  python src/autotune.py run --device cpu --quick  # 只測 CPU，縮小搜尋範圍
+  python src/autotune.py show                      # 顯示目前套用的設定
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SAMPLE_RATE = 16000
+DEFAULT_BATCH_SIZES = [1, 4, 8, 16, 32, 64, 128]
+QUICK_BATCH_SIZES = [8, 32, 128]
+# 吞吐量差距在此比例內時選擇較少的執行緒 / 較小的 batch（節省資源、降低延遲）
+TOLERANCE = 0.05
+
+
+def host_fingerprint() -> Dict:
+    """主機特徵（CPU 數與 GPU 型號改變時設定檔失效）"""
+    fingerprint = {'hostname': socket.gethostname(), 'machine': platform.machine(), 'cpu_count': os.cpu_count()}
+    try:
+        import torch
+        if torch.cuda.is_available():
+            fingerprint['gpu'] = torch.cuda.get_device_name(0)
+    except ImportError:
+        pass
+    return fingerprint
+
+
+def gpu_matches(profile: Dict) -> bool:
+    """設定檔的 GPU 型號是否與本機相同（torch 尚未匯入時無法得知，視為相同，不為此匯入 torch）"""
+    torch = sys.modules.get('torch')
+    if torch is None:
+        return True
+    current = torch.cuda.get_device_name(0) if torch.cuda.is_available() else None
+    return profile.get('fingerprint', {}).get('gpu') == current
+
+
+def profile_path() -> Optional[Path]:
+    """本機設定檔路徑（AUTOTUNE_PROFILE=off 時回傳 None）"""
+    setting = os.environ.get('AUTOTUNE_PROFILE', '').strip()
+    if setting.lower() == 'off':
+        return None
+    if setting:
+        path = Path(setting)
+        return path if path.is_absolute() else PROJECT_ROOT / path
+    return PROJECT_ROOT / "data" / "autotune" / f"{socket.gethostname()}.json"
+
+
+def load_profile() -> Optional[Dict]:
+    """
+    讀取本機設定檔（不匯入 torch，可在設定 OMP_NUM_THREADS 之前呼叫）
+
+    CPU 數不符時失效；torch 已匯入時另外比對 GPU 型號（尚未匯入時由 apply_batch_sizes 比對）
+
+    Returns:
+        Dict 或 None（不存在、停用或硬體不符）
+    """
+    path = profile_path()
+    if path is None or not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 無法讀取調校設定檔 {path}: {e}")
+        return None
+    if profile.get('fingerprint', {}).get('cpu_count') != os.cpu_count() or not gpu_matches(profile):
+        print(f"⚠️ 調校設定檔 {path} 是在不同的硬體上產生，請重新執行 autotune.py run")
+        return None
+    return profile
+
+
+def thread_settings(profile: Optional[Dict], default_threads: int = 4, default_interop: int = 1) -> Dict:
+    """{'intra_op', 'interop'}：設定檔優先，否則使用原本的預設值"""
+    threads = (profile or {}).get('threads', {})
+    return {'intra_op': int(threads.get('intra_op', default_threads)),
+            'interop': int(threads.get('interop', default_interop))}
+
+
+def apply_batch_sizes(pipeline, device_type: str, profile: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    將設定檔中該裝置的 batch 大小套用到 diarization pipeline（取代 config.yaml 的固定值）
+
+    Returns:
+        套用的 batch 大小（沒有設定時回傳 None）
+    """
+    profile = profile if profile is not None else load_profile()
+    sizes = (profile or {}).get('batch_sizes', {}).get(device_type)
+    if not sizes:
+        return None
+    if device_type == 'cuda' and not gpu_matches(profile):
+        print(f"⚠️ 調校設定檔的 GPU ({profile.get('fingerprint', {}).get('gpu')}) 與本機不同，"
+              f"不套用 cuda batch 大小，請重新執行 autotune.py run")
+        return None
+    if 'segmentation' in sizes and hasattr(pipeline, 'segmentation_batch_size'):
+        pipeline.segmentation_batch_size = int(sizes['segmentation'])
+    if 'embedding' in sizes and hasattr(pipeline, 'embedding_batch_size'):
+        pipeline.embedding_batch_size = int(sizes['embedding'])
+    print(f"🎛️ 套用調校設定 ({device_type}): segmentation batch {sizes.get('segmentation')}, "
+          f"embedding batch {sizes.get('embedding')}")
+    return sizes
+
+
+# ---------------------------------------------------------------------------
+# 測量
+# ---------------------------------------------------------------------------
+
+def synthetic_chunks(batch_size: int, chunk_seconds: float, seed: int = 0):
+    """[batch, 1, samples] 的合成語音：調幅諧波加雜訊（包含有聲與靜音段落）"""
+    import torch
+
+    generator = torch.Generator().manual_seed(seed)
+    samples = int(chunk_seconds * SAMPLE_RATE)
+    t = torch.arange(samples) / SAMPLE_RATE
+    f0 = 120 + 80 * torch.rand(batch_size, 1, 1, generator=generator)
+    voiced = sum(torch.sin(2 * torch.pi * f0 * k * t) / k for k in range(1, 6))
+    envelope = (torch.sin(2 * torch.pi * 0.5 * t) > -0.3).float()
+    noise = 0.02 * torch.randn(batch_size, 1, samples, generator=generator)
+    return (0.1 * voiced * envelope + noise).float()
+
+
+def measure_throughput(model, batch_size: int, chunk_seconds: float, device, min_seconds: float) -> float:
+    """每秒處理的 chunk 數（先預熱一次，再重複到至少 min_seconds）"""
+    import torch
+
+    chunks = synthetic_chunks(batch_size, chunk_seconds).to(device)
+    with torch.no_grad():
+        model(chunks)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        runs, start = 0, time.perf_counter()
+        while True:
+            model(chunks)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds and runs >= 2:
+                break
+    return batch_size * runs / elapsed
+
+
+def _pick(results: Dict[int, float]) -> int:
+    """吞吐量在最佳值 TOLERANCE 以內的最小候選值"""
+    best = max(results.values())
+    return min(candidate for candidate, throughput in results.items() if throughput >= best * (1 - TOLERANCE))
+
+
+def thread_candidates(cpu_count: int) -> List[int]:
+    candidates, count = [], 1
+    while count < cpu_count:
+        candidates.append(count)
+        count *= 2
+    return candidates + [cpu_count]
+
+
+def run_autotune(devices: List[str], threads: List[int], batch_sizes: List[int],
+                 min_seconds: float = 1.0) -> Dict:
+    """
+    測量並回傳設定檔內容
+
+    1. CPU：固定 batch 32，比較執行緒數（以 segmentation + embedding 的總時間為準）
+    2. 各裝置：以選定的執行緒數比較兩個模型各自的 batch 大小
+    """
+    import torch
+
+    try:
+        from src.export_inference_models import load_eager_model
+    except ImportError:
+        from export_inference_models import load_eager_model
+
+    torch.set_num_interop_threads(1)
+    models = {name: load_eager_model(name) for name in ('segmentation', 'embedding')}
+    chunk_seconds = float(getattr(models['segmentation'].specifications, 'duration', 10.0))
+    results = {'chunk_seconds': chunk_seconds, 'threads': {}, 'batch_sizes': {}}
+
+    cpu = torch.device('cpu')
+    thread_batch = 32
+    for count in threads:
+        torch.set_num_threads(count)
+        seconds_per_chunk = sum(1.0 / measure_throughput(model, thread_batch, chunk_seconds, cpu, min_seconds)
+                                for model in models.values())
+        results['threads'][count] = 1.0 / seconds_per_chunk
+        print(f"  🧵 {count:>3} 執行緒: {results['threads'][count]:.1f} chunks/s")
+    best_threads = _pick(results['threads'])
+    torch.set_num_threads(best_threads)
+    print(f"✅ 執行緒數: {best_threads}")
+
+    profile_batches = {}
+    for device_name in devices:
+        device = torch.device(device_name)
+        profile_batches[device_name] = {}
+        results['batch_sizes'][device_name] = {}
+        for name, model in models.items():
+            model.to(device)
+            throughput = {}
+            for batch_size in batch_sizes:
+                try:
+                    throughput[batch_size] = measure_throughput(model, batch_size, chunk_seconds, device, min_seconds)
+                except RuntimeError as e:
+                    # GPU 記憶體不足時停止嘗試更大的 batch
+                    print(f"  ⚠️ {device_name} {name} batch {batch_size} 失敗: {str(e).splitlines()[0]}")
+                    if device.type == 'cuda':
+                        torch.cuda.empty_cache()
+                    break
+                print(f"  📦 {device_name} {name} batch {batch_size:>4}: {throughput[batch_size]:.1f} chunks/s")
+            model.to(cpu)
+            if throughput:
+                profile_batches[device_name][name] = _pick(throughput)
+                results['batch_sizes'][device_name][name] = throughput
+        print(f"✅ {device_name}: {profile_batches[device_name]}")
+
+    return {
+        'host': socket.gethostname(),
+        'fingerprint': host_fingerprint(),
+        'torch': torch.__version__,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'threads': {'intra_op': best_threads, 'interop': 1},
+        'batch_sizes': profile_batches,
+        'measurements': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="測量本機最佳執行緒數與 batch 大小")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='測量並寫入本機設定檔')
+    run_parser.add_argument('--device', nargs='+', choices=['cpu', 'cuda'], help='要測量的裝置（預設 cpu 與可用的 cuda）')
+    run_parser.add_argument('--threads', nargs='+', type=int, help='執行緒數候選（預設 1, 2, 4, ... 至 CPU 數）')
+    run_parser.add_argument('--batch-sizes', nargs='+', type=int, help=f'batch 大小候選（預設 {DEFAULT_BATCH_SIZES}）')
+    run_parser.add_argument('--min-seconds', type=float, default=1.0, help='每個組合至少測量的秒數')
+    run_parser.add_argument('--quick', action='store_true', help=f'batch 大小只測 {QUICK_BATCH_SIZES}，每組 0.3 秒')
+    run_parser.add_argument('--output', help='設定檔路徑（預設同 AUTOTUNE_PROFILE）')
+
+    subparsers.add_parser('show', help='顯示本機設定檔')
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        path = profile_path()
+        profile = load_profile()
+        if profile is None:
+            print(f"⚠️ 沒有可用的調校設定檔: {path}")
+            return 1
+        print(f"📄 {path}（{profile['created_at']}）")
+        print(f"  執行緒: {profile['threads']}")
+        for device_name, sizes in profile['batch_sizes'].items():
+            print(f"  {device_name}: {sizes}")
+        return 0
+
+    import torch
+
+    devices = args.device or (['cpu', 'cuda'] if torch.cuda.is_available() else ['cpu'])
+    batch_sizes = args.batch_sizes or (QUICK_BATCH_SIZES if args.quick else DEFAULT_BATCH_SIZES)
+    min_seconds = 0.3 if args.quick else args.min_seconds
+    threads = args.threads or thread_candidates(os.cpu_count() or 1)
+    print(f"🎛️ 調校: 裝置 {devices}, 執行緒 {threads}, batch {batch_sizes}")
+
+    profile = run_autotune(devices, sorted(set(threads)), sorted(set(batch_sizes)), min_seconds)
+    output = Path(args.output) if args.output else profile_path()
+    if output is None:
+        print("❌ AUTOTUNE_PROFILE=off，請以 --output 指定設定檔路徑")
+        return 1
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    print(f"✅ 設定檔已寫入 {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
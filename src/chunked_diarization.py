@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+分段（視窗）說話人分離
+長音檔切成重疊的視窗逐一執行 diarization，再以 embedding 相似度把各視窗的本地說話人
+串接成整集一致的說話人，記憶體用量只與視窗長度有關
+
+流程：
+1. 視窗 i 涵蓋 [i × step, i × step + window]，step = window − overlap；
+   每個視窗只從磁碟讀取自己的音訊
+2. pipeline 回傳本地說話人與各自的 embedding
+3. 本地說話人與目前的全域說話人（以語音時長加權的 embedding 平均）做一對一指派
+   （匈牙利演算法），相似度達閾值者沿用全域標籤，其餘建立新說話人
+4. 每個視窗只保留核心區段（重疊區各取一半），相鄰視窗的同一說話人片段最後合併
+
+使用範例：
+  python src/chunked_diarization.py evaluate 音檔.wav --window 600 --overlap 30
+  python src/chunked_diarization.py evaluate 音檔.wav --json der.json
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import argparse
+import json
+import os
+import queue
+import resource
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import librosa
+import numpy as np
+import soundfile as sf
+import torch
+from pyannote.core import Annotation, Segment
+from scipy.optimize import linear_sum_assignment
+
+SAMPLE_RATE = 16000
+DEFAULT_WINDOW_SECONDS = 600.0
+DEFAULT_OVERLAP_SECONDS = 30.0
+DEFAULT_STITCH_THRESHOLD = 0.5
+
+
+def plan_windows(duration: float, window_seconds: float, overlap_seconds: float) -> List[Dict]:
+    """
+    規劃視窗與核心區段
+
+    Returns:
+        List[Dict]: {'index', 'start', 'end', 'core_start', 'core_end'}
+    """
+    if duration <= window_seconds:
+        return [{'index': 0, 'start': 0.0, 'end': duration, 'core_start': 0.0, 'core_end': duration}]
+
+    step = window_seconds - overlap_seconds
+    if step <= 0:
+        raise ValueError(f"重疊長度 ({overlap_seconds}s) 必須小於視窗長度 ({window_seconds}s)")
+
+    windows, start = [], 0.0
+    while True:
+        end = min(start + window_seconds, duration)
+        windows.append({'index': len(windows), 'start': start, 'end': end})
+        if end >= duration:
+            break
+        start += step
+
+    for window in windows:
+        first, last = window['index'] == 0, window['index'] == len(windows) - 1
+        window['core_start'] = 0.0 if first else window['start'] + overlap_seconds / 2
+        window['core_end'] = duration if last else window['end'] - overlap_seconds / 2
+    return windows
+
+
+def audio_duration(audio_file: str, waveform_16k: Optional[np.ndarray] = None) -> float:
+    if waveform_16k is not None:
+        return len(waveform_16k) / SAMPLE_RATE
+    return float(sf.info(audio_file).duration)
+
+
+def load_window(audio_file: str, start: float, end: float,
+                waveform_16k: Optional[np.ndarray] = None) -> np.ndarray:
+    """讀取單一視窗的 16kHz 單聲道音訊（只讀取該區段，不載入整個檔案）"""
+    if waveform_16k is not None:
+        return waveform_16k[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+
+    info = sf.info(audio_file)
+    audio, sr = sf.read(audio_file, start=int(start * info.samplerate), stop=int(end * info.samplerate),
+                        dtype='float32', always_2d=True)
+    audio = audio.mean(axis=1)
+    if sr != SAMPLE_RATE:
+        audio = librosa.resample(audio, orig_sr=sr, target_sr=SAMPLE_RATE)
+    return audio.astype(np.float32)
+
+
+def _window_embeddings(diarization: Annotation, audio: np.ndarray, embedding_model, device) -> np.ndarray:
+    """pipeline 不支援 return_embeddings 時，以 embedding 模型對每位本地說話人的串接音訊提取"""
+    try:
+        from src.speaker_level_segmentation import extract_embedding_from_audio
+    except ImportError:
+        from speaker_level_segmentation import extract_embedding_from_audio
+
+    embeddings = []
+    for label in diarization.labels():
+        pieces = [audio[int(turn.start * SAMPLE_RATE):int(turn.end * SAMPLE_RATE)]
+                  for turn in diarization.label_timeline(label)]
+        embedding = extract_embedding_from_audio(np.concatenate(pieces), embedding_model, device) if pieces else None
+        embeddings.append(embedding)
+    dim = next((len(embedding) for embedding in embeddings if embedding is not None), 1)
+    return np.stack([embedding if embedding is not None else np.full(dim, np.nan, dtype=np.float32)
+                     for embedding in embeddings])
+
+
+def diarize_window(pipeline, audio: np.ndarray, embedding_model=None, device=None):
+    """
+    對單一視窗執行 diarization
+
+    Returns:
+        (Annotation, np.ndarray): 視窗內相對時間的結果，與依 labels() 順序排列的 embedding
+    """
+    audio_input = {'waveform': torch.from_numpy(audio).unsqueeze(0), 'sample_rate': SAMPLE_RATE}
+    try:
+        diarization, embeddings = pipeline(audio_input, return_embeddings=True)
+        return diarization, np.asarray(embeddings, dtype=np.float32)
+    except TypeError:
+        if embedding_model is None:
+            raise
+        diarization = pipeline(audio_input)
+        return diarization, _window_embeddings(diarization, audio, embedding_model, device)
+
+
+class SpeakerStitcher:
+    """跨視窗的全域說話人：以語音時長加權平均 embedding，新視窗的本地說話人一對一指派"""
+
+    def __init__(self, threshold: float = DEFAULT_STITCH_THRESHOLD):
+        self.threshold = threshold
+        self.labels: List[str] = []
+        self.sums: List[np.ndarray] = []
+        self.weights: List[float] = []
+
+    def _new_speaker(self) -> str:
+        label = f"SPEAKER_{len(self.labels):02d}"
+        self.labels.append(label)
+        self.sums.append(None)
+        self.weights.append(0.0)
+        return label
+
+    def _centroids(self, known: List[int]) -> np.ndarray:
+        return np.stack([self.sums[j] / self.weights[j] for j in known])
+
+    def assign(self, local_labels: List[str], embeddings: np.ndarray, durations: List[float]) -> Dict[str, str]:
+        """
+        指派本地說話人到全域說話人
+
+        Returns:
+            Dict[str, str]: 本地標籤 -> 全域標籤
+        """
+        mapping: Dict[str, str] = {}
+        valid = [i for i in range(len(local_labels)) if not np.isnan(embeddings[i]).any()]
+
+        # 只有累計過有效 embedding 的全域說話人才有中心（之前的視窗可能都沒有 embedding）
+        known = [j for j, weight in enumerate(self.weights) if weight > 0]
+        if known and valid:
+            local = embeddings[valid]
+            local = local / np.maximum(np.linalg.norm(local, axis=1, keepdims=True), 1e-8)
+            reference = self._centroids(known)
+            reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-8)
+            similarity = local @ reference.T
+            rows, cols = linear_sum_assignment(-similarity)
+            for row, col in zip(rows, cols):
+                if similarity[row, col] >= self.threshold:
+                    mapping[local_labels[valid[row]]] = self.labels[known[col]]
+
+        for i, label in enumerate(local_labels):
+            if label not in mapping:
+                mapping[label] = self._new_speaker()
+            if i in valid:
+                index = self.labels.index(mapping[label])
+                weighted = embeddings[i].astype(np.float64) * durations[i]
+                self.sums[index] = weighted if self.sums[index] is None else self.sums[index] + weighted
+                self.weights[index] += durations[i]
+        return mapping
+
+
+def iter_chunked_diarization(pipeline, audio_file: str, window_seconds: float = DEFAULT_WINDOW_SECONDS,
+                             overlap_seconds: float = DEFAULT_OVERLAP_SECONDS,
+                             stitch_threshold: float = DEFAULT_STITCH_THRESHOLD,
+                             waveform_16k: Optional[np.ndarray] = None,
+                             embedding_model=None, device=None,
+                             include_audio: bool = False) -> Iterator[Dict]:
+    """
+    逐視窗執行 diarization，每處理完一個視窗即產出該視窗核心區段的結果
+
+    產出的片段已使用全域標籤，之後的視窗不會再改變它們
+
+    Yields:
+        Dict: {'index', 'count', 'start', 'end', 'core_start', 'core_end',
+               'annotation': 核心區段內的 Annotation（整集時間、全域標籤），
+               'audio': 視窗的 16kHz 音訊（include_audio=True 時，從 start 起算）}
+    """
+    duration = audio_duration(audio_file, waveform_16k)
+    windows = plan_windows(duration, window_seconds, overlap_seconds)
+    stitcher = SpeakerStitcher(stitch_threshold)
+
+    for window in windows:
+        audio = load_window(audio_file, window['start'], window['end'], waveform_16k)
+        local, embeddings = diarize_window(pipeline, audio, embedding_model, device)
+
+        local_labels = local.labels()
+        durations = [local.label_duration(label) for label in local_labels]
+        mapping = stitcher.assign(local_labels, embeddings, durations)
+
+        core = Annotation(uri=os.path.basename(audio_file))
+        offset = window['start']
+        for turn, track, label in local.itertracks(yield_label=True):
+            start = max(turn.start + offset, window['core_start'])
+            end = min(turn.end + offset, window['core_end'])
+            if end > start:
+                core[Segment(start, end), track] = mapping[label]
+
+        print(f"  🪟 視窗 {window['index'] + 1}/{len(windows)} "
+              f"[{window['start']:.0f}s-{window['end']:.0f}s]: {len(local_labels)} 個本地說話人 → "
+              f"{sorted(set(mapping.values()))}")
+        result = {**window, 'count': len(windows), 'annotation': core}
+        if include_audio:
+            result['audio'] = audio
+        del audio
+        yield result
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+def prefetch_windows(windows: Iterator[Dict], max_pending: int = 2) -> Iterator[Dict]:
+    """
+    在背景執行緒推進視窗迭代器（diarization），呼叫端同時處理已完成的視窗
+
+    最多 max_pending 個已完成的視窗等待處理，記憶體仍受視窗長度限制；背景的例外在呼叫端重新拋出
+    """
+    done = object()
+    pending: queue.Queue = queue.Queue(maxsize=max(1, max_pending))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        """放入佇列；呼叫端已停止時回傳 False"""
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for window in windows:
+                if not put(window):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, name="diarization-windows", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join(timeout=1.0)
+
+
+def merge_annotations(pieces: List[Annotation], uri: Optional[str] = None) -> Annotation:
+    """串接各視窗結果，並合併跨視窗邊界的相鄰同說話人片段"""
+    merged = Annotation(uri=uri)
+    for piece in pieces:
+        for turn, track, label in piece.itertracks(yield_label=True):
+            merged[turn, f"{track}_{len(merged)}"] = label
+    return merged.support()
+
+
+def diarize_chunked(pipeline, audio_file: str, window_seconds: float = DEFAULT_WINDOW_SECONDS,
+                    overlap_seconds: float = DEFAULT_OVERLAP_SECONDS,
+                    stitch_threshold: float = DEFAULT_STITCH_THRESHOLD,
+                    waveform_16k: Optional[np.ndarray] = None,
+                    embedding_model=None, device=None) -> Annotation:
+    """分段執行 diarization 並回傳整集的 Annotation"""
+    pieces = [window['annotation'] for window in iter_chunked_diarization(
+        pipeline, audio_file, window_seconds, overlap_seconds, stitch_threshold,
+        waveform_16k, embedding_model, device)]
+    return merge_annotations(pieces, uri=os.path.basename(audio_file))
+
+
+# ---------------------------------------------------------------------------
+# 評估
+# ---------------------------------------------------------------------------
+
+def _peak_rss_mb() -> float:
+    """行程目前為止的最大常駐記憶體（MB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def evaluate_chunked(pipeline, audio_file: str, window_seconds: float, overlap_seconds: float,
+                     stitch_threshold: float, collar: float = 0.0) -> Dict:
+    """
+    以整檔 diarization 為參考計算分段模式的 DER
+
+    先執行分段模式再執行整檔模式，兩者的最大常駐記憶體分別記錄（整檔模式的值包含分段模式的峰值）
+    """
+    from pyannote.metrics.diarization import DiarizationErrorRate
+
+    def gpu_peak():
+        if not torch.cuda.is_available():
+            return None
+        peak = torch.cuda.max_memory_allocated() / 1024 ** 2
+        torch.cuda.reset_peak_memory_stats()
+        return round(peak, 1)
+
+    gpu_peak()
+    start = time.perf_counter()
+    chunked = diarize_chunked(pipeline, audio_file, window_seconds, overlap_seconds, stitch_threshold)
+    chunked_seconds = time.perf_counter() - start
+    chunked_rss, chunked_gpu = _peak_rss_mb(), gpu_peak()
+
+    start = time.perf_counter()
+    full = pipeline(audio_file)
+    full_seconds = time.perf_counter() - start
+    full_rss, full_gpu = _peak_rss_mb(), gpu_peak()
+
+    metric = DiarizationErrorRate(collar=collar, skip_overlap=False)
+    details = metric(full, chunked, detailed=True)
+    total = details['total'] or 1.0
+    return {
+        'audio_file': audio_file,
+        'duration': audio_duration(audio_file),
+        'window_seconds': window_seconds,
+        'overlap_seconds': overlap_seconds,
+        'stitch_threshold': stitch_threshold,
+        'der': float(details['diarization error rate']),
+        'missed': details['missed detection'] / total,
+        'false_alarm': details['false alarm'] / total,
+        'confusion': details['confusion'] / total,
+        'speakers': {'chunked': len(chunked.labels()), 'full': len(full.labels())},
+        'seconds': {'chunked': round(chunked_seconds, 2), 'full': round(full_seconds, 2)},
+        'peak_rss_mb': {'chunked': round(chunked_rss, 1), 'full': round(full_rss, 1)},
+        'peak_gpu_mb': {'chunked': chunked_gpu, 'full': full_gpu}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分段 diarization 評估")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    evaluate_parser = subparsers.add_parser('evaluate', help='與整檔 diarization 比較（DER）')
+    evaluate_parser.add_argument('audio_file', help='音檔路徑')
+    evaluate_parser.add_argument('--window', type=float,
+                                 default=float(os.environ.get('DIARIZATION_WINDOW_SECONDS', '0')) or DEFAULT_WINDOW_SECONDS,
+                                 help='視窗長度（秒）')
+    evaluate_parser.add_argument('--overlap', type=float,
+                                 default=float(os.environ.get('DIARIZATION_WINDOW_OVERLAP', DEFAULT_OVERLAP_SECONDS)),
+                                 help='相鄰視窗重疊長度（秒）')
+    evaluate_parser.add_argument('--stitch-threshold', type=float,
+                                 default=float(os.environ.get('DIARIZATION_STITCH_THRESHOLD', DEFAULT_STITCH_THRESHOLD)),
+                                 help='跨視窗視為同一說話人的 embedding 相似度閾值')
+    evaluate_parser.add_argument('--collar', type=float, default=0.0, help='DER 計算時忽略邊界的秒數')
+    evaluate_parser.add_argument('--json', help='將結果寫入 JSON 檔')
+    args = parser.parse_args()
+
+    try:
+        from src.offline_pipeline import load_offline_pipeline
+    except ImportError:
+        from offline_pipeline import load_offline_pipeline
+
+    pipeline, device_type = load_offline_pipeline()
+    print(f"🎮 使用設備: {device_type.upper()}")
+    result = evaluate_chunked(pipeline, args.audio_file, args.window, args.overlap, args.stitch_threshold, args.collar)
+
+    print(f"📊 {os.path.basename(args.audio_file)} ({result['duration'] / 60:.1f} 分鐘)，"
+          f"視窗 {args.window:.0f}s / 重疊 {args.overlap:.0f}s")
+    print(f"  DER: {result['der']:.2%}（漏偵測 {result['missed']:.2%}，誤報 {result['false_alarm']:.2%}，"
+          f"混淆 {result['confusion']:.2%}）")
+    print(f"  說話人數: 分段 {result['speakers']['chunked']} / 整檔 {result['speakers']['full']}")
+    print(f"  時間: 分段 {result['seconds']['chunked']}s / 整檔 {result['seconds']['full']}s")
+    print(f"  最大常駐記憶體: 分段 {result['peak_rss_mb']['chunked']}MB / 整檔 {result['peak_rss_mb']['full']}MB")
+    if result['peak_gpu_mb']['full'] is not None:
+        print(f"  GPU 記憶體峰值: 分段 {result['peak_gpu_mb']['chunked']}MB / 整檔 {result['peak_gpu_mb']['full']}MB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
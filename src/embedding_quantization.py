@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+說話人 embedding 模型 int8 量化
+EMBEDDING_QUANTIZATION=dynamic|static 時 EmbeddingInference 在 CPU 上改用量化模型，
+並提供評估工具比較量化與浮點模型的說話人匹配結果
+
+量化方式：
+- dynamic：torch.ao 動態量化（只量化 Linear 層，不需校準資料）。ResNet34 只有最後一層
+  embedding Linear，計算量幾乎都在卷積層，因此實際上沒有加速，只適合用來驗證流程
+- static：FX 靜態量化 ResNet 卷積層（Conv/BN/ReLU 融合後以 int8 執行），
+  需先以 calibrate 指令用實際語音校準並存檔；fbank 前處理、統計 pooling 與 embedding 層
+  （FLOAT_MODULES）以 None qconfig 排除，維持浮點
+
+使用範例：
+  python src/embedding_quantization.py build-set data/output              # 建立評估集（浮點 embedding）
+  python src/embedding_quantization.py calibrate                          # 以評估集音訊校準靜態量化模型
+  python src/embedding_quantization.py evaluate --mode static             # 比較匹配結果與速度
+  python src/embedding_quantization.py evaluate --mode dynamic --min-agreement 0.98
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+
+try:
+    from src.export_inference_models import default_export_dir, load_eager_model
+    from src.speaker_database import SpeakerDatabase, cosine_similarities
+    from src.split_dataset import audio_duration, get_all_speakers
+except ImportError:
+    from export_inference_models import default_export_dir, load_eager_model
+    from speaker_database import SpeakerDatabase, cosine_similarities
+    from split_dataset import audio_duration, get_all_speakers
+
+QUANTIZATION_MODES = ('none', 'dynamic', 'static')
+STATIC_MODEL_FILENAME = "embedding-int8-static.torchscript.pt"
+DEFAULT_EVAL_SET = "data/embedding_eval_set.json"
+SAMPLE_RATE = 16000
+# 靜態量化時維持浮點的 ResNet 子模組：統計 pooling（mean/std 對量化誤差敏感，且內部使用 einops，
+# FX 無法追蹤，因此同時設為不追蹤的模組）與 embedding 層
+FLOAT_MODULES = ('pool', 'seg_1', 'seg_bn_1', 'seg_2')
+DYNAMIC_WARNING = ("⚠️ 動態量化只量化 Linear 層（ResNet34 只有最後一層 embedding Linear），幾乎不會加速；"
+                   "請執行 embedding_quantization.py calibrate 後使用 EMBEDDING_QUANTIZATION=static")
+
+
+def get_quantization_mode() -> str:
+    """EMBEDDING_QUANTIZATION 設定（未知值視為 none）"""
+    mode = os.environ.get('EMBEDDING_QUANTIZATION', 'none').strip().lower() or 'none'
+    if mode not in QUANTIZATION_MODES:
+        print(f"⚠️ 未知的 EMBEDDING_QUANTIZATION={mode}，使用浮點模型")
+        return 'none'
+    return mode
+
+
+def _select_engine():
+    """選擇可用的量化後端（x86 優先 fbgemm，ARM 使用 qnnpack）"""
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('fbgemm', 'x86', 'qnnpack'):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError(f"沒有可用的量化後端: {engines}")
+
+
+def quantize_dynamic(model):
+    """動態 int8 量化（回傳副本，原模型不變）"""
+    _select_engine()
+    quantized = copy.deepcopy(model).to('cpu').eval()
+    return torch.ao.quantization.quantize_dynamic(quantized, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class _Backbone(torch.nn.Module):
+    """只接受 fbank 特徵的 ResNet（weights 固定為 None，FX 可完整追蹤）"""
+
+    def __init__(self, resnet):
+        super().__init__()
+        self.resnet = resnet
+
+    def forward(self, features):
+        return self.resnet(features)
+
+
+class QuantizedResNet(torch.nn.Module):
+    """量化後的 ResNet 圖，介面與原本的 resnet(features, weights=None) 相同"""
+
+    def __init__(self, graph):
+        super().__init__()
+        self.graph = graph
+
+    def forward(self, features, weights=None):
+        if weights is not None:
+            raise ValueError("靜態量化模型不支援 weights（請使用浮點模型）")
+        return self.graph(features)
+
+
+def calibrate_static(model, calibration_waveforms: List[np.ndarray]):
+    """
+    FX 靜態 int8 量化 ResNet 卷積層（FLOAT_MODULES 維持浮點）
+
+    Args:
+        model: pyannote WeSpeakerResNet34（需有 compute_fbank 與 resnet）
+        calibration_waveforms: 16kHz 單聲道語音，用來收集各層的數值範圍
+
+    Returns:
+        量化後的 ResNet 圖（torch.fx GraphModule，以 save_static_model 存檔）
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.fx.custom_config import PrepareCustomConfig
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = _select_engine()
+    model = model.to('cpu').eval()
+
+    def features(waveform: np.ndarray):
+        tensor = torch.from_numpy(np.asarray(waveform, dtype=np.float32)).reshape(1, 1, -1)
+        return model.compute_fbank(tensor)
+
+    with torch.no_grad():
+        backbone = _Backbone(copy.deepcopy(model.resnet))
+        qconfig_mapping = get_default_qconfig_mapping(engine)
+        custom_config = PrepareCustomConfig()
+        for name in FLOAT_MODULES:
+            if hasattr(backbone.resnet, name):
+                qconfig_mapping.set_module_name(f"resnet.{name}", None)
+        if hasattr(backbone.resnet, 'pool'):
+            custom_config.set_non_traceable_module_names(['resnet.pool'])
+        prepared = prepare_fx(backbone, qconfig_mapping,
+                              example_inputs=(features(calibration_waveforms[0]),),
+                              prepare_custom_config=custom_config)
+        for waveform in calibration_waveforms:
+            prepared(features(waveform))
+        return convert_fx(prepared)
+
+
+def save_static_model(graph, example_features, path: Optional[str] = None) -> str:
+    """
+    以 TorchScript 保存量化 ResNet 圖（與 export_inference_models 相同的 trace 方式）
+
+    量化後的 FX GraphModule 無法以 torch.save / torch.load 還原（載入時重新追蹤會失敗），
+    trace 後的圖則可直接以 torch.jit.load 載入
+    """
+    path = path or static_model_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with torch.no_grad():
+        traced = torch.jit.trace(graph, (example_features,), check_trace=False)
+    torch.jit.save(traced, path)
+    return path
+
+
+def with_quantized_backbone(model, graph):
+    """回傳以量化 ResNet 圖取代主幹的模型副本（fbank 前處理與原模型相同）"""
+    quantized = copy.deepcopy(model).to('cpu').eval()
+    quantized.resnet = QuantizedResNet(graph)
+    return quantized
+
+
+def static_model_path() -> str:
+    return str(default_export_dir() / STATIC_MODEL_FILENAME)
+
+
+def load_static_model(model):
+    """以 calibrate 產生的量化 ResNet 圖建立靜態量化模型（不存在時回傳 None）"""
+    path = static_model_path()
+    if not os.path.exists(path):
+        return None
+    _select_engine()
+    graph = torch.jit.load(path, map_location='cpu')
+    return with_quantized_backbone(model, graph)
+
+
+def apply_embedding_quantization(model, device, mode: Optional[str] = None):
+    """
+    依 EMBEDDING_QUANTIZATION 回傳量化後的 embedding 模型
+
+    Args:
+        model: pyannote Model 或 pipeline 的 embedding 包裝（使用其 model_，pipeline 本身不受影響）
+        device: 運算裝置（量化模型只在 CPU 上使用）
+        mode: None = EMBEDDING_QUANTIZATION
+
+    Returns:
+        量化模型；不適用或失敗時回傳原本的 model
+    """
+    mode = mode or get_quantization_mode()
+    if mode == 'none':
+        return model
+    if getattr(device, 'type', str(device)) != 'cpu':
+        print(f"⚠️ int8 量化只適用於 CPU，{device} 上使用浮點 embedding 模型")
+        return model
+
+    target = getattr(model, 'model_', model)
+    try:
+        if mode == 'static':
+            quantized = load_static_model(target)
+            if quantized is not None:
+                print(f"⚡ Embedding 使用靜態 int8 量化模型: {static_model_path()}")
+                return quantized
+            print(f"⚠️ 找不到靜態量化模型 {static_model_path()}（請執行 embedding_quantization.py calibrate），改用動態量化")
+        quantized = quantize_dynamic(target)
+        print("⚡ Embedding 使用動態 int8 量化")
+        print(DYNAMIC_WARNING)
+        return quantized
+    except Exception as e:
+        print(f"⚠️ 量化失敗，使用浮點 embedding 模型: {e}")
+        return model
+
+
+# ---------------------------------------------------------------------------
+# 評估集與評估
+# ---------------------------------------------------------------------------
+
+def build_eval_set(processed_dir: str, clip_seconds: float = 30.0, max_clips: int = 200) -> List[Dict]:
+    """
+    從 LibriTTS 輸出目錄建立評估片段：每個說話人每集串接最多 clip_seconds 秒的語句，
+    與 speaker_level_segmentation 以整段說話人音訊提取 embedding 的方式一致
+    """
+    clips = []
+    for speaker in get_all_speakers(processed_dir):
+        speaker_dir = os.path.join(processed_dir, speaker)
+        for episode in sorted(os.listdir(speaker_dir)):
+            episode_dir = os.path.join(speaker_dir, episode)
+            if not os.path.isdir(episode_dir):
+                continue
+            paths, total = [], 0.0
+            for filename in sorted(os.listdir(episode_dir)):
+                if not filename.endswith('.wav') or total >= clip_seconds:
+                    continue
+                path = os.path.join(episode_dir, filename)
+                paths.append(os.path.relpath(path, processed_dir))
+                total += audio_duration(path)
+            if paths:
+                clips.append({'speaker': speaker, 'episode': episode, 'paths': paths, 'duration': round(total, 2)})
+            if len(clips) >= max_clips:
+                return clips
+    return clips
+
+
+def load_clip_audio(processed_dir: str, clip: Dict, clip_seconds: float) -> np.ndarray:
+    import librosa
+
+    audio = np.concatenate([librosa.load(os.path.join(processed_dir, path), sr=SAMPLE_RATE)[0]
+                            for path in clip['paths']])
+    return audio[:int(clip_seconds * SAMPLE_RATE)].astype(np.float32)
+
+
+def embed(model, audio: np.ndarray) -> np.ndarray:
+    """與 extract_embedding_from_audio 相同的呼叫方式"""
+    with torch.no_grad():
+        output = model(torch.from_numpy(audio).reshape(1, 1, -1))
+    if isinstance(output, torch.Tensor):
+        output = output.cpu().numpy()
+    return np.asarray(output, dtype=np.float32).reshape(-1)
+
+
+def save_eval_set(path: str, processed_dir: str, clip_seconds: float, clips: List[Dict]):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'processed_dir': processed_dir, 'clip_seconds': clip_seconds, 'clips': clips},
+                  f, ensure_ascii=False)
+
+
+def load_eval_set(path: str) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _reference_embeddings(eval_set: Dict, db_path: Optional[str]):
+    """
+    比對對象：說話人資料庫（有資料時），否則為評估集內各說話人的浮點 embedding 平均
+    """
+    if db_path and os.path.exists(db_path):
+        speaker_ids, embeddings = SpeakerDatabase(db_path).get_speaker_embeddings()
+        if speaker_ids:
+            return [str(speaker_id) for speaker_id in speaker_ids], embeddings, 'database'
+
+    by_speaker: Dict[str, List[np.ndarray]] = {}
+    for clip in eval_set['clips']:
+        by_speaker.setdefault(clip['speaker'], []).append(np.asarray(clip['float_embedding'], dtype=np.float32))
+    labels = sorted(by_speaker)
+    centroids = np.stack([np.mean(by_speaker[label], axis=0) for label in labels])
+    return labels, centroids, 'eval_set'
+
+
+def _decide(similarities: np.ndarray, labels: List[str], threshold: float):
+    best = int(np.argmax(similarities))
+    score = float(similarities[best])
+    return (labels[best] if score > threshold else None), score
+
+
+def evaluate(eval_set: Dict, mode: str, threshold: float, db_path: Optional[str] = None) -> Dict:
+    """
+    以量化模型重新計算評估集的 embedding，與浮點 embedding 比較匹配決策
+
+    Returns:
+        Dict: 決策一致率、embedding 餘弦相似度、最高相似度差異與速度
+    """
+    float_model = load_eager_model('embedding')
+    if mode == 'static':
+        quantized_model = load_static_model(float_model)
+        if quantized_model is None:
+            raise FileNotFoundError(f"找不到靜態量化模型: {static_model_path()}（請先執行 calibrate）")
+    else:
+        print(DYNAMIC_WARNING)
+        quantized_model = quantize_dynamic(float_model)
+
+    labels, references, reference_source = _reference_embeddings(eval_set, db_path)
+    processed_dir = eval_set['processed_dir']
+    float_seconds = quantized_seconds = 0.0
+    agreements, cosines, score_deltas, disagreements = [], [], [], []
+
+    for clip in eval_set['clips']:
+        audio = load_clip_audio(processed_dir, clip, eval_set['clip_seconds'])
+        start = time.perf_counter()
+        float_embedding = embed(float_model, audio)
+        float_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        quantized_embedding = embed(quantized_model, audio)
+        quantized_seconds += time.perf_counter() - start
+
+        float_decision, float_score = _decide(cosine_similarities(float_embedding, references), labels, threshold)
+        quantized_decision, quantized_score = _decide(cosine_similarities(quantized_embedding, references),
+                                                      labels, threshold)
+        agreements.append(float_decision == quantized_decision)
+        cosines.append(float(cosine_similarities(quantized_embedding, float_embedding[None, :])[0]))
+        score_deltas.append(abs(quantized_score - float_score))
+        if float_decision != quantized_decision:
+            disagreements.append({'speaker': clip['speaker'], 'episode': clip['episode'],
+                                  'float': float_decision, 'quantized': quantized_decision,
+                                  'float_score': round(float_score, 4), 'quantized_score': round(quantized_score, 4)})
+
+    return {
+        'mode': mode,
+        'clips': len(agreements),
+        'reference': reference_source,
+        'threshold': threshold,
+        'decision_agreement': float(np.mean(agreements)) if agreements else None,
+        'mean_cosine': float(np.mean(cosines)) if cosines else None,
+        'min_cosine': float(np.min(cosines)) if cosines else None,
+        'max_score_delta': float(np.max(score_deltas)) if score_deltas else None,
+        'float_seconds': round(float_seconds, 3),
+        'quantized_seconds': round(quantized_seconds, 3),
+        'speedup': round(float_seconds / quantized_seconds, 2) if quantized_seconds else None,
+        'disagreements': disagreements
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding 模型 int8 量化與評估")
+    parser.add_argument('--eval-set', default=DEFAULT_EVAL_SET, help='評估集 JSON 路徑')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build-set', help='建立評估集並計算浮點 embedding')
+    build_parser.add_argument('processed_dir', nargs='?',
+                              default=os.environ.get('DEFAULT_PROCESSED_DIR', 'data/output'),
+                              help='LibriTTS 輸出目錄')
+    build_parser.add_argument('--clip-seconds', type=float, default=30.0, help='每個說話人每集的音訊長度上限')
+    build_parser.add_argument('--max-clips', type=int, default=200, help='片段數上限')
+
+    calibrate_parser = subparsers.add_parser('calibrate', help='以評估集音訊建立靜態量化模型')
+    calibrate_parser.add_argument('--clips', type=int, default=32, help='校準使用的片段數')
+
+    evaluate_parser = subparsers.add_parser('evaluate', help='比較量化與浮點模型的匹配決策')
+    evaluate_parser.add_argument('--mode', choices=['dynamic', 'static'], default='dynamic', help='量化方式')
+    evaluate_parser.add_argument('--threshold', type=float,
+                                 default=float(os.environ.get('SIMILARITY_THRESHOLD', '0.40')), help='匹配閾值')
+    evaluate_parser.add_argument('--database', default=os.environ.get('SPEAKERS_DATABASE_PATH', 'data/speakers.db'),
+                                 help='比對用的說話人資料庫（空資料庫時改用評估集的說話人平均）')
+    evaluate_parser.add_argument('--min-agreement', type=float, help='決策一致率低於此值時結束碼為 1')
+    evaluate_parser.add_argument('--json', help='將結果寫入 JSON 檔')
+    args = parser.parse_args()
+
+    if args.command == 'build-set':
+        clips = build_eval_set(args.processed_dir, args.clip_seconds, args.max_clips)
+        if not clips:
+            print(f"❌ {args.processed_dir} 中沒有語句")
+            return 1
+        float_model = load_eager_model('embedding')
+        for index, clip in enumerate(clips, 1):
+            audio = load_clip_audio(args.processed_dir, clip, args.clip_seconds)
+            clip['float_embedding'] = embed(float_model, audio).round(6).tolist()
+            print(f"\r🧬 浮點 embedding {index}/{len(clips)}", end='', flush=True)
+        print()
+        save_eval_set(args.eval_set, args.processed_dir, args.clip_seconds, clips)
+        print(f"✅ 評估集已寫入 {args.eval_set}（{len(clips)} 個片段，"
+              f"{len({clip['speaker'] for clip in clips})} 位說話人）")
+        return 0
+
+    eval_set = load_eval_set(args.eval_set)
+
+    if args.command == 'calibrate':
+        clips = eval_set['clips'][:max(1, args.clips)]
+        waveforms = [load_clip_audio(eval_set['processed_dir'], clip, eval_set['clip_seconds']) for clip in clips]
+        model = load_eager_model('embedding')
+        graph = calibrate_static(model, waveforms)
+        with torch.no_grad():
+            example = model.compute_fbank(torch.from_numpy(waveforms[0]).reshape(1, 1, -1))
+        save_static_model(graph, example)
+        print(f"✅ 靜態量化模型已寫入 {static_model_path()}（校準片段 {len(waveforms)} 個）")
+        print("💡 執行 evaluate --mode static 確認匹配結果後，設定 EMBEDDING_QUANTIZATION=static 啟用")
+        return 0
+
+    result = evaluate(eval_set, args.mode, args.threshold, args.database)
+    print(f"📊 {result['mode']} 量化評估（{result['clips']} 個片段，比對對象: {result['reference']}）")
+    print(f"  決策一致率: {result['decision_agreement']:.2%}")
+    print(f"  embedding 餘弦相似度: 平均 {result['mean_cosine']:.4f}, 最低 {result['min_cosine']:.4f}")
+    print(f"  最高相似度最大差異: {result['max_score_delta']:.4f}")
+    print(f"  時間: 浮點 {result['float_seconds']:.2f}s → 量化 {result['quantized_seconds']:.2f}s (×{result['speedup']})")
+    for item in result['disagreements'][:10]:
+        print(f"  ⚠️ 說話人 {item['speaker']} 第 {item['episode']} 集: {item['float']} ({item['float_score']}) "
+              f"→ {item['quantized']} ({item['quantized_score']})")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.min_agreement is not None and result['decision_agreement'] < args.min_agreement:
+        print(f"❌ 決策一致率低於 {args.min_agreement:.2%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+常駐集數處理程序
+載入一次 pyannote pipeline 與 embedding 模型，從 spool 目錄接收集數工作，省去每集重新啟動的時間
+
+Spool 目錄結構：
+  incoming/  待處理工作（客戶端以改名方式放入，不會讀到寫到一半的檔案）
+  running/   處理中工作（處理程序以改名方式認領）
+  done/      成功結果    failed/  失敗結果
+  logs/      每個工作的輸出，客戶端即時顯示
+  worker.pid 處理程序 PID，執行期間以 flock 鎖住（程序結束或當機時自動釋放）
+
+使用範例：
+  python episode_worker.py serve                    # 啟動常駐處理程序
+  python episode_worker.py submit -- audio.wav subtitle.txt --episode_num 3 --output_dir data/output
+  python episode_worker.py status
+  python episode_worker.py stop                     # 完成目前工作後結束（修改模型設定後需重新啟動）
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import signal
+import sys
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_SPOOL_DIR = os.environ.get('EPISODE_WORKER_SPOOL', 'data/.episode_worker')
+SPOOL_SUBDIRS = ("incoming", "running", "done", "failed", "logs")
+PID_FILENAME = "worker.pid"
+STOP_FILENAME = "stop"
+# 工作最多被認領的次數：處理程序在同一工作中斷（例如當機）達此次數後移入 failed/，不再重新排入
+MAX_ATTEMPTS = int(os.environ.get('EPISODE_WORKER_MAX_ATTEMPTS', '3'))
+
+# 每個工作帶入客戶端當下的設定（處理程序啟動後 .env 可能已修改）：build_arg_parser() 讀取的所有環境變數
+JOB_ENV_KEYS = ('SIMILARITY_THRESHOLD', 'VOICE_ACTIVITY_THRESHOLD', 'MIN_SPEAKER_DURATION',
+                'DIARIZATION_WINDOW_SECONDS', 'DIARIZATION_WINDOW_OVERLAP', 'DIARIZATION_STITCH_THRESHOLD',
+                'DIARIZATION_STREAMING', 'DEFAULT_INPUT_DIR')
+
+
+def _spool_paths(spool_dir: str) -> Dict[str, Path]:
+    root = Path(spool_dir)
+    paths = {name: root / name for name in SPOOL_SUBDIRS}
+    for path in paths.values():
+        path.mkdir(parents=True, exist_ok=True)
+    paths['root'] = root
+    return paths
+
+
+def _write_json_atomic(path: Path, data: Dict):
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+
+def _acquire_worker_lock(spool_root: Path, retries: int = 5) -> Optional[int]:
+    """
+    鎖住 PID 檔並寫入目前 PID（檢查與認領為同一個 flock 操作，兩個處理程序不會同時通過）
+
+    Returns:
+        鎖住的檔案描述子（已有處理程序執行時回傳 None）
+    """
+    fd = os.open(spool_root / PID_FILENAME, os.O_RDWR | os.O_CREAT, 0o644)
+    for attempt in range(retries):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            # worker_pid() 查詢時會短暫持有共享鎖，稍後重試
+            if attempt == retries - 1:
+                os.close(fd)
+                return None
+            time.sleep(0.1)
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    return fd
+
+
+def _release_worker_lock(fd: int):
+    """清空 PID 並釋放鎖（不刪除檔案，避免其他程序鎖住已刪除的檔案）"""
+    os.ftruncate(fd, 0)
+    os.close(fd)
+
+
+def worker_pid(spool_dir: str) -> Optional[int]:
+    """執行中的處理程序 PID（未執行時回傳 None）；以 PID 檔是否被鎖住判斷，不受 PID 重複使用影響"""
+    try:
+        fd = os.open(Path(spool_dir) / PID_FILENAME, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            content = os.read(fd, 32).decode(errors='replace').strip()
+            return int(content) if content.isdigit() else None
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return None
+    finally:
+        os.close(fd)
+
+
+class EpisodeWorker:
+    """常駐集數處理程序
+
+    設計原則：
+    - 模型只載入一次：pipeline、embedding 模型與說話人資料庫在工作之間共用
+    - 依序處理：同一時間只處理一集，與說話人資料庫的全域編號一致
+    - 可恢復：中斷時 running/ 內的工作在下次啟動時放回 incoming/，
+      同一工作中斷達 MAX_ATTEMPTS 次（可能是工作本身讓處理程序當機）則移入 failed/
+    """
+
+    def __init__(self, spool_dir: str = DEFAULT_SPOOL_DIR, device: Optional[str] = None,
+                 poll_interval: float = 0.5, idle_timeout: float = 0):
+        """
+        初始化處理程序
+
+        Args:
+            spool_dir: spool 目錄
+            device: 運算裝置（None = 有 GPU 時使用 cuda）
+            poll_interval: 檢查新工作的間隔（秒）
+            idle_timeout: 閒置多久後自動結束（秒，0 = 不結束）
+        """
+        self.paths = _spool_paths(spool_dir)
+        self.device_name = device
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self._stopping = False
+
+    def _recover_interrupted(self):
+        for job_path in sorted(self.paths['running'].glob("*.json")):
+            try:
+                with open(job_path, 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except ValueError:
+                job = {'id': job_path.stem}
+            attempts = job.get('attempts', 1)
+            if attempts >= MAX_ATTEMPTS:
+                error = f"處理程序在此工作中斷 {attempts} 次，不再重新排入"
+                _write_json_atomic(self.paths['failed'] / job_path.name, {
+                    'id': job.get('id', job_path.stem),
+                    'exit_code': 1,
+                    'error': error,
+                    'attempts': attempts,
+                    'finished_at': time.time()
+                })
+                job_path.unlink()
+                print(f"❌ {job_path.stem}: {error}")
+                continue
+            os.replace(job_path, self.paths['incoming'] / job_path.name)
+            print(f"🔄 重新排入中斷的工作: {job_path.stem} (已嘗試 {attempts}/{MAX_ATTEMPTS} 次)")
+
+    def _claim_next(self) -> Optional[Path]:
+        """以改名方式認領最早的工作，並在工作檔記錄認領次數"""
+        for job_path in sorted(self.paths['incoming'].glob("*.json")):
+            running_path = self.paths['running'] / job_path.name
+            try:
+                os.rename(job_path, running_path)
+            except FileNotFoundError:
+                continue
+            with open(running_path, 'r', encoding='utf-8') as f:
+                job = json.load(f)
+            job['attempts'] = job.get('attempts', 0) + 1
+            _write_json_atomic(running_path, job)
+            return running_path
+        return None
+
+    def _request_stop(self, signum=None, frame=None):
+        print("🛑 收到停止要求，完成目前工作後結束")
+        self._stopping = True
+
+    def serve(self) -> int:
+        """載入模型後持續處理工作，直到收到停止要求"""
+        lock_fd = _acquire_worker_lock(self.paths['root'])
+        if lock_fd is None:
+            print(f"⚠️ 處理程序已在執行 (PID {worker_pid(str(self.paths['root']))})")
+            return 1
+
+        stop_path = self.paths['root'] / STOP_FILENAME
+        if stop_path.exists():
+            stop_path.unlink()
+        signal.signal(signal.SIGTERM, self._request_stop)
+        # 處理程序啟動時的環境變數，每個工作結束後還原（工作帶入的設定不延續到下一個工作）
+        self._base_env = dict(os.environ)
+
+        try:
+            try:
+                import src.pyannote_speaker_segmentation as segmentation
+            except ImportError:
+                import pyannote_speaker_segmentation as segmentation
+
+            segmentation.init_runtime()
+            device = segmentation.resolve_device(self.device_name)
+            print(f"🔧 使用裝置: {device}")
+
+            start_time = time.time()
+            models = segmentation.load_models(device)
+            db = segmentation.SpeakerDatabase(os.environ.get('SPEAKERS_DATABASE_PATH', 'data/speakers.db'))
+            print(f"✅ 模型載入完成 ({time.time() - start_time:.1f}s)，等待工作: {self.paths['incoming']}")
+
+            self._recover_interrupted()
+            with db.session():
+                self._process_jobs(segmentation, models, db, device, stop_path)
+        finally:
+            _release_worker_lock(lock_fd)
+
+        print("👋 處理程序已結束")
+        return 0
+
+    def _process_jobs(self, segmentation, models: Dict, db, device, stop_path: Path):
+        """依序處理工作，直到收到停止要求或閒置逾時"""
+        idle_since = time.time()
+        while not self._stopping:
+            if stop_path.exists():
+                stop_path.unlink()
+                break
+
+            job_path = self._claim_next()
+            if job_path is None:
+                if self.idle_timeout and time.time() - idle_since > self.idle_timeout:
+                    print("💤 閒置逾時，結束處理程序")
+                    break
+                time.sleep(self.poll_interval)
+                continue
+
+            self._run_job(job_path, segmentation, models, db, device)
+            idle_since = time.time()
+
+    def _run_job(self, job_path: Path, segmentation, models: Dict, db, device):
+        """執行單一工作，輸出寫入 logs/，結果寫入 done/ 或 failed/"""
+        with open(job_path, 'r', encoding='utf-8') as f:
+            job = json.load(f)
+        job_id = job['id']
+        print(f"▶️  工作 {job_id}: {' '.join(job['argv'])}")
+
+        started_at = time.time()
+        exit_code = 1
+        error = None
+        log_path = self.paths['logs'] / f"{job_id}.log"
+        with open(log_path, 'a', encoding='utf-8', buffering=1) as log, \
+                contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            try:
+                os.environ.update(job.get('env', {}))
+                parser = segmentation.build_arg_parser()
+                args = parser.parse_args(job['argv'])
+                segmentation.validate_args(parser, args)
+                segmentation.telemetry.start_run('episode_worker', job=job_id, device=device.type,
+                                                 episode=None if args.batch else args.episode_num, batch=args.batch)
+                # 相對路徑以客戶端的工作目錄為準
+                for name in ('audio_file', 'subtitle_file', 'output_dir', 'batch', 'subtitle_pattern'):
+                    if getattr(args, name):
+                        setattr(args, name, os.path.join(job['cwd'], getattr(args, name)))
+                if args.device and args.device != device.type:
+                    print(f"⚠️ 處理程序使用 {device}，忽略 --device {args.device}")
+                if args.batch:
+                    exit_code = segmentation.run_batch(args, db, models, device)
+                else:
+                    with segmentation.telemetry.span('episode', episode=args.episode_num):
+                        exit_code = segmentation.process_episode(args, db, models, device)
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                error = str(e)
+                traceback.print_exc()
+            finally:
+                segmentation.telemetry.end_run('ok' if exit_code == 0 else 'error')
+                segmentation.release_memory()
+                os.environ.clear()
+                os.environ.update(self._base_env)
+
+        result = {
+            'id': job_id,
+            'exit_code': exit_code,
+            'error': error,
+            'attempts': job.get('attempts', 1),
+            'started_at': started_at,
+            'finished_at': time.time()
+        }
+        result_dir = self.paths['done'] if exit_code == 0 else self.paths['failed']
+        _write_json_atomic(result_dir / f"{job_id}.json", result)
+        job_path.unlink()
+        print(f"{'✅' if exit_code == 0 else '❌'} 工作 {job_id} 結束 "
+              f"(結束碼 {exit_code}, {result['finished_at'] - started_at:.1f}s)")
+
+
+def submit(spool_dir: str, argv: List[str], wait: bool = True, start_timeout: float = 600) -> int:
+    """
+    送出工作並（預設）等待完成，同時顯示處理輸出
+
+    Args:
+        spool_dir: spool 目錄
+        argv: pyannote_speaker_segmentation.py 的命令列參數
+        wait: 等待工作完成
+        start_timeout: 處理程序未執行時，等待其（重新）啟動的秒數
+
+    Returns:
+        int: 工作結束碼
+    """
+    paths = _spool_paths(spool_dir)
+    job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    job = {
+        'id': job_id,
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'env': {key: os.environ[key] for key in JOB_ENV_KEYS if key in os.environ},
+        'submitted_at': time.time()
+    }
+    incoming_path = paths['incoming'] / f"{job_id}.json"
+    _write_json_atomic(incoming_path, job)
+    print(f"📨 已送出工作: {job_id}")
+    if not wait:
+        return 0
+
+    log_path = paths['logs'] / f"{job_id}.log"
+    log_offset = 0
+    last_alive = time.time()
+    while True:
+        if log_path.exists():
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+                f.seek(log_offset)
+                chunk = f.read()
+                log_offset = f.tell()
+            if chunk:
+                sys.stdout.write(chunk)
+                sys.stdout.flush()
+
+        for result_dir in (paths['done'], paths['failed']):
+            result_path = result_dir / f"{job_id}.json"
+            if result_path.exists():
+                with open(result_path, 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+                if result.get('error'):
+                    print(f"❌ {result['error']}")
+                return result['exit_code']
+
+        # 處理程序持續未執行：撤回未認領的工作；已認領者視為處理程序中斷
+        if worker_pid(spool_dir) is not None:
+            last_alive = time.time()
+        elif time.time() - last_alive > start_timeout:
+            try:
+                incoming_path.unlink()
+                print(f"❌ 處理程序未執行，已撤回工作 {job_id}")
+            except FileNotFoundError:
+                print(f"❌ 處理程序在處理工作 {job_id} 時中斷，下次啟動時會重新處理")
+            return 1
+
+        time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常駐集數處理程序")
+    parser.add_argument('--spool', default=DEFAULT_SPOOL_DIR, help='spool 目錄')
+    subparsers = parser.add_subparsers(dest='command', help='可用指令')
+
+    serve_parser = subparsers.add_parser('serve', help='啟動處理程序')
+    serve_parser.add_argument('--device', choices=['cpu', 'cuda'], help='運算裝置')
+    serve_parser.add_argument('--idle-timeout', type=float,
+                              default=float(os.environ.get('EPISODE_WORKER_IDLE_TIMEOUT', '0')),
+                              help='閒置多久後結束（秒，0 = 不結束）')
+
+    submit_parser = subparsers.add_parser('submit', help='送出集數工作')
+    submit_parser.add_argument('--no-wait', action='store_true', help='送出後立即返回')
+    submit_parser.add_argument('argv', nargs=argparse.REMAINDER,
+                               help='pyannote_speaker_segmentation.py 的參數（置於 -- 之後）')
+
+    subparsers.add_parser('status', help='顯示處理程序狀態（未執行時結束碼為 1）')
+    subparsers.add_parser('stop', help='完成目前工作後結束處理程序')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        return EpisodeWorker(args.spool, args.device, idle_timeout=args.idle_timeout).serve()
+
+    if args.command == 'submit':
+        argv = args.argv[1:] if args.argv[:1] == ['--'] else args.argv
+        if not argv:
+            print("❌ 請提供處理參數")
+            return 1
+        return submit(args.spool, argv, wait=not args.no_wait)
+
+    if args.command == 'status':
+        paths = _spool_paths(args.spool)
+        pid = worker_pid(args.spool)
+        queued = len(list(paths['incoming'].glob("*.json")))
+        running = len(list(paths['running'].glob("*.json")))
+        print(f"{'🟢 執行中 (PID ' + str(pid) + ')' if pid else '⚪ 未執行'}，待處理 {queued}，處理中 {running}")
+        return 0 if pid else 1
+
+    if args.command == 'stop':
+        if worker_pid(args.spool) is None:
+            print("⚪ 處理程序未執行")
+            return 0
+        (_spool_paths(args.spool)['root'] / STOP_FILENAME).touch()
+        print("🛑 已要求處理程序在目前工作完成後結束")
+        return 0
+
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
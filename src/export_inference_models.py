@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+CPU 推論模型匯出
+將 segmentation 與 embedding 模型（models/*.bin）匯出為 TorchScript 或 ONNX，
+與 eager 模型比對數值一致性後才允許在執行期使用
+
+主要功能：
+- 匯出：TorchScript（trace + freeze）或 ONNX（動態 batch / 長度）
+- 驗證：多種輸入長度與 batch 下比對輸出誤差並測量加速比，結果寫入 manifest.json
+- 執行期切換：PYANNOTE_INFERENCE_BACKEND=eager|torchscript|onnx，
+  只替換模型的 forward，pipeline 的 specifications、receptive field 等屬性不變；
+  diarization pipeline 只替換 segmentation（pipeline 內的 embedding 一律帶 weights 呼叫，
+  匯出圖不支援），embedding 匯出只用於 EmbeddingInference
+
+使用範例：
+  python src/export_inference_models.py --backend torchscript
+  python src/export_inference_models.py --backend onnx --models embedding
+  python src/export_inference_models.py --backend all --verify-only
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent
+MODELS_DIR = PROJECT_ROOT / "models"
+
+CHECKPOINTS = {
+    'segmentation': "pyannote_model_segmentation-3.0.bin",
+    'embedding': "pyannote_model_wespeaker-voxceleb-resnet34-LM.bin"
+}
+BACKENDS = ('eager', 'torchscript', 'onnx')
+EXPORT_SUFFIX = {'torchscript': '.torchscript.pt', 'onnx': '.onnx'}
+MANIFEST_FILENAME = "manifest.json"
+SAMPLE_RATE = 16000
+
+# 驗證用的輸入：(batch, 秒數)。segmentation 以固定長度 chunk 推論，只改變 batch；
+# embedding 以整段說話人音訊推論，長度會變動
+PARITY_INPUTS = {
+    'segmentation': [(1, 10.0), (4, 10.0)],
+    'embedding': [(1, 1.5), (1, 6.0), (2, 10.0)]
+}
+PARITY_ATOL = 1e-3
+
+
+def default_export_dir() -> Path:
+    """匯出目錄（PYANNOTE_INFERENCE_DIR，相對路徑以專案根目錄為準）"""
+    return PROJECT_ROOT / os.environ.get('PYANNOTE_INFERENCE_DIR', 'models/inference')
+
+
+def get_backend() -> str:
+    """執行期使用的推論後端"""
+    backend = os.environ.get('PYANNOTE_INFERENCE_BACKEND', 'eager').strip().lower() or 'eager'
+    if backend not in BACKENDS:
+        print(f"⚠️ 未知的 PYANNOTE_INFERENCE_BACKEND={backend}，使用 eager")
+        return 'eager'
+    return backend
+
+
+def checkpoint_signature(name: str, models_dir: Path = MODELS_DIR) -> Dict:
+    """checkpoint 的大小與修改時間（用來判斷匯出檔是否過期）"""
+    stat = (models_dir / CHECKPOINTS[name]).stat()
+    return {'file': CHECKPOINTS[name], 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_manifest(export_dir: Path) -> Dict:
+    manifest_path = export_dir / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(export_dir: Path, manifest: Dict):
+    manifest_path = export_dir / MANIFEST_FILENAME
+    temp_path = manifest_path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+
+
+def load_eager_model(name: str, models_dir: Path = MODELS_DIR):
+    """從 .bin 載入 eager 模型（CPU、eval 模式）"""
+    from pyannote.audio import Model
+
+    model = Model.from_pretrained(str(models_dir / CHECKPOINTS[name]))
+    return model.to('cpu').eval()
+
+
+def example_input(batch: int, seconds: float):
+    """[batch, 1, samples] 的隨機波形（固定種子）"""
+    import torch
+
+    generator = torch.Generator().manual_seed(0)
+    return torch.randn(batch, 1, int(seconds * SAMPLE_RATE), generator=generator) * 0.1
+
+
+def export_torchscript(model, path: Path, example):
+    """trace 後 freeze（常數折疊、移除 training 分支）"""
+    import torch
+
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example, check_trace=False)
+        frozen = torch.jit.freeze(traced.eval())
+    frozen.save(str(path))
+
+
+def export_onnx(name: str, model, path: Path, example):
+    """匯出 ONNX，batch 與樣本數為動態維度"""
+    import torch
+
+    output_axes = {0: 'batch', 1: 'frames'} if name == 'segmentation' else {0: 'batch'}
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (example,), str(path),
+            input_names=['waveforms'], output_names=['output'],
+            dynamic_axes={'waveforms': {0: 'batch', 2: 'samples'}, 'output': output_axes},
+            opset_version=17, do_constant_folding=True
+        )
+
+
+def load_exported(name: str, backend: str, export_dir: Path) -> Callable:
+    """
+    載入匯出模型，回傳 callable(waveforms: Tensor) -> Tensor
+
+    Raises:
+        FileNotFoundError: 匯出檔不存在
+        ImportError: ONNX 後端需要 onnxruntime
+    """
+    import torch
+
+    path = export_dir / f"{name}{EXPORT_SUFFIX[backend]}"
+    if not path.exists():
+        raise FileNotFoundError(f"找不到匯出模型: {path}")
+
+    if backend == 'torchscript':
+        module = torch.jit.load(str(path), map_location='cpu')
+        module.eval()
+        return module
+
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("ONNX 後端需要 onnxruntime: pip install onnxruntime") from e
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+
+    def run(waveforms):
+        outputs = session.run(None, {'waveforms': waveforms.detach().cpu().numpy().astype('float32')})
+        return torch.from_numpy(outputs[0])
+
+    return run
+
+
+def _median_time(function: Callable, example, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(example)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def verify_parity(name: str, eager_model, exported: Callable, repeat: int = 5) -> Dict:
+    """
+    比對 eager 與匯出模型的輸出
+
+    Returns:
+        Dict: {'passed', 'max_abs_diff', 'min_cosine', 'eager_ms', 'exported_ms', 'speedup', 'cases'}
+    """
+    import torch
+
+    cases = []
+    with torch.no_grad():
+        for batch, seconds in PARITY_INPUTS[name]:
+            example = example_input(batch, seconds)
+            expected = eager_model(example).float()
+            actual = exported(example).float()
+            if actual.shape != expected.shape:
+                cases.append({'batch': batch, 'seconds': seconds, 'passed': False,
+                              'error': f"shape {tuple(actual.shape)} != {tuple(expected.shape)}"})
+                continue
+
+            max_abs_diff = float((actual - expected).abs().max())
+            cosine = torch.nn.functional.cosine_similarity(
+                actual.reshape(batch, -1), expected.reshape(batch, -1), dim=1)
+            eager_time = _median_time(eager_model, example, repeat)
+            exported_time = _median_time(exported, example, repeat)
+            cases.append({
+                'batch': batch,
+                'seconds': seconds,
+                'passed': max_abs_diff <= PARITY_ATOL,
+                'max_abs_diff': max_abs_diff,
+                'min_cosine': float(cosine.min()),
+                'eager_ms': eager_time * 1000,
+                'exported_ms': exported_time * 1000
+            })
+
+    measured = [case for case in cases if 'eager_ms' in case]
+    eager_ms = sum(case['eager_ms'] for case in measured)
+    exported_ms = sum(case['exported_ms'] for case in measured)
+    return {
+        'passed': bool(cases) and all(case['passed'] for case in cases),
+        'max_abs_diff': max((case['max_abs_diff'] for case in measured), default=None),
+        'min_cosine': min((case['min_cosine'] for case in measured), default=None),
+        'eager_ms': round(eager_ms, 2),
+        'exported_ms': round(exported_ms, 2),
+        'speedup': round(eager_ms / exported_ms, 2) if exported_ms else None,
+        'cases': cases
+    }
+
+
+def export_models(names: List[str], backends: List[str], export_dir: Path,
+                  verify_only: bool = False, models_dir: Path = MODELS_DIR) -> Dict:
+    """
+    匯出並驗證模型，結果寫入 manifest.json
+
+    Returns:
+        Dict: manifest 內容
+    """
+    import torch
+
+    export_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(export_dir)
+
+    for name in names:
+        print(f"\n📦 {name}: {CHECKPOINTS[name]}")
+        eager_model = load_eager_model(name, models_dir)
+        for backend in backends:
+            path = export_dir / f"{name}{EXPORT_SUFFIX[backend]}"
+            entry = {'path': path.name, 'checkpoint': checkpoint_signature(name, models_dir),
+                     'torch': torch.__version__}
+            try:
+                if not verify_only:
+                    print(f"  🔧 匯出 {backend} → {path}")
+                    example = example_input(*PARITY_INPUTS[name][0])
+                    if backend == 'torchscript':
+                        export_torchscript(eager_model, path, example)
+                    else:
+                        export_onnx(name, eager_model, path, example)
+                result = verify_parity(name, eager_model, load_exported(name, backend, export_dir))
+                entry.update(result)
+            except Exception as e:
+                entry.update({'passed': False, 'error': str(e)})
+
+            manifest.setdefault(name, {})[backend] = entry
+            if entry['passed']:
+                print(f"  ✅ {backend}: 最大誤差 {entry['max_abs_diff']:.2e}, "
+                      f"eager {entry['eager_ms']:.1f}ms → {entry['exported_ms']:.1f}ms (×{entry['speedup']})")
+            else:
+                reason = entry.get('error') or next(
+                    (case.get('error') or f"誤差 {case['max_abs_diff']:.2e}" for case in entry['cases'] if not case['passed']), '')
+                print(f"  ❌ {backend}: 驗證未通過（執行期將使用 eager）: {reason}")
+
+    save_manifest(export_dir, manifest)
+    return manifest
+
+
+def _exported_forward(model, name: str, backend: str, export_dir: Path) -> Optional[Callable]:
+    """檢查 manifest 後載入匯出模型（不可用時回傳 None）"""
+    entry = load_manifest(export_dir).get(name, {}).get(backend)
+    if not entry or not entry.get('passed'):
+        print(f"⚠️ {name} 沒有通過驗證的 {backend} 匯出，使用 eager（請執行 export_inference_models.py）")
+        return None
+    if entry.get('checkpoint') != checkpoint_signature(name):
+        print(f"⚠️ {name} 的 checkpoint 已變更，{backend} 匯出已過期，使用 eager")
+        return None
+    try:
+        return load_exported(name, backend, export_dir)
+    except Exception as e:
+        print(f"⚠️ 無法載入 {name} 的 {backend} 匯出，使用 eager: {e}")
+        return None
+
+
+def apply_inference_backend(model, name: str, backend: Optional[str] = None,
+                            export_dir: Optional[Path] = None):
+    """
+    將模型的 forward 換成匯出版本（原地修改，重複呼叫不會重複載入）
+
+    只在 CPU 上替換；帶關鍵字參數的呼叫（如 embedding 的 weights）仍使用 eager forward
+
+    Args:
+        model: pyannote Model（或帶有 model_ 屬性的 embedding 包裝）
+        name: 'segmentation' / 'embedding'
+        backend: None = PYANNOTE_INFERENCE_BACKEND
+
+    Returns:
+        傳入的 model
+    """
+    backend = backend or get_backend()
+    target = getattr(model, 'model_', model)
+    if backend == 'eager' or target is None or getattr(target, '_inference_backend', None) == backend:
+        return model
+
+    device = next(target.parameters()).device
+    if device.type != 'cpu':
+        print(f"⚠️ {backend} 匯出模型僅供 CPU 使用，{name} 在 {device} 上維持 eager")
+        return model
+
+    exported = _exported_forward(target, name, backend, export_dir or default_export_dir())
+    if exported is None:
+        return model
+
+    eager_forward = target.forward
+
+    def forward(*args, **kwargs):
+        if kwargs or len(args) != 1:
+            return eager_forward(*args, **kwargs)
+        return exported(args[0])
+
+    target.forward = forward
+    target._inference_backend = backend
+    print(f"⚡ {name} 使用 {backend} 推論")
+    return model
+
+
+def apply_pipeline_inference_backend(pipeline, backend: Optional[str] = None):
+    """
+    替換 diarization pipeline 內 segmentation 模型的 forward
+
+    pipeline 的 embedding 包裝一律以 model_(waveforms, weights=masks) 呼叫，匯出圖不接受 weights，
+    因此 pipeline 內的 embedding 維持 eager；embedding 匯出只用於 EmbeddingInference
+    """
+    backend = backend or get_backend()
+    segmentation = getattr(getattr(pipeline, '_segmentation', None), 'model', None)
+    if segmentation is not None:
+        apply_inference_backend(segmentation, 'segmentation', backend)
+    if backend != 'eager' and getattr(pipeline, '_embedding', None) is not None:
+        print(f"ℹ️ diarization pipeline 內的 embedding 需要 weights 參數，維持 eager（{backend} 只用於 EmbeddingInference）")
+    return pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="匯出 CPU 推論用的 segmentation / embedding 模型")
+    parser.add_argument('--backend', choices=['torchscript', 'onnx', 'all'], default='torchscript',
+                        help='匯出格式')
+    parser.add_argument('--models', nargs='+', choices=sorted(CHECKPOINTS), default=sorted(CHECKPOINTS),
+                        help='要匯出的模型')
+    parser.add_argument('--output-dir', help='匯出目錄（預設 PYANNOTE_INFERENCE_DIR 或 models/inference）')
+    parser.add_argument('--verify-only', action='store_true', help='只重新驗證既有的匯出檔')
+    args = parser.parse_args()
+
+    import torch
+    torch.set_num_threads(int(os.environ.get('OMP_NUM_THREADS', '4')))
+
+    backends = ['torchscript', 'onnx'] if args.backend == 'all' else [args.backend]
+    export_dir = Path(args.output_dir) if args.output_dir else default_export_dir()
+    manifest = export_models(args.models, backends, export_dir, args.verify_only)
+
+    failed = [f"{name}/{backend}" for name in args.models for backend in backends
+              if not manifest.get(name, {}).get(backend, {}).get('passed')]
+    print(f"\n📄 manifest: {export_dir / MANIFEST_FILENAME}")
+    if failed:
+        print(f"❌ 未通過驗證: {', '.join(failed)}")
+        return 1
+    print(f"✅ 完成，設定 PYANNOTE_INFERENCE_BACKEND={backends[0]} 啟用")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+LibriTTS 輸出樹分片匯出
+將 speaker/chapter/utterance.wav + .normalized.txt 打包為大小受限的 tar 分片（WebDataset 格式）
+
+主要功能：
+- 依說話人或集數分組，組內依語句 ID 排序後依序填入分片（結果可重現）
+- 每個語句寫入 {key}.wav / {key}.txt / {key}.json 三個成員
+- 全域偏移索引（index.jsonl），支援隨機存取
+- ShardReader：依 key 隨機讀取，或依分片順序串流讀取
+
+使用範例：
+  python export_shards.py export data/output data/shards                   # 依說話人分組
+  python export_shards.py export data/output data/shards --group-by episode
+  python export_shards.py export data/split_dataset/train.jsonl data/shards/train
+  python export_shards.py info data/shards
+  python export_shards.py get data/shards 1_001_0003 --out sample.wav
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
+
+try:
+    from src.split_dataset import audio_duration, get_all_speakers, get_speaker_files, load_split_manifest
+except ImportError:
+    from split_dataset import audio_duration, get_all_speakers, get_speaker_files, load_split_manifest
+
+INDEX_FILENAME = "index.jsonl"
+SHARDS_INFO_FILENAME = "shards.json"
+TAR_BLOCK = 512
+
+
+def _tar_member_size(data_size: int) -> int:
+    """單一 tar 成員佔用的位元組數（標頭 + 補齊至 512 的資料）"""
+    return TAR_BLOCK + (data_size + TAR_BLOCK - 1) // TAR_BLOCK * TAR_BLOCK
+
+
+def collect_utterances(source: str) -> List[Dict]:
+    """
+    收集待匯出的語句
+
+    Args:
+        source: LibriTTS 輸出目錄，或切分清單 (.jsonl)
+
+    Returns:
+        List[Dict]: 語句列表（id/path/speaker/episode/text_path/duration）
+    """
+    utterances = []
+    if source.endswith('.jsonl'):
+        for row in load_split_manifest(source):
+            utterances.append({
+                'id': row['id'],
+                'path': row['path'],
+                'speaker': row['speaker'],
+                'episode': row['episode'],
+                'duration': row.get('duration'),
+                'text': row.get('text')
+            })
+        return utterances
+
+    for speaker in get_all_speakers(source):
+        for chapter, filename in get_speaker_files(source, speaker):
+            utterances.append({
+                'id': os.path.splitext(filename)[0],
+                'path': os.path.abspath(os.path.join(source, speaker, chapter, filename)),
+                'speaker': speaker,
+                'episode': chapter,
+                'duration': None,
+                'text': None
+            })
+    return utterances
+
+
+def _load_text(utterance: Dict) -> str:
+    """語句文字（清單已提供時直接使用，否則讀取 .normalized.txt）"""
+    if utterance.get('text') is not None:
+        return utterance['text']
+    txt_path = utterance['path'][:-len('.wav')] + '.normalized.txt'
+    if os.path.exists(txt_path):
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    return ""
+
+
+def plan_shards(utterances: List[Dict], group_by: str = "speaker",
+                max_shard_bytes: int = 512 * 1024 ** 2) -> List[Dict]:
+    """
+    決定每個語句所屬的分片（相同輸入得到相同結果）
+
+    分組依 key 排序，組內依語句 ID 排序後依序填入，超過大小上限時開新分片。
+
+    Args:
+        utterances: 語句列表
+        group_by: 分組依據（speaker / episode）
+        max_shard_bytes: 單一分片大小上限
+
+    Returns:
+        List[Dict]: 分片計劃（name/group/utterances/estimated_bytes）
+    """
+    groups: Dict[str, List[Dict]] = {}
+    seen_ids = set()
+    for utterance in utterances:
+        if utterance['id'] in seen_ids:
+            raise ValueError(f"語句 ID 重複: {utterance['id']}")
+        seen_ids.add(utterance['id'])
+        groups.setdefault(str(utterance[group_by]), []).append(utterance)
+
+    shards = []
+    for group in sorted(groups):
+        index = 0
+        current: List[Dict] = []
+        current_bytes = 0
+        for utterance in sorted(groups[group], key=lambda u: u['id']):
+            # 文字與中繼資料成員很小，以兩個區塊估計
+            item_bytes = _tar_member_size(os.path.getsize(utterance['path'])) + 4 * TAR_BLOCK
+            if current and current_bytes + item_bytes > max_shard_bytes:
+                shards.append({'name': f"{group_by}-{group}-{index:05d}.tar", 'group': group,
+                               'utterances': current, 'estimated_bytes': current_bytes})
+                index += 1
+                current, current_bytes = [], 0
+            current.append(utterance)
+            current_bytes += item_bytes
+        if current:
+            shards.append({'name': f"{group_by}-{group}-{index:05d}.tar", 'group': group,
+                           'utterances': current, 'estimated_bytes': current_bytes})
+    return shards
+
+
+def _add_member(tar: tarfile.TarFile, name: str, data: bytes) -> Dict:
+    """寫入一個成員，回傳其資料在分片中的偏移與長度"""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = 0  # 固定時間戳，相同輸入產生相同位元組
+    info.mode = 0o644
+    header = info.tobuf(tar.format, tar.encoding, tar.errors)
+    offset = tar.offset + len(header)
+    tar.addfile(info, io.BytesIO(data))
+    return {'offset': offset, 'size': len(data)}
+
+
+def write_shard(shard: Dict, output_dir: str) -> List[Dict]:
+    """
+    寫出單一分片（先寫暫存檔，完成後改名）
+
+    Returns:
+        List[Dict]: 分片內每個語句的索引項目
+    """
+    shard_path = os.path.join(output_dir, shard['name'])
+    temp_path = shard_path + ".partial"
+    entries = []
+
+    with tarfile.open(temp_path, 'w', format=tarfile.GNU_FORMAT) as tar:
+        for utterance in shard['utterances']:
+            key = utterance['id']
+            with open(utterance['path'], 'rb') as f:
+                audio = f.read()
+            text = _load_text(utterance)
+            duration = utterance.get('duration')
+            if duration is None:
+                try:
+                    duration = round(audio_duration(utterance['path']), 3)
+                except Exception:
+                    duration = None
+            metadata = {'id': key, 'speaker': utterance['speaker'],
+                        'episode': utterance['episode'], 'duration': duration}
+
+            wav_member = _add_member(tar, f"{key}.wav", audio)
+            txt_member = _add_member(tar, f"{key}.txt", text.encode('utf-8'))
+            _add_member(tar, f"{key}.json", json.dumps(metadata, ensure_ascii=False).encode('utf-8'))
+
+            entries.append({
+                'key': key,
+                'shard': shard['name'],
+                'wav_offset': wav_member['offset'],
+                'wav_size': wav_member['size'],
+                'txt_offset': txt_member['offset'],
+                'txt_size': txt_member['size'],
+                **{k: v for k, v in metadata.items() if k != 'id'}
+            })
+
+    os.replace(temp_path, shard_path)
+    return entries
+
+
+def export_shards(source: str, output_dir: str, group_by: str = "speaker",
+                  shard_size_mb: int = 512, max_workers: int = 4) -> Dict:
+    """
+    匯出分片與索引
+
+    Args:
+        source: LibriTTS 輸出目錄，或切分清單 (.jsonl)
+        output_dir: 分片輸出目錄
+        group_by: 分組依據（speaker / episode）
+        shard_size_mb: 單一分片大小上限 (MB)
+        max_workers: 並行寫出的分片數
+
+    Returns:
+        Dict: 匯出摘要
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    utterances = collect_utterances(source)
+    if not utterances:
+        print(f"❌ 在 {source} 中找不到語句")
+        return {'success': False, 'error': 'No utterances found'}
+
+    shards = plan_shards(utterances, group_by, shard_size_mb * 1024 ** 2)
+    print(f"📦 {len(utterances)} 個語句 → {len(shards)} 個分片 (依 {group_by} 分組, 上限 {shard_size_mb} MB)")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        shard_entries = list(executor.map(lambda shard: write_shard(shard, output_dir), shards))
+
+    # 索引依分片與寫入順序排列
+    index_path = os.path.join(output_dir, INDEX_FILENAME)
+    with open(index_path + ".partial", 'w', encoding='utf-8') as f:
+        for entries in shard_entries:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(index_path + ".partial", index_path)
+
+    summary = {
+        'source': os.path.abspath(source),
+        'group_by': group_by,
+        'shard_size_mb': shard_size_mb,
+        'utterances': len(utterances),
+        'shards': [
+            {'name': shard['name'], 'group': shard['group'], 'utterances': len(shard['utterances']),
+             'bytes': os.path.getsize(os.path.join(output_dir, shard['name']))}
+            for shard in shards
+        ]
+    }
+    with open(os.path.join(output_dir, SHARDS_INFO_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    total_bytes = sum(shard['bytes'] for shard in summary['shards'])
+    print(f"✅ 匯出完成: {output_dir} ({total_bytes / 1024 ** 2:.1f} MB)")
+    summary['success'] = True
+    return summary
+
+
+class ShardReader:
+    """分片讀取器 - 依索引隨機存取，或依分片順序串流讀取
+
+    設計原則：
+    - 隨機存取：以 os.pread 依偏移讀取，不需解析 tar
+    - 循序讀取：串流模式依分片內順序產出，適合訓練時大區塊讀取
+    """
+
+    def __init__(self, shard_dir: str):
+        """
+        初始化讀取器
+
+        Args:
+            shard_dir: 分片目錄（含 index.jsonl）
+        """
+        self.shard_dir = shard_dir
+        self.index: Dict[str, Dict] = {}
+        with open(os.path.join(shard_dir, INDEX_FILENAME), 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.index[entry['key']] = entry
+        self._fds: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def keys(self) -> List[str]:
+        return list(self.index)
+
+    def shards(self) -> List[str]:
+        """分片名稱（依索引順序）"""
+        return list(dict.fromkeys(entry['shard'] for entry in self.index.values()))
+
+    def _fd(self, shard: str) -> int:
+        if shard not in self._fds:
+            self._fds[shard] = os.open(os.path.join(self.shard_dir, shard), os.O_RDONLY)
+        return self._fds[shard]
+
+    def get(self, key: str) -> Dict:
+        """依語句 ID 讀取音訊與文字"""
+        entry = self.index[key]
+        fd = self._fd(entry['shard'])
+        audio = os.pread(fd, entry['wav_size'], entry['wav_offset'])
+        text = os.pread(fd, entry['txt_size'], entry['txt_offset']).decode('utf-8')
+        return {'key': key, 'audio': audio, 'text': text, 'speaker': entry['speaker'],
+                'episode': entry['episode'], 'duration': entry.get('duration')}
+
+    def iter_shard(self, shard: str) -> Iterator[Dict]:
+        """循序讀取單一分片，依寫入順序產出語句"""
+        sample: Dict = {}
+        with tarfile.open(os.path.join(self.shard_dir, shard), 'r|') as tar:
+            for member in tar:
+                key, ext = member.name.rsplit('.', 1)
+                if sample and sample['key'] != key:
+                    yield sample
+                    sample = {}
+                sample['key'] = key
+                data = tar.extractfile(member).read()
+                if ext == 'wav':
+                    sample['audio'] = data
+                elif ext == 'txt':
+                    sample['text'] = data.decode('utf-8')
+                elif ext == 'json':
+                    sample.update({k: v for k, v in json.loads(data).items() if k != 'id'})
+        if sample:
+            yield sample
+
+    def close(self):
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LibriTTS 輸出樹分片匯出")
+    subparsers = parser.add_subparsers(dest='command', help='可用指令')
+
+    export_parser = subparsers.add_parser('export', help='匯出分片')
+    export_parser.add_argument('source', help='LibriTTS 輸出目錄或切分清單 (.jsonl)')
+    export_parser.add_argument('output_dir', help='分片輸出目錄')
+    export_parser.add_argument('--group-by', choices=['speaker', 'episode'], default='speaker', help='分組依據')
+    export_parser.add_argument('--shard-size-mb', type=int, default=512, help='單一分片大小上限 (MB)')
+    export_parser.add_argument('--workers', type=int, default=4, help='並行寫出的分片數')
+
+    info_parser = subparsers.add_parser('info', help='顯示分片資訊')
+    info_parser.add_argument('shard_dir', help='分片目錄')
+
+    get_parser = subparsers.add_parser('get', help='依語句 ID 讀取')
+    get_parser.add_argument('shard_dir', help='分片目錄')
+    get_parser.add_argument('key', help='語句 ID')
+    get_parser.add_argument('--out', help='將音訊寫出至此路徑')
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        result = export_shards(args.source, args.output_dir, args.group_by, args.shard_size_mb, args.workers)
+        return 0 if result.get('success') else 1
+
+    if args.command == 'info':
+        with open(os.path.join(args.shard_dir, SHARDS_INFO_FILENAME), 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+        print(f"📦 來源: {summary['source']}")
+        print(f"📋 分組: {summary['group_by']}, 語句: {summary['utterances']}, 分片: {len(summary['shards'])}")
+        for shard in summary['shards']:
+            print(f"  {shard['name']}: {shard['utterances']} 語句, {shard['bytes'] / 1024 ** 2:.1f} MB")
+        return 0
+
+    if args.command == 'get':
+        with ShardReader(args.shard_dir) as reader:
+            if args.key not in reader:
+                print(f"❌ 找不到語句: {args.key}")
+                return 1
+            sample = reader.get(args.key)
+        print(f"🎵 {sample['key']} (說話人 {sample['speaker']}, 集數 {sample['episode']}, {sample['duration']}s)")
+        print(f"📝 {sample['text']}")
+        if args.out:
+            with open(args.out, 'wb') as f:
+                f.write(sample['audio'])
+            print(f"💾 已寫出: {args.out}")
+        return 0
+
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
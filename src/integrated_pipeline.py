@@ -5,6 +5,8 @@
 """
 
 import os
+import queue
+import threading
 import time
 import logging
 from pathlib import Path
@@ -20,6 +22,9 @@ from .pyannote_speaker_segmentation import load_pipeline_and_process
 # 靜音警告
 warnings.filterwarnings("ignore")
 
+# 分段管線中通知下一階段結束的標記
+_STAGE_DONE = object()
+
 
 class IntegratedAudioPipeline:
     """整合音頻處理 Pipeline"""
@@ -90,18 +95,12 @@ class IntegratedAudioPipeline:
             # 初始化 UVR5 去背模組
             if self.enable_uvr5:
                 self.logger.info("🎵 初始化 UVR5 去背模組...")
-                self.uvr5_separator = UVR5VocalSeparator(
-                    models_dir=str(self.uvr5_models_dir),
-                    output_dir=str(self.temp_dir / "separated"),
-                    use_gpu=self.use_gpu
-                )
+                self.uvr5_separator = self._create_uvr5_separator()
             
             # 初始化 Pyannote 語者分離模組
             if self.enable_speaker_diarization:
                 self.logger.info("👥 初始化 Pyannote 語者分離模組...")
-                loader = OfflinePipelineLoader(self.project_root)
-                self.pyannote_pipeline = loader.load_pipeline()
-                self.pyannote_device = loader.setup_gpu_if_available(self.pyannote_pipeline)
+                self.pyannote_pipeline, self.pyannote_device = self._create_pyannote_pipeline()
             
             self.logger.info("✅ 所有組件初始化完成")
             
@@ -109,6 +108,24 @@ class IntegratedAudioPipeline:
             self.logger.error(f"❌ 組件初始化失敗: {e}")
             raise
     
+    def _create_uvr5_separator(self) -> UVR5VocalSeparator:
+        """建立 UVR5 去背模組實例"""
+        return UVR5VocalSeparator(
+            models_dir=str(self.uvr5_models_dir),
+            output_dir=str(self.temp_dir / "separated"),
+            use_gpu=self.use_gpu
+        )
+    
+    def _create_pyannote_pipeline(self, share: bool = True) -> Tuple[Any, Any]:
+        """載入 Pyannote pipeline，回傳 (pipeline, device)
+
+        模型只從磁碟載入一次；主要實例直接使用快取中的 pipeline，
+        額外的 diarization 工作執行緒（share=False）才取得各自的副本，避免 GPU 上多一份閒置模型
+        """
+        loader = OfflinePipelineLoader(self.project_root)
+        device = loader.default_device() if self.use_gpu else "cpu"
+        return loader.load_pipeline(device, share=share), device
+    
     def process_audio_file(self, 
                           input_file: str,
                           output_prefix: Optional[str] = None,
@@ -181,19 +198,21 @@ class IntegratedAudioPipeline:
         return result
     
     def _step_1_uvr5_separation(self, input_file: str, output_prefix: str, 
-                                model_name: str, result: Dict) -> Optional[str]:
-        """步驟 1: UVR5 音頻去背"""
+                                model_name: str, result: Dict,
+                                separator: Optional[UVR5VocalSeparator] = None) -> Optional[str]:
+        """步驟 1: UVR5 音頻去背（separator 未指定時使用共用實例）"""
         self.logger.info("🎵 步驟 1: 執行 UVR5 音頻去背...")
         
-        if self.uvr5_separator is None:
+        separator = separator or self.uvr5_separator
+        if separator is None:
             raise RuntimeError("UVR5 分離器未初始化")
         
         # 初始化分離器（如果還沒有）
-        if self.uvr5_separator.separator is None:
-            self.uvr5_separator.initialize_separator(model_name)
+        if separator.separator is None:
+            separator.initialize_separator(model_name)
         
         # 執行去背
-        uvr5_result = self.uvr5_separator.separate_vocals(input_file, output_prefix)
+        uvr5_result = separator.separate_vocals(input_file, output_prefix)
         result['processing_stages']['uvr5'] = uvr5_result
         
         if uvr5_result['success']:
@@ -205,11 +224,13 @@ class IntegratedAudioPipeline:
             return None
     
     def _step_2_speaker_diarization(self, vocals_file: str, output_prefix: str,
-                                   min_speakers: int, max_speakers: int, result: Dict):
-        """步驟 2: Pyannote 語者分離"""
+                                   min_speakers: int, max_speakers: int, result: Dict,
+                                   pipeline: Optional[Any] = None):
+        """步驟 2: Pyannote 語者分離（pipeline 未指定時使用共用實例）"""
         self.logger.info("👥 步驟 2: 執行 Pyannote 語者分離...")
         
-        if self.pyannote_pipeline is None:
+        pipeline = pipeline or self.pyannote_pipeline
+        if pipeline is None:
             raise RuntimeError("Pyannote Pipeline 未初始化")
         
         # 設定輸出目錄
@@ -218,7 +239,7 @@ class IntegratedAudioPipeline:
         
         try:
             # 執行語者分離
-            diarization_result = self.pyannote_pipeline(vocals_file)
+            diarization_result = pipeline(vocals_file)
             
             # 處理語者分離結果
             segments = []
@@ -289,36 +310,182 @@ class IntegratedAudioPipeline:
     def batch_process(self, 
                      input_files: List[str],
                      output_prefix: str = "batch",
+                     separation_workers: int = 1,
+                     diarization_workers: int = 1,
+                     output_workers: int = 1,
+                     queue_size: int = 2,
                      **kwargs) -> List[Dict]:
         """
-        批次處理多個音頻文件
+        批次處理多個音頻文件（分段管線）
+        
+        去背、語者分離、輸出整理三個階段各有自己的工作執行緒，階段之間以有界佇列連接：
+        第 N+1 個文件去背時第 N 個文件同時進行語者分離，整體吞吐量接近最慢的階段。
         
         Args:
             input_files: 輸入文件列表
             output_prefix: 輸出前綴
-            **kwargs: 其他處理參數
+            separation_workers: 去背工作數（第 2 個起各自載入一份 UVR5 模型）
+            diarization_workers: 語者分離工作數（第 2 個起各自載入一份 Pyannote pipeline）
+            output_workers: 輸出整理工作數
+            queue_size: 階段之間佇列的容量（限制已完成但尚未被下一階段取走的文件數）
+            **kwargs: 其他處理參數（uvr5_model / min_speakers / max_speakers）
             
         Returns:
-            List[Dict]: 處理結果列表
+            List[Dict]: 處理結果列表（與 input_files 順序相同）
         """
-        results = []
+        uvr5_model = kwargs.get('uvr5_model', "model_bs_roformer_ep_317_sdr_12.9755.ckpt")
+        min_speakers = kwargs.get('min_speakers', 1)
+        max_speakers = kwargs.get('max_speakers', 10)
+        
+        self.logger.info(f"🚀 開始批次處理 {len(input_files)} 個文件 "
+                         f"(去背 {separation_workers} / 語者分離 {diarization_workers} / 輸出 {output_workers} 工作)")
+        
+        results: List[Optional[Dict]] = [None] * len(input_files)
+        extra_components = []
+        batch_start = time.time()
+        
+        def separation_context(worker_index: int):
+            if not self.enable_uvr5 or worker_index == 0:
+                return self.uvr5_separator
+            separator = self._create_uvr5_separator()
+            extra_components.append(separator)
+            return separator
+        
+        def diarization_context(worker_index: int):
+            if not self.enable_speaker_diarization or worker_index == 0:
+                return self.pyannote_pipeline
+            pipeline, _ = self._create_pyannote_pipeline(share=False)
+            return pipeline
+        
+        def separate(item: Dict, separator):
+            if not Path(item['input_file']).exists():
+                raise FileNotFoundError(f"輸入文件不存在: {item['input_file']}")
+            if self.enable_uvr5:
+                item['vocals_file'] = self._step_1_uvr5_separation(
+                    item['input_file'], item['prefix'], uvr5_model, item['result'], separator
+                )
+        
+        def diarize(item: Dict, pipeline):
+            if self.enable_speaker_diarization and item['vocals_file']:
+                self._step_2_speaker_diarization(
+                    item['vocals_file'], item['prefix'], min_speakers, max_speakers, item['result'], pipeline
+                )
         
-        self.logger.info(f"🚀 開始批次處理 {len(input_files)} 個文件")
+        def organize(item: Dict, _):
+            self._step_3_organize_outputs(item['prefix'], item['result'])
+        
+        def finish(item: Dict):
+            result = item['result']
+            result['total_time'] = time.time() - item['start_time']
+            result['success'] = result['error'] is None
+            results[item['index']] = result
+            if result['success']:
+                self.logger.info(f"✅ 音頻處理完成: {Path(item['input_file']).name} ({result['total_time']:.2f}秒)")
+        
+        stages = [
+            ('separation', separate, separation_context, max(1, separation_workers)),
+            ('diarization', diarize, diarization_context, max(1, diarization_workers)),
+            ('output', organize, lambda worker_index: None, max(1, output_workers)),
+        ]
+        queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        
+        threads = []
+        for stage_index, (name, stage_fn, make_context, workers) in enumerate(stages):
+            out_queue = queues[stage_index + 1] if stage_index + 1 < len(stages) else None
+            next_workers = stages[stage_index + 1][3] if out_queue is not None else 0
+            remaining = {'workers': workers}
+            lock = threading.Lock()
+            for worker_index in range(workers):
+                thread = threading.Thread(
+                    target=self._run_stage_worker,
+                    args=(name, stage_fn, make_context, worker_index, queues[stage_index], out_queue,
+                          finish, remaining, lock, next_workers),
+                    name=f"{name}-{worker_index}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
         
+        # 依序送入文件；佇列已滿時會等待去背階段取走
         for i, input_file in enumerate(input_files, 1):
-            self.logger.info(f"📁 處理第 {i}/{len(input_files)} 個文件: {Path(input_file).name}")
-            
-            file_prefix = f"{output_prefix}_{i:03d}_{Path(input_file).stem}"
-            result = self.process_audio_file(input_file, file_prefix, **kwargs)
-            results.append(result)
+            input_path = Path(input_file)
+            file_prefix = f"{output_prefix}_{i:03d}_{input_path.stem}"
+            queues[0].put({
+                'index': i - 1,
+                'input_file': str(input_path),
+                'prefix': file_prefix,
+                'vocals_file': str(input_path),
+                'start_time': time.time(),
+                'result': {
+                    'input_file': str(input_path),
+                    'output_prefix': file_prefix,
+                    'processing_stages': {},
+                    'final_outputs': {},
+                    'total_time': 0,
+                    'success': False,
+                    'error': None
+                }
+            })
+        for _ in range(stages[0][3]):
+            queues[0].put(_STAGE_DONE)
+        
+        for thread in threads:
+            thread.join()
+        
+        for separator in extra_components:
+            separator.cleanup()
         
         # 生成批次處理報告
-        self._generate_batch_report(results)
+        self._generate_batch_report(results, wall_time=time.time() - batch_start)
         
         return results
     
-    def _generate_batch_report(self, results: List[Dict]):
-        """生成批次處理報告"""
+    def _run_stage_worker(self, name: str, stage_fn, make_context, worker_index: int,
+                          in_queue: queue.Queue, out_queue: Optional[queue.Queue], finish,
+                          remaining: Dict, lock: threading.Lock, next_workers: int):
+        """分段管線的單一工作執行緒：處理 in_queue 的文件並交給下一階段"""
+        context = None
+        context_error = None
+        try:
+            context = make_context(worker_index)
+        except Exception as e:
+            context_error = e
+            self.logger.error(f"❌ {name} 工作 {worker_index} 初始化失敗: {e}")
+        
+        while True:
+            item = in_queue.get()
+            if item is _STAGE_DONE:
+                break
+            
+            result = item['result']
+            if result['error'] is None:
+                stage_start = time.time()
+                try:
+                    if context_error is not None:
+                        raise context_error
+                    stage_fn(item, context)
+                except Exception as e:
+                    result['error'] = str(e)
+                    self.logger.error(f"❌ 音頻處理失敗 {item['input_file']} ({name}): {e}")
+                    if self.logger.level <= logging.DEBUG:
+                        self.logger.debug(traceback.format_exc())
+                result.setdefault('stage_times', {})[name] = time.time() - stage_start
+            
+            if out_queue is not None:
+                out_queue.put(item)
+            else:
+                finish(item)
+        
+        # 本階段最後一個結束的工作通知下一階段
+        with lock:
+            remaining['workers'] -= 1
+            last = remaining['workers'] == 0
+        if last and out_queue is not None:
+            for _ in range(next_workers):
+                out_queue.put(_STAGE_DONE)
+    
+    def _generate_batch_report(self, results: List[Dict], wall_time: Optional[float] = None):
+        """生成批次處理報告（wall_time 為分段管線的實際總耗時）"""
         total_files = len(results)
         successful = sum(1 for r in results if r['success'])
         failed = total_files - successful
@@ -335,6 +502,8 @@ class IntegratedAudioPipeline:
         print(f"成功率: {(successful/total_files*100):.1f}%")
         print(f"總處理時間: {total_time:.2f} 秒")
         print(f"平均處理時間: {avg_time:.2f} 秒/檔")
+        if wall_time is not None:
+            print(f"管線實際耗時: {wall_time:.2f} 秒 ({wall_time / total_files if total_files else 0:.2f} 秒/檔)")
         
         # 統計各階段成功率
         if self.enable_uvr5:
@@ -344,6 +513,14 @@ class IntegratedAudioPipeline:
         if self.enable_speaker_diarization:
             diarization_success = sum(1 for r in results if r.get('processing_stages', {}).get('diarization', {}).get('success', False))
             print(f"語者分離成功率: {(diarization_success/total_files*100):.1f}%")
+        
+        # 各階段累計時間（最慢的階段決定整體吞吐量）
+        stage_totals = {}
+        for r in results:
+            for stage, seconds in r.get('stage_times', {}).items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+        for stage, seconds in stage_totals.items():
+            print(f"階段 {stage}: 累計 {seconds:.2f} 秒")
     
     def cleanup(self):
         """清理資源"""
@@ -4,8 +4,12 @@ Pyannote.audio 正規離線載入模組
 使用官方推薦的離線部署方法
 """
 
+import copy
+import hashlib
 import os
 import sys
+import tempfile
+import threading
 from pathlib import Path
 import traceback
 import warnings
@@ -13,10 +17,21 @@ import warnings
 # 靜音警告
 warnings.filterwarnings("ignore")
 
+# config.yaml 引用的模型檔案（相對於 models/）
+CHECKPOINT_FILES = {
+    "pyannote_model_segmentation-3.0.bin": "分割模型",
+    "pyannote_model_wespeaker-voxceleb-resnet34-LM.bin": "嵌入模型"
+}
+
+# 行程內 Pipeline 快取：(設定雜湊, 裝置) -> pipeline
+_PIPELINE_CACHE = {}
+_PIPELINE_CACHE_LOCK = threading.Lock()
+
+
 class OfflinePipelineLoader:
     """正規的離線 Pipeline 載入器"""
     
-    def __init__(self, project_root=None):
+    def __init__(self, project_root=None, cache_dir=None):
         if project_root is None:
             self.project_root = Path(__file__).parent.parent
         else:
@@ -25,6 +40,11 @@ class OfflinePipelineLoader:
         self.models_dir = self.project_root / "models"
         self.config_path = self.models_dir / "config.yaml"
         
+        # 磁碟快取目錄（空字串 = 停用），相對路徑以專案根目錄為準
+        if cache_dir is None:
+            cache_dir = os.environ.get('PYANNOTE_PIPELINE_CACHE', '')
+        self.cache_dir = self.project_root / cache_dir if cache_dir else None
+        
         # 設定離線環境變數
         self._set_offline_environment()
     
@@ -47,11 +67,7 @@ class OfflinePipelineLoader:
     
     def verify_model_files(self):
         """驗證所需的模型檔案是否存在"""
-        required_files = {
-            "pyannote_model_segmentation-3.0.bin": "分割模型",
-            "pyannote_model_wespeaker-voxceleb-resnet34-LM.bin": "嵌入模型",
-            "config.yaml": "配置檔案"
-        }
+        required_files = {**CHECKPOINT_FILES, "config.yaml": "配置檔案"}
         
         missing_files = []
         for filename, description in required_files.items():
@@ -61,27 +77,126 @@ class OfflinePipelineLoader:
         
         return missing_files
     
-    def load_pipeline(self):
-        """載入正規離線 Pipeline"""
+    def default_device(self):
+        """有 GPU 時使用 cuda，否則 cpu"""
+        try:
+            import torch
+            return "cuda" if torch.cuda.is_available() else "cpu"
+        except Exception:
+            return "cpu"
+    
+    def config_hash(self):
+        """設定檔內容、模型檔案與套件版本的雜湊（任一改變即視為不同的 Pipeline）"""
+        import torch
+        import pyannote.audio
+        
+        digest = hashlib.sha256(self.config_path.read_bytes())
+        for filename in sorted(CHECKPOINT_FILES):
+            stat = (self.models_dir / filename).stat()
+            digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        digest.update(f"torch={torch.__version__};pyannote={pyannote.audio.__version__}".encode())
+        return digest.hexdigest()[:16]
+    
+    def load_pipeline(self, device=None, share=True):
+        """
+        載入正規離線 Pipeline（行程內快取，可選磁碟快取）
+        
+        Args:
+            device: "cpu" / "cuda"（None = 維持在 CPU，與舊行為相同）
+            share: True 時回傳快取中的同一實例；False 時回傳獨立副本（多執行緒各自推論時使用）
+        
+        Returns:
+            Pipeline
+        """
         missing_files = self.verify_model_files()
         if missing_files:
             raise FileNotFoundError(f"缺少必要的模型檔案: {[f[0] for f in missing_files]}")
         
-        print("🎯 載入正規離線 Pipeline...")
-        return self._load_pipeline_new_method()
+        device = str(device or "cpu")
+        key = (self.config_hash(), device)
+        with _PIPELINE_CACHE_LOCK:
+            pipeline = _PIPELINE_CACHE.get(key)
+            if pipeline is not None:
+                print(f"♻️ 使用已載入的 Pipeline ({device.upper()})")
+            else:
+                pipeline = self._load_disk_cache(key[0], device)
+                if pipeline is None:
+                    print("🎯 載入正規離線 Pipeline...")
+                    pipeline = self._load_pipeline_new_method()
+                    self._save_disk_cache(key[0], pipeline)
+                pipeline = self._move_to_device(pipeline, device)
+                _PIPELINE_CACHE[key] = pipeline
+        
+        return pipeline if share else copy.deepcopy(pipeline)
     
     def _load_pipeline_new_method(self):
-        """正規離線方式（使用 .bin 檔案和 config.yaml）"""
-        original_cwd = Path.cwd().resolve()
+        """正規離線方式（使用 .bin 檔案和 config.yaml）
         
+        config.yaml 以相對路徑引用模型檔案；改寫為絕對路徑的暫存設定檔後載入，
+        不切換行程的工作目錄，可在多執行緒中安全呼叫
+        """
+        import yaml
+        from pyannote.audio import Pipeline
+        
+        with open(self.config_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+        params = config.get('pipeline', {}).get('params', {})
+        for name, value in params.items():
+            if isinstance(value, str) and (self.models_dir / value).exists():
+                params[name] = str((self.models_dir / value).resolve())
+        
+        with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False, encoding='utf-8') as f:
+            yaml.safe_dump(config, f, allow_unicode=True)
+            resolved_config = f.name
         try:
-            os.chdir(self.models_dir)
-            from pyannote.audio import Pipeline
-            pipeline = Pipeline.from_pretrained(str(self.config_path))
-            print("✅ 正規離線 Pipeline 載入成功")
-            return pipeline
+            pipeline = Pipeline.from_pretrained(resolved_config)
         finally:
-            os.chdir(original_cwd)
+            os.unlink(resolved_config)
+        print("✅ 正規離線 Pipeline 載入成功")
+        return pipeline
+    
+    def _move_to_device(self, pipeline, device):
+        """將 Pipeline 移到指定裝置"""
+        if device != "cpu":
+            import torch
+            pipeline.to(torch.device(device))
+        return pipeline
+    
+    def _disk_cache_path(self, config_hash):
+        return self.cache_dir / f"pipeline-{config_hash}.pt"
+    
+    def _load_disk_cache(self, config_hash, device):
+        """讀取預先序列化的 Pipeline（不存在或無法讀取時回傳 None）"""
+        if self.cache_dir is None:
+            return None
+        cache_path = self._disk_cache_path(config_hash)
+        if not cache_path.exists():
+            return None
+        try:
+            import torch
+            pipeline = torch.load(cache_path, map_location=torch.device(device), weights_only=False)
+            print(f"⚡ 從磁碟快取載入 Pipeline: {cache_path}")
+            return pipeline
+        except Exception as e:
+            print(f"⚠️ 磁碟快取無法讀取，重新載入: {e}")
+            return None
+    
+    def _save_disk_cache(self, config_hash, pipeline):
+        """序列化 Pipeline 供下次直接載入（失敗時只顯示警告）"""
+        if self.cache_dir is None:
+            return
+        cache_path = self._disk_cache_path(config_hash)
+        temp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+        try:
+            import torch
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            torch.save(pipeline, temp_path)
+            os.replace(temp_path, cache_path)
+            print(f"💾 Pipeline 已寫入磁碟快取: {cache_path}")
+        except Exception as e:
+            print(f"⚠️ 無法寫入磁碟快取: {e}")
+            if temp_path.exists():
+                temp_path.unlink()
     
     def setup_gpu_if_available(self, pipeline):
         """如果有 GPU 可用，將 Pipeline 移到 GPU"""
@@ -96,22 +211,30 @@ class OfflinePipelineLoader:
         except Exception:
             return "cpu"
 
-def load_offline_pipeline(project_root=None):
+def load_offline_pipeline(project_root=None, device=None, share=True):
     """
     便利函數：載入離線 Pipeline
     
     Args:
         project_root: 專案根目錄路徑
+        device: "cpu" / "cuda"（None = 有 GPU 時使用 cuda）
+        share: 是否共用行程內快取的實例（見 OfflinePipelineLoader.load_pipeline）
         
     Returns:
         tuple: (pipeline, device_type)
     """
     loader = OfflinePipelineLoader(project_root)
-    pipeline = loader.load_pipeline()
-    device_type = loader.setup_gpu_if_available(pipeline)
+    device_type = str(device) if device is not None else loader.default_device()
+    pipeline = loader.load_pipeline(device_type, share=share)
     
     return pipeline, device_type
 
+
+def clear_pipeline_cache():
+    """清除行程內 Pipeline 快取（釋放模型記憶體）"""
+    with _PIPELINE_CACHE_LOCK:
+        _PIPELINE_CACHE.clear()
+
 def test_offline_pipeline(project_root=None):
     """測試離線 Pipeline 載入"""
     print("🎯 測試正規離線 Pipeline 載入")
@@ -132,10 +255,8 @@ def test_offline_pipeline(project_root=None):
         
         # 載入 Pipeline
         print("🚀 載入 Pipeline...")
-        pipeline = loader.load_pipeline()
-        
-        # 設定 GPU
-        device_type = loader.setup_gpu_if_available(pipeline)
+        device_type = loader.default_device()
+        pipeline = loader.load_pipeline(device_type)
         print(f"🎮 使用設備: {device_type.upper()}")
         
         # 基本資訊
@@ -4,13 +4,40 @@ Pyannote Speaker Segmentation with Global Speaker Database
 說話人級別分段系統 - 使用官方正規離線方法
 """
 
+from __future__ import annotations
+
 import os
 import sys
+import argparse
+import glob
+import re
+import gc
+import logging
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List, Tuple, Dict, Optional
 
 # 取得專案根目錄
 project_root = Path(__file__).parent.parent
 
+# 添加 src 目錄到路徑
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# 添加專案根目錄到路徑（用於導入 fix_symlinks）
+sys.path.append(str(project_root))
+
+import telemetry
+from autotune import apply_batch_sizes, load_profile, thread_settings
+
+# 環境設定與重量級模組（torch、librosa、pyannote…）在 init_environment() / init_runtime()
+# 才載入，匯入本模組或執行 --help 不會初始化 CUDA
+OFFICIAL_OFFLINE_AVAILABLE = False
+models_dir = project_root / "models" / "huggingface"
+_environment_ready = False
+_runtime_ready = False
+_autotune_profile = None
+
+
 # 載入 .env 檔案
 def load_env_file():
     """載入 .env 檔案中的環境變數"""
@@ -30,88 +57,103 @@ def load_env_file():
     else:
         print(f"⚠️ 找不到 .env 檔案: {env_file}")
 
-# 載入環境變數
-load_env_file()
-
-# 匯入正規離線載入模組
-try:
-    from offline_pipeline import load_offline_pipeline
-    OFFICIAL_OFFLINE_AVAILABLE = True
-    print("🎯 使用官方正規離線方法")
-except ImportError:
-    OFFICIAL_OFFLINE_AVAILABLE = False
-    print("⚠️ 正規離線模組不可用，使用備用方法")
-    
-    # 備用：舊的離線設定
-    models_dir = project_root / "models" / "huggingface"
-    
-    # 強制離線模式環境變數
+
+def init_environment():
+    """載入 .env 與離線模式設定（命令列參數的預設值依賴這些環境變數，只執行一次）"""
+    global OFFICIAL_OFFLINE_AVAILABLE, load_offline_pipeline, clear_pipeline_cache, _environment_ready, _autotune_profile
+    if _environment_ready:
+        return
+    _environment_ready = True
+
+    # 載入環境變數
+    load_env_file()
+
+    # 匯入正規離線載入模組
+    try:
+        from offline_pipeline import load_offline_pipeline, clear_pipeline_cache
+        OFFICIAL_OFFLINE_AVAILABLE = True
+        print("🎯 使用官方正規離線方法")
+    except ImportError:
+        OFFICIAL_OFFLINE_AVAILABLE = False
+        print("⚠️ 正規離線模組不可用，使用備用方法")
+
+        # 備用：舊的離線設定，強制離線模式環境變數
+        os.environ.update({
+            'TRANSFORMERS_OFFLINE': '1',
+            'HUGGINGFACE_HUB_OFFLINE': '1',
+            'HF_HUB_OFFLINE': '1'
+        })
+
+        print(f"🔧 模型目錄: {models_dir}")
+        print(f"🔧 完全離線模式: 已啟用")
+
+    # 記憶體優化設定（須在匯入 torch 之前）；執行緒數以 autotune.py 的本機設定檔為準
+    _autotune_profile = load_profile()
+    threads = thread_settings(_autotune_profile, default_threads=4)
     os.environ.update({
-        'TRANSFORMERS_OFFLINE': '1',
-        'HUGGINGFACE_HUB_OFFLINE': '1',
-        'HF_HUB_OFFLINE': '1'
+        'MKL_SERVICE_FORCE_INTEL': '1',
+        'MKL_THREADING_LAYER': 'GNU',
+        'OMP_NUM_THREADS': str(threads['intra_op']),
+        'MKL_NUM_THREADS': str(threads['intra_op']),
+        'KMP_DUPLICATE_LIB_OK': 'TRUE',
+        'TORCH_WARN': '0'
     })
-    
-    print(f"🔧 模型目錄: {models_dir}")
-    print(f"🔧 完全離線模式: 已啟用")
-
-# 記憶體優化設定
-os.environ.update({
-    'MKL_SERVICE_FORCE_INTEL': '1',
-    'MKL_THREADING_LAYER': 'GNU',
-    'OMP_NUM_THREADS': '4',
-    'MKL_NUM_THREADS': '4',
-    'KMP_DUPLICATE_LIB_OK': 'TRUE',
-    'TORCH_WARN': '0'
-})
-
-import torch
-import numpy as np
-import argparse
-from typing import List, Tuple, Dict
-import librosa
-import soundfile as sf
-from tqdm import tqdm
-import warnings
-import logging
-import gc
 
-# 靜音警告
-warnings.filterwarnings("ignore")
-logging.getLogger("torch").setLevel(logging.ERROR)
-
-# PyTorch 記憶體優化
-torch.set_num_threads(2)
-torch.set_num_interop_threads(1)
-torch.backends.cudnn.benchmark = False
-torch.backends.cudnn.deterministic = True
-
-# GPU 記憶體設定
-if torch.cuda.is_available():
-    print(f"✅ GPU: {torch.cuda.get_device_name(0)}")
-    torch.cuda.empty_cache()
-    gpu_memory = torch.cuda.get_device_properties(0).total_memory / 1024**3
-    print(f"📊 GPU 記憶體: {gpu_memory:.1f}GB (自動管理)")
-else:
-    print("⚠️ 使用 CPU")
 
-# 添加 src 目錄到路徑
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-# 添加專案根目錄到路徑（用於導入 fix_symlinks）
-sys.path.append(str(project_root))
+def init_runtime():
+    """載入 torch、音訊與 pyannote 模組並套用 PyTorch 設定（只執行一次）"""
+    global torch, np, librosa, sf, tqdm, _runtime_ready
+    global SpeakerDatabase, segment_by_speaker_level_approach, Pipeline, Model, ProgressHook, Annotation
+    if _runtime_ready:
+        return
+    init_environment()
+
+    import torch
+    import numpy as np
+    import librosa
+    import soundfile as sf
+    from tqdm import tqdm
+
+    # 靜音警告
+    warnings.filterwarnings("ignore")
+    logging.getLogger("torch").setLevel(logging.ERROR)
+
+    # PyTorch 記憶體優化
+    threads = thread_settings(_autotune_profile, default_threads=2)
+    torch.set_num_threads(threads['intra_op'])
+    torch.set_num_interop_threads(threads['interop'])
+    torch.backends.cudnn.benchmark = False
+    torch.backends.cudnn.deterministic = True
+
+    # GPU 記憶體設定
+    if torch.cuda.is_available():
+        print(f"✅ GPU: {torch.cuda.get_device_name(0)}")
+        torch.cuda.empty_cache()
+        gpu_memory = torch.cuda.get_device_properties(0).total_memory / 1024**3
+        print(f"📊 GPU 記憶體: {gpu_memory:.1f}GB (自動管理)")
+    else:
+        print("⚠️ 使用 CPU")
 
-from speaker_database import SpeakerDatabase
-from speaker_level_segmentation import segment_by_speaker_level_approach
+    from speaker_database import SpeakerDatabase
+    from speaker_level_segmentation import segment_by_speaker_level_approach
+
+    # Pyannote imports
+    try:
+        from pyannote.audio import Pipeline, Model
+        from pyannote.audio.pipelines.utils.hook import ProgressHook
+        from pyannote.core import Annotation
+        print("✅ Pyannote 模組載入成功")
+    except ImportError as e:
+        print(f"❌ Pyannote 載入失敗: {e}")
+        sys.exit(1)
+
+    _runtime_ready = True
 
-# Pyannote imports
-try:
-    from pyannote.audio import Pipeline, Model
-    from pyannote.audio.pipelines.utils.hook import ProgressHook
-    from pyannote.core import Annotation
-    print("✅ Pyannote 模組載入成功")
-except ImportError as e:
-    print(f"❌ Pyannote 載入失敗: {e}")
-    sys.exit(1)
+
+def resolve_device(name: Optional[str] = None) -> torch.device:
+    """--device 未指定時自動選擇 cuda / cpu"""
+    init_runtime()
+    return torch.device(name or ("cuda" if torch.cuda.is_available() else "cpu"))
 
 
 class EmbeddingInference:
@@ -122,6 +164,17 @@ class EmbeddingInference:
         self.model = None
         self.pipeline = pipeline
         self._load_model()
+        if self.model is None:
+            return
+
+        from embedding_quantization import apply_embedding_quantization, get_quantization_mode
+        if get_quantization_mode() != 'none':
+            # EMBEDDING_QUANTIZATION：CPU 上改用 int8 量化模型（pipeline 內的 embedding 不受影響）
+            self.model = apply_embedding_quantization(self.model, self.device)
+        else:
+            # PYANNOTE_INFERENCE_BACKEND：CPU 上改用驗證過的 TorchScript / ONNX 匯出
+            from export_inference_models import apply_inference_backend
+            apply_inference_backend(self.model, 'embedding')
 
     def _load_model(self):
         """載入 embedding 模型"""
@@ -251,8 +304,15 @@ def load_subtitles(subtitle_file: str, fps: float = 30.0) -> List[Tuple[float, s
         return []
 
 
-def perform_speaker_diarization(audio_file: str, pipeline, device: torch.device) -> Annotation:
-    """執行說話人分離"""
+def perform_speaker_diarization(audio_file: str, pipeline, device: torch.device,
+                                waveform_16k: Optional[np.ndarray] = None,
+                                window_seconds: float = 0.0, window_overlap: float = 30.0,
+                                stitch_threshold: float = 0.5, embedding_model=None) -> Annotation:
+    """
+    執行說話人分離（提供 waveform_16k 時直接使用已解碼的音訊）
+
+    window_seconds > 0 且音檔較長時改用分段模式（chunked_diarization），記憶體用量只與視窗長度有關
+    """
     print(f"🎵 處理音檔: {audio_file}")
 
     try:
@@ -267,9 +327,22 @@ def perform_speaker_diarization(audio_file: str, pipeline, device: torch.device)
             cached = torch.cuda.memory_reserved() / 1024**3
             print(f"📊 GPU 記憶體: 已分配 {allocated:.2f}GB, 快取 {cached:.2f}GB")
 
-        print("🚀 執行 diarization...")
-        with ProgressHook() as hook:
-            diarization = pipeline(audio_file, hook=hook)
+        use_windows = False
+        if window_seconds > 0:
+            from chunked_diarization import audio_duration, diarize_chunked
+            use_windows = audio_duration(audio_file, waveform_16k) > window_seconds
+
+        if use_windows:
+            print(f"🚀 執行分段 diarization（視窗 {window_seconds:.0f}s，重疊 {window_overlap:.0f}s）...")
+            diarization = diarize_chunked(pipeline, audio_file, window_seconds, window_overlap,
+                                          stitch_threshold, waveform_16k, embedding_model, device)
+        else:
+            print("🚀 執行 diarization...")
+            audio_input = audio_file
+            if waveform_16k is not None:
+                audio_input = {'waveform': torch.from_numpy(waveform_16k).unsqueeze(0), 'sample_rate': 16000}
+            with ProgressHook() as hook:
+                diarization = pipeline(audio_input, hook=hook)
 
         # 統計結果
         speakers = set()
@@ -295,16 +368,19 @@ def perform_speaker_diarization(audio_file: str, pipeline, device: torch.device)
 
 
 
-def segment_audio_files(segments, audio_path, output_dir, subtitles, episode_num):
-    """分割並儲存音檔"""
+def segment_audio_files(segments, audio_path, output_dir, subtitles, episode_num, decoded: Optional[Dict] = None):
+    """分割並儲存音檔（decoded 為 decode_episode_audio() 預先解碼的結果）"""
     print("📁 分割音檔...")
 
-    try:
-        audio, sr = librosa.load(audio_path, sr=None)
-        print(f"✅ 音檔載入: {len(audio)/sr:.1f}s, {sr}Hz")
-    except Exception as e:
-        print(f"❌ 音檔載入失敗: {e}")
-        return
+    if decoded is not None:
+        audio, sr = decoded['audio'], decoded['sample_rate']
+    else:
+        try:
+            audio, sr = librosa.load(audio_path, sr=None)
+            print(f"✅ 音檔載入: {len(audio)/sr:.1f}s, {sr}Hz")
+        except Exception as e:
+            print(f"❌ 音檔載入失敗: {e}")
+            return
 
     os.makedirs(output_dir, exist_ok=True)
     saved_count = 0
@@ -360,11 +436,17 @@ def segment_audio_files(segments, audio_path, output_dir, subtitles, episode_num
     print(f"✅ 儲存 {saved_count} 個片段到 {output_dir}")
 
 
-def main():
+def build_arg_parser() -> argparse.ArgumentParser:
+    """命令列參數（單次執行與 episode_worker 工作共用）"""
     parser = argparse.ArgumentParser(description="Pyannote Speaker Segmentation")
-    parser.add_argument("audio_file", help="音檔路徑")
-    parser.add_argument("subtitle_file", help="字幕檔路徑")
-    parser.add_argument("--episode_num", type=int, required=True, help="集數")
+    parser.add_argument("audio_file", nargs="?", help="音檔路徑")
+    parser.add_argument("subtitle_file", nargs="?", help="字幕檔路徑")
+    parser.add_argument("--episode_num", type=int, help="集數")
+    parser.add_argument("--batch",
+                        help="批次處理：清單檔（每行 集數<TAB>音檔<TAB>字幕檔）或音檔 glob（集數取自路徑中的「第N集」）")
+    parser.add_argument("--subtitle_pattern",
+                        default=os.path.join(os.environ.get('DEFAULT_INPUT_DIR', 'data/input'), '**', '願望-{episode:03d}.txt'),
+                        help="批次 glob 模式下尋找字幕檔的 glob（{episode} 代入集數）")
     parser.add_argument("--output_dir", default="output", help="輸出目錄")
     parser.add_argument("--min_duration", type=float, default=1.0, help="最小片段長度")
     parser.add_argument("--max_duration", type=float, default=15.0, help="最大片段長度")
@@ -377,52 +459,47 @@ def main():
     parser.add_argument("--min_speaker_duration", type=float, 
                         default=float(os.environ.get('MIN_SPEAKER_DURATION', '5.0')), 
                         help="最小說話人時長")
+    parser.add_argument("--window_seconds", type=float,
+                        default=float(os.environ.get('DIARIZATION_WINDOW_SECONDS', '0')),
+                        help="分段 diarization 的視窗長度（秒，0 = 整檔一次處理）")
+    parser.add_argument("--window_overlap", type=float,
+                        default=float(os.environ.get('DIARIZATION_WINDOW_OVERLAP', '30')),
+                        help="相鄰視窗重疊長度（秒）")
+    parser.add_argument("--stitch_threshold", type=float,
+                        default=float(os.environ.get('DIARIZATION_STITCH_THRESHOLD', '0.5')),
+                        help="跨視窗視為同一說話人的 embedding 相似度閾值")
+    parser.add_argument("--stream_diarization", action="store_true",
+                        default=os.environ.get('DIARIZATION_STREAMING', 'false').lower() == 'true',
+                        help="分段 diarization 時逐視窗串流給說話人分段（需搭配 --window_seconds）")
     parser.add_argument("--force", action="store_true", help="強制重新處理")
-    parser.add_argument("--device", choices=["cpu", "cuda"], 
-                       default="cuda" if torch.cuda.is_available() else "cpu", help="裝置")
+    parser.add_argument("--device", choices=["cpu", "cuda"], default=None,
+                       help="裝置（預設自動偵測，有 GPU 時使用 cuda）")
+    return parser
 
-    args = parser.parse_args()
 
-    device = torch.device(args.device)
-    print(f"🔧 使用裝置: {device}")
+def validate_args(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """單集模式需要音檔、字幕檔與集數；批次模式由清單提供"""
+    if not args.batch and (not args.audio_file or not args.subtitle_file or args.episode_num is None):
+        parser.error("需要 audio_file、subtitle_file 與 --episode_num（或使用 --batch）")
 
-    # 檢查檔案
-    if not os.path.exists(args.audio_file):
-        print(f"❌ 音檔不存在: {args.audio_file}")
-        sys.exit(1)
 
-    if not os.path.exists(args.subtitle_file):
-        print(f"❌ 字幕檔不存在: {args.subtitle_file}")
-        sys.exit(1)
+def load_models(device: torch.device) -> Dict:
+    """
+    載入 diarization pipeline 與 embedding 模型
 
-    # 初始化資料庫
-    print("1. 初始化資料庫...")
-    db_path = os.environ.get('SPEAKERS_DATABASE_PATH', 'data/speakers.db')
-    db = SpeakerDatabase(db_path)
-
-    # 檢查是否已處理
-    processed_episodes = db.get_processed_episodes()
-    if args.episode_num in processed_episodes and not args.force:
-        print(f"⚠️ 集數 {args.episode_num} 已處理過，使用 --force 重新處理")
-        sys.exit(0)
-
-    # 載入字幕
-    print("2. 載入字幕...")
-    subtitles = load_subtitles(args.subtitle_file)
-    if not subtitles:
-        print("❌ 字幕載入失敗")
-        sys.exit(1)
-
-    # 跳過符號連結修復（使用正規離線方法不需要）
-    print("3. 正規離線方法不需要符號連結修復，跳過此步驟...")
+    Returns:
+        Dict: {'pipeline': diarization pipeline, 'embedding': EmbeddingInference}
 
-    # 載入 diarization pipeline
-    print("4. 載入 diarization pipeline...")
+    Raises:
+        Exception: 模型載入失敗
+    """
+    init_runtime()
+    print("載入 diarization pipeline...")
     try:
         if OFFICIAL_OFFLINE_AVAILABLE:
             # 🎯 使用官方正規離線方法
             print("使用官方正規離線載入方法...")
-            diarization_pipeline, device_type = load_offline_pipeline()
+            diarization_pipeline, device_type = load_offline_pipeline(device=device.type)
             print(f"✅ 正規離線 Pipeline 載入成功 ({device_type.upper()})")
             
             # 如果需要指定不同設備
@@ -441,6 +518,10 @@ def main():
             ).to(device)
             print("✅ 備用方法 Pipeline 載入成功")
 
+        from export_inference_models import apply_pipeline_inference_backend
+        apply_pipeline_inference_backend(diarization_pipeline)
+        apply_batch_sizes(diarization_pipeline, device.type, _autotune_profile)
+
         # 記憶體清理
         gc.collect()
         if torch.cuda.is_available():
@@ -452,15 +533,9 @@ def main():
             print("💡 正規方法載入失敗，請檢查 models/config.yaml 和模型檔案")
         else:
             print(f"💡 快取目錄: {models_dir}")
-        sys.exit(1)
-
-    # 執行 diarization
-    print("5. 執行 speaker diarization...")
-    diarization = perform_speaker_diarization(args.audio_file, diarization_pipeline, device)
+        raise
 
-    # 載入 embedding model (在釋放 pipeline 前)
-    print("6. 載入 embedding 模型...")
-    
+    print("載入 embedding 模型...")
     try:
         # 🎯 在所有模式下都載入 embedding 模型，因為後續處理需要用到
         embedding_inference = EmbeddingInference(device, pipeline=diarization_pipeline if OFFICIAL_OFFLINE_AVAILABLE else None)
@@ -469,32 +544,181 @@ def main():
             torch.cuda.empty_cache()
     except Exception as e:
         print(f"❌ Embedding 模型載入失敗: {e}")
-        sys.exit(1)
+        raise
 
-    # 釋放 pipeline 記憶體
-    print("🧹 釋放 pipeline 記憶體...")
-    del diarization_pipeline
+    return {'pipeline': diarization_pipeline, 'embedding': embedding_inference}
+
+
+def release_memory():
+    """釋放 Python 與 GPU 快取記憶體"""
     for _ in range(3):
         gc.collect()
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
 
-    # 執行說話人級別分段
-    print("7. 執行說話人級別分段...")
+
+def decode_episode_audio(audio_file: str) -> Dict:
+    """解碼整集音檔：原始取樣率供切割輸出，16kHz 供 diarization 與 embedding 使用"""
+    with telemetry.span('decode', audio_file=os.path.basename(audio_file)):
+        audio, sr = librosa.load(audio_file, sr=None)
+        audio_16k = audio if sr == 16000 else librosa.resample(audio, orig_sr=sr, target_sr=16000)
+    return {'audio': audio, 'sample_rate': sr, 'audio_16k': audio_16k.astype(np.float32)}
+
+
+def _episode_from_path(path: str) -> Optional[int]:
+    """從路徑取得集數（「第N集」，否則為上層目錄名稱中的最後一個數字）"""
+    match = re.search(r'第(\d+)集', path)
+    if match:
+        return int(match.group(1))
+    numbers = re.findall(r'\d+', os.path.basename(os.path.dirname(path)))
+    return int(numbers[-1]) if numbers else None
+
+
+def load_batch_jobs(batch: str, subtitle_pattern: str) -> List[Dict]:
+    """
+    解析批次輸入
+
+    Args:
+        batch: 清單檔（每行 集數<TAB>音檔<TAB>字幕檔，# 開頭為註解）或音檔 glob
+        subtitle_pattern: glob 模式下的字幕檔 glob，{episode} 代入集數
+
+    Returns:
+        List[Dict]: 依集數排序的工作（episode_num/audio_file/subtitle_file）
+    """
+    jobs = []
+    if os.path.isfile(batch) and not batch.endswith(('.wav', '.mp3', '.flac', '.m4a')):
+        with open(batch, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line.strip() or line.startswith('#'):
+                    continue
+                fields = line.split('\t') if '\t' in line else line.split()
+                if len(fields) != 3:
+                    print(f"⚠️ 略過格式錯誤的行: {line}")
+                    continue
+                jobs.append({'episode_num': int(fields[0]), 'audio_file': fields[1], 'subtitle_file': fields[2]})
+    else:
+        for audio_file in sorted(glob.glob(batch, recursive=True)):
+            episode_num = _episode_from_path(audio_file)
+            if episode_num is None:
+                print(f"⚠️ 無法從路徑判斷集數，略過: {audio_file}")
+                continue
+            subtitles = sorted(glob.glob(subtitle_pattern.format(episode=episode_num), recursive=True))
+            if not subtitles:
+                print(f"⚠️ 找不到第 {episode_num} 集的字幕檔，略過")
+                continue
+            jobs.append({'episode_num': episode_num, 'audio_file': audio_file, 'subtitle_file': subtitles[0]})
+
+    return sorted(jobs, key=lambda job: job['episode_num'])
+
+
+def is_episode_processed(db: SpeakerDatabase, episode_num: int) -> bool:
+    """集數是否已記錄為處理完成"""
+    return episode_num in db.get_processed_episodes()
+
+
+def process_episode(args: argparse.Namespace, db: SpeakerDatabase, models: Dict,
+                    device: torch.device, release_pipeline: bool = False,
+                    decoded: Optional[Dict] = None) -> int:
+    """
+    處理單集：diarization → 說話人級別分段 → 輸出 LibriTTS 格式
+
+    Args:
+        args: build_arg_parser() 解析後的參數
+        db: 說話人資料庫
+        models: load_models() 的結果
+        device: 運算裝置
+        release_pipeline: diarization 後釋放 pipeline（單次執行時節省記憶體）
+        decoded: decode_episode_audio() 預先解碼的音訊（None = 各步驟自行讀取音檔）
+
+    Returns:
+        int: 結束碼（0 = 成功或已處理過，1 = 失敗）
+    """
+    # 檢查檔案
+    if not os.path.exists(args.audio_file):
+        print(f"❌ 音檔不存在: {args.audio_file}")
+        return 1
+
+    if not os.path.exists(args.subtitle_file):
+        print(f"❌ 字幕檔不存在: {args.subtitle_file}")
+        return 1
+
+    # 檢查是否已處理
+    if is_episode_processed(db, args.episode_num) and not args.force:
+        print(f"⚠️ 集數 {args.episode_num} 已處理過，使用 --force 重新處理")
+        return 0
+
+    # 載入字幕
+    print("載入字幕...")
+    subtitles = load_subtitles(args.subtitle_file)
+    if not subtitles:
+        print("❌ 字幕載入失敗")
+        return 1
+
+    waveform_16k = decoded['audio_16k'] if decoded else None
+    embedding_inference = models['embedding']
     embedding_model = embedding_inference.model if embedding_inference else None
-    segments, local_to_global_map = segment_by_speaker_level_approach(
-        diarization, subtitles, args.audio_file, embedding_model, device,
-        db, args.episode_num, args.min_duration, args.max_duration,
-        args.similarity_threshold, args.min_speaker_duration
-    )
+
+    streaming = False
+    if args.stream_diarization and args.window_seconds > 0 and embedding_model is not None:
+        from chunked_diarization import audio_duration
+        streaming = audio_duration(args.audio_file, waveform_16k) > args.window_seconds
+
+    if streaming:
+        # 串流模式：diarization 每完成一個視窗，下游立即收集說話人音訊並提取 embedding
+        from chunked_diarization import iter_chunked_diarization, prefetch_windows
+        from speaker_level_segmentation import segment_by_speaker_level_streaming
+
+        print(f"執行串流 diarization 與說話人級別分段（視窗 {args.window_seconds:.0f}s，"
+              f"重疊 {args.window_overlap:.0f}s）...")
+        with telemetry.span('diarize_segment', window_seconds=args.window_seconds):
+            windows = prefetch_windows(iter_chunked_diarization(
+                models['pipeline'], args.audio_file, args.window_seconds, args.window_overlap,
+                args.stitch_threshold, waveform_16k, embedding_model, device, include_audio=True))
+            segments, local_to_global_map, _ = segment_by_speaker_level_streaming(
+                windows, subtitles, embedding_model, device,
+                db, args.episode_num, args.min_duration, args.max_duration,
+                args.similarity_threshold, args.min_speaker_duration
+            )
+        if release_pipeline:
+            print("🧹 釋放 pipeline 記憶體...")
+            del models['pipeline']
+            if OFFICIAL_OFFLINE_AVAILABLE:
+                clear_pipeline_cache()
+            release_memory()
+    else:
+        # 執行 diarization
+        print("執行 speaker diarization...")
+        with telemetry.span('diarize', window_seconds=args.window_seconds):
+            diarization = perform_speaker_diarization(
+                args.audio_file, models['pipeline'], device, waveform_16k,
+                args.window_seconds, args.window_overlap, args.stitch_threshold, embedding_model)
+
+        if release_pipeline:
+            # 釋放 pipeline 記憶體
+            print("🧹 釋放 pipeline 記憶體...")
+            del models['pipeline']
+            if OFFICIAL_OFFLINE_AVAILABLE:
+                clear_pipeline_cache()
+            release_memory()
+
+        # 執行說話人級別分段
+        print("執行說話人級別分段...")
+        with telemetry.span('segment'):
+            segments, local_to_global_map = segment_by_speaker_level_approach(
+                diarization, subtitles, args.audio_file, embedding_model, device,
+                db, args.episode_num, args.min_duration, args.max_duration,
+                args.similarity_threshold, args.min_speaker_duration, waveform_16k
+            )
     print(f"✅ 建立 {len(segments)} 個分段")
 
     if not segments:
         print("❌ 沒有有效分段")
-        sys.exit(1)
+        return 1
 
     # 分割音檔
-    segment_audio_files(segments, args.audio_file, args.output_dir, subtitles, args.episode_num)
+    with telemetry.span('write', segments=len(segments)):
+        segment_audio_files(segments, args.audio_file, args.output_dir, subtitles, args.episode_num, decoded)
 
     # 標記為已處理
     db.mark_episode_processed(args.episode_num)
@@ -520,6 +744,117 @@ def main():
 
     print(f"\n✅ 處理完成！")
     print(f"輸出目錄: {args.output_dir}")
+    return 0
+
+
+def run_batch(args: argparse.Namespace, db: SpeakerDatabase, models: Dict, device: torch.device) -> int:
+    """
+    批次處理多集：共用已載入的模型，處理目前集數時於背景解碼下一集音檔
+
+    Returns:
+        int: 結束碼（0 = 全部成功或已處理過，1 = 有集數失敗）
+    """
+    jobs = load_batch_jobs(args.batch, args.subtitle_pattern)
+    if not args.force:
+        processed = set(db.get_processed_episodes())
+        skipped = [job['episode_num'] for job in jobs if job['episode_num'] in processed]
+        if skipped:
+            print(f"⚠️ 略過已處理的集數: {skipped}（使用 --force 重新處理）")
+        jobs = [job for job in jobs if job['episode_num'] not in processed]
+    if not jobs:
+        print("沒有需要處理的集數")
+        return 0
+
+    print(f"📋 批次處理 {len(jobs)} 集: {[job['episode_num'] for job in jobs]}")
+    results = {}
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        pending = prefetcher.submit(decode_episode_audio, jobs[0]['audio_file'])
+        for index, job in enumerate(jobs):
+            try:
+                decoded = pending.result()
+            except Exception as e:
+                print(f"⚠️ 預先解碼失敗，改為直接讀取音檔: {e}")
+                decoded = None
+            if index + 1 < len(jobs):
+                pending = prefetcher.submit(decode_episode_audio, jobs[index + 1]['audio_file'])
+
+            print("\n" + "=" * 60)
+            print(f"🎬 第 {job['episode_num']} 集 ({index + 1}/{len(jobs)})")
+            print("=" * 60)
+            episode_args = argparse.Namespace(**{**vars(args), **job})
+            try:
+                with telemetry.span('episode', episode=job['episode_num']):
+                    results[job['episode_num']] = process_episode(episode_args, db, models, device, decoded=decoded)
+            except Exception as e:
+                print(f"❌ 第 {job['episode_num']} 集處理失敗: {e}")
+                results[job['episode_num']] = 1
+            del decoded
+            release_memory()
+
+    failed = [episode for episode, code in results.items() if code != 0]
+    print(f"\n📊 批次完成: {len(results) - len(failed)} 成功, {len(failed)} 失敗")
+    if failed:
+        print(f"❌ 失敗集數: {failed}")
+    return 1 if failed else 0
+
+
+def main():
+    init_environment()
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    validate_args(parser, args)
+
+    device = resolve_device(args.device)
+    print(f"🔧 使用裝置: {device}")
+    telemetry.start_run('pyannote_speaker_segmentation', device=device.type,
+                        episode=None if args.batch else args.episode_num, batch=args.batch)
+
+    if args.batch:
+        db = SpeakerDatabase(os.environ.get('SPEAKERS_DATABASE_PATH', 'data/speakers.db'))
+        try:
+            with telemetry.span('load_models'):
+                models = load_models(device)
+        except Exception:
+            telemetry.end_run('error')
+            sys.exit(1)
+        with db.session():
+            exit_code = run_batch(args, db, models, device)
+        telemetry.end_run('ok' if exit_code == 0 else 'error')
+        sys.exit(exit_code)
+
+    # 檢查檔案
+    if not os.path.exists(args.audio_file):
+        print(f"❌ 音檔不存在: {args.audio_file}")
+        sys.exit(1)
+
+    if not os.path.exists(args.subtitle_file):
+        print(f"❌ 字幕檔不存在: {args.subtitle_file}")
+        sys.exit(1)
+
+    # 初始化資料庫
+    print("1. 初始化資料庫...")
+    db_path = os.environ.get('SPEAKERS_DATABASE_PATH', 'data/speakers.db')
+    db = SpeakerDatabase(db_path)
+
+    # 已處理的集數不需載入模型
+    if is_episode_processed(db, args.episode_num) and not args.force:
+        print(f"⚠️ 集數 {args.episode_num} 已處理過，使用 --force 重新處理")
+        sys.exit(0)
+
+    # 載入模型
+    print("2. 載入模型...")
+    try:
+        with telemetry.span('load_models'):
+            models = load_models(device)
+    except Exception:
+        telemetry.end_run('error')
+        sys.exit(1)
+
+    print("3. 處理集數...")
+    with db.session(), telemetry.span('episode', episode=args.episode_num):
+        exit_code = process_episode(args, db, models, device, release_pipeline=True)
+    telemetry.end_run('ok' if exit_code == 0 else 'error')
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
@@ -7,23 +7,67 @@ Manages speaker embeddings and identification using SQLite
 import sqlite3
 import numpy as np
 import json
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
-import torch
-import torch.nn.functional as F
 from datetime import datetime
 
 
+def cosine_similarities(query: np.ndarray, matrix: np.ndarray, eps: float = 1e-8) -> np.ndarray:
+    """Cosine similarity between one vector and each row of a matrix
+    
+    Matches torch.nn.functional.cosine_similarity: each norm is clamped to eps.
+    """
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, query.shape[0])
+    query_norm = max(float(np.linalg.norm(query)), eps)
+    row_norms = np.maximum(np.linalg.norm(matrix, axis=1), eps)
+    return (matrix @ query) / (row_norms * query_norm)
+
+
 class SpeakerDatabase:
     """SQLite-based speaker database for embedding storage and matching"""
     
     def __init__(self, db_path: str = "data/speakers.db"):
         self.db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
         self.init_database()
     
+    @contextmanager
+    def _connect(self):
+        """Yield a connection: the session connection when one is open, otherwise a short-lived one.
+        
+        Each block commits on success and rolls back on error.
+        """
+        if self._conn is not None:
+            with self._conn:
+                yield self._conn
+            return
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    @contextmanager
+    def session(self):
+        """Keep one connection open for all reads and writes inside the block (batch processing)"""
+        if self._conn is not None:
+            yield self
+            return
+        
+        self._conn = sqlite3.connect(self.db_path)
+        try:
+            yield self
+        finally:
+            self._conn.close()
+            self._conn = None
+    
     def init_database(self):
         """Initialize the speaker database with required tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Create speakers table
@@ -84,7 +128,7 @@ class SpeakerDatabase:
     
     def add_speaker(self, embedding: np.ndarray, episode_num: int, local_label: str, segment_count: int = 0) -> int:
         """Add a new speaker to the database and return the speaker_id"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Ensure embedding is float32 for consistency
@@ -130,66 +174,45 @@ class SpeakerDatabase:
         Returns:
             Tuple of (speaker_id, similarity) or (None, max_similarity)
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Get all speakers with their embeddings
-            cursor.execute("SELECT speaker_id, embedding, embedding_dim FROM speakers")
-            speakers = cursor.fetchall()
-            
-            print(f"       🔍 資料庫中有 {len(speakers)} 個說話人進行比對")
-            
-            if not speakers:
-                print(f"       ⚠️ 資料庫為空，無法進行匹配")
-                return None, 0.0
-            
-            # Ensure input embedding is float32
-            embedding = embedding.astype(np.float32)
-            current_embedding_tensor = torch.tensor(embedding).unsqueeze(0)
-            
-            max_similarity = 0.0
-            best_speaker_id = None
-            similarity_details = []
+        speaker_ids, stored = self.get_speaker_embeddings()
+        
+        print(f"       🔍 資料庫中有 {len(speaker_ids)} 個說話人進行比對")
+        
+        if not speaker_ids:
+            print(f"       ⚠️ 資料庫為空，無法進行匹配")
+            return None, 0.0
+        
+        # Ensure input embedding is a flat float32 vector
+        embedding = embedding.astype(np.float32)
+        query = embedding.reshape(-1)
+        
+        # Cosine similarity against all stored speakers at once
+        similarities = cosine_similarities(query, stored)
+        similarity_details = list(zip(speaker_ids, similarities.tolist()))
+        
+        best_index = int(np.argmax(similarities))
+        max_similarity = max(0.0, float(similarities[best_index]))
+        best_speaker_id = speaker_ids[best_index] if similarities[best_index] > 0.0 else None
+        
+        # 顯示所有相似度詳情
+        print(f"       📊 相似度詳情 (閾值: {similarity_threshold:.3f}):")
+        for speaker_id, sim in sorted(similarity_details, key=lambda x: x[1], reverse=True)[:5]:
+            status = "✅ 匹配" if sim > similarity_threshold else "❌ 未達閾值"
+            print(f"         Speaker {speaker_id}: {sim:.3f} {status}")
+        
+        if max_similarity > similarity_threshold:
+            print(f"       🎯 匹配成功! Global Speaker ID: {best_speaker_id} (相似度: {max_similarity:.3f})")
             
-            # Compare with each stored speaker
-            for speaker_id, embedding_bytes, embedding_dim in speakers:
-                stored_embedding = self._deserialize_embedding(embedding_bytes, embedding_dim)
-                stored_tensor = torch.tensor(stored_embedding).unsqueeze(0)
-                
-                # Compute cosine similarity
-                similarity_tensor = F.cosine_similarity(current_embedding_tensor, stored_tensor)
-                try:
-                    similarity = float(similarity_tensor.item())
-                except (RuntimeError, ValueError):
-                    # Handle multi-dimensional tensor
-                    similarity_np = similarity_tensor.squeeze().cpu().numpy()
-                    similarity = float(similarity_np.flatten()[0])
-                
-                similarity_details.append((speaker_id, similarity))
-                
-                if similarity > max_similarity:
-                    max_similarity = similarity
-                    best_speaker_id = speaker_id
-            
-            # 顯示所有相似度詳情
-            print(f"       📊 相似度詳情 (閾值: {similarity_threshold:.3f}):")
-            for speaker_id, sim in sorted(similarity_details, key=lambda x: x[1], reverse=True)[:5]:
-                status = "✅ 匹配" if sim > similarity_threshold else "❌ 未達閾值"
-                print(f"         Speaker {speaker_id}: {sim:.3f} {status}")
-            
-            if max_similarity > similarity_threshold:
-                print(f"       🎯 匹配成功! Global Speaker ID: {best_speaker_id} (相似度: {max_similarity:.3f})")
-                
-                # Update embedding if requested
-                if update_embedding and best_speaker_id is not None:
-                    self.update_speaker_embedding(best_speaker_id, embedding, update_weight)
-                
-                return best_speaker_id, max_similarity
-            else:
-                print(f"       ❌ 無匹配說話人 (最高相似度: {max_similarity:.3f} < 閾值: {similarity_threshold:.3f})")
+            # Update embedding if requested
+            if update_embedding and best_speaker_id is not None:
+                self.update_speaker_embedding(best_speaker_id, embedding, update_weight)
             
-            return None, max_similarity
-    
+            return best_speaker_id, max_similarity
+        else:
+            print(f"       ❌ 無匹配說話人 (最高相似度: {max_similarity:.3f} < 閾值: {similarity_threshold:.3f})")
+        
+        return None, max_similarity
+
     def update_speaker_embedding(self, speaker_id: int, new_embedding: np.ndarray, new_weight: float = 1.0) -> bool:
         """Update speaker embedding using weighted average
         
@@ -201,7 +224,7 @@ class SpeakerDatabase:
         Returns:
             bool: True if update successful, False otherwise
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Get current speaker data
@@ -247,7 +270,7 @@ class SpeakerDatabase:
     
     def update_speaker_episode(self, speaker_id: int, episode_num: int, local_label: str, segment_count: int = 0):
         """Record that a speaker appeared in an episode"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Update or insert episode record
@@ -274,7 +297,7 @@ class SpeakerDatabase:
     
     def get_speaker_info(self, speaker_id: int) -> Optional[Dict]:
         """Get detailed information about a speaker"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Get speaker details
@@ -319,7 +342,7 @@ class SpeakerDatabase:
     
     def list_all_speakers(self) -> List[Dict]:
         """Get summary of all speakers"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -346,9 +369,24 @@ class SpeakerDatabase:
                 for speaker in speakers
             ]
     
+    def get_speaker_embeddings(self) -> Tuple[List[int], np.ndarray]:
+        """Get all speaker IDs and their embeddings as one (n_speakers, dim) matrix"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT speaker_id, embedding, embedding_dim FROM speakers ORDER BY speaker_id")
+            speakers = cursor.fetchall()
+        
+        if not speakers:
+            return [], np.empty((0, 0), dtype=np.float32)
+        
+        speaker_ids = [speaker_id for speaker_id, _, _ in speakers]
+        embeddings = np.stack([self._deserialize_embedding(embedding_bytes, embedding_dim)
+                               for _, embedding_bytes, embedding_dim in speakers])
+        return speaker_ids, embeddings
+    
     def get_processed_episodes(self) -> List[int]:
         """Get list of processed episodes"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -367,7 +405,7 @@ class SpeakerDatabase:
             processed.append(episode_num)
             processed.sort()
             
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT OR REPLACE INTO processing_state (key, value, updated_at)
@@ -377,7 +415,7 @@ class SpeakerDatabase:
     
     def get_episode_speaker_mapping(self, episode_num: int) -> Dict[str, int]:
         """Get local to global speaker mapping for an episode"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -390,7 +428,7 @@ class SpeakerDatabase:
     
     def get_database_stats(self) -> Dict:
         """Get database statistics"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Total speakers
@@ -430,7 +468,7 @@ class SpeakerDatabase:
             speaker_info = self.get_speaker_info(speaker_id)
             if speaker_info:
                 # Convert embedding to list for JSON serialization
-                with sqlite3.connect(self.db_path) as conn:
+                with self._connect() as conn:
                     cursor = conn.cursor()
                     cursor.execute("SELECT embedding, embedding_dim FROM speakers WHERE speaker_id = ?", (speaker_id,))
                     embedding_bytes, dim = cursor.fetchone()
@@ -479,7 +517,7 @@ def migrate_from_json(json_path: str, db_path: str = "data/speakers.db"):
             first_episode = processed_episodes[0] if processed_episodes else 1
         
         # Add speaker to database
-        with sqlite3.connect(db.db_path) as conn:
+        with db._connect() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO speakers (speaker_id, embedding, embedding_dim, notes)
@@ -15,6 +15,11 @@ import soundfile as sf
 from pyannote.core import Annotation, Segment
 from collections import defaultdict
 
+try:
+    from src import telemetry
+except ImportError:
+    import telemetry
+
 
 def segment_by_speaker_level_approach(
     diarization: Annotation,
@@ -27,7 +32,8 @@ def segment_by_speaker_level_approach(
     min_duration: float = 1.0,
     max_duration: float = 15.0,
     similarity_threshold: float = 0.40,
-    min_speaker_duration: float = 5.0
+    min_speaker_duration: float = 5.0,
+    waveform_16k: Optional[np.ndarray] = None
 ) -> Tuple[List[Tuple[float, float, int]], Dict[str, int]]:
     """
     說話人級別分段方法：兩階段說話人識別
@@ -41,6 +47,8 @@ def segment_by_speaker_level_approach(
     1. 將說話人 embedding 與資料庫比對
     2. 分配 Global Speaker ID
     3. 根據字幕時間點生成最終分段
+
+    waveform_16k: 已解碼的 16kHz 單聲道音訊（批次模式預先載入；None = 從 audio_path 讀取）
     """
     
     if not subtitles:
@@ -66,27 +74,159 @@ def segment_by_speaker_level_approach(
         print(f"   🗑️ 過濾了 {filtered_count} 個說話時間太短的說話人 (< {min_speaker_duration}s)")
     
     # 為每個說話人提取 embedding
-    speaker_embeddings = extract_speaker_level_embeddings(
-        valid_speakers, audio_path, embedding_model, device
-    )
+    with telemetry.span('embed', speakers=len(valid_speakers)):
+        speaker_embeddings = extract_speaker_level_embeddings(
+            valid_speakers, audio_path, embedding_model, device, waveform_16k
+        )
     print(f"   🧬 成功提取了 {len(speaker_embeddings)} 個說話人的 embedding")
     
     # 階段2：跨集說話人匹配
     print("   🔍 階段2：跨集說話人匹配")
-    local_to_global_map = assign_global_speaker_ids_by_embedding(
-        speaker_embeddings, valid_speakers, db, episode_num, similarity_threshold
-    )
+    with telemetry.span('match', speakers=len(speaker_embeddings)):
+        local_to_global_map = assign_global_speaker_ids_by_embedding(
+            speaker_embeddings, valid_speakers, db, episode_num, similarity_threshold
+        )
     
     # 生成最終分段（基於字幕時間點）
     print("   📝 生成最終分段")
-    final_segments = generate_final_segments_with_subtitles(
-        subtitles, diarization, local_to_global_map, min_duration, max_duration
-    )
+    with telemetry.span('subtitle_segments', subtitles=len(subtitles)):
+        final_segments = generate_final_segments_with_subtitles(
+            subtitles, diarization, local_to_global_map, min_duration, max_duration
+        )
     
     print(f"   ✅ 最終產生 {len(final_segments)} 個有效段落")
     return final_segments, local_to_global_map
 
 
+class SpeakerAccumulator:
+    """
+    串流模式的階段1：逐視窗收集各說話人的片段並提取 embedding
+
+    每個視窗結束時，語音累積達 min_embedding_seconds 的說話人立即提取一次 embedding，
+    不足的音訊留到下一個視窗一起處理；整集結束後以語音時長加權平均得到說話人 embedding。
+    只保留尚未提取的音訊，記憶體不隨集數長度增加
+    """
+
+    def __init__(self, embedding_model, device: torch.device, sr: int = 16000,
+                 min_embedding_seconds: float = 1.0):
+        self.embedding_model = embedding_model
+        self.device = device
+        self.sr = sr
+        self.min_samples = int(min_embedding_seconds * sr)
+        self.segments: Dict[str, List[Segment]] = defaultdict(list)
+        self.pending: Dict[str, List[np.ndarray]] = defaultdict(list)
+        self.embedding_sums: Dict[str, np.ndarray] = {}
+        self.embedding_weights: Dict[str, float] = defaultdict(float)
+
+    def add_window(self, annotation: Annotation, audio: np.ndarray, offset: float):
+        """加入一個視窗已定案的片段（audio 為該視窗從 offset 起算的 16kHz 音訊）"""
+        for turn, _, speaker in annotation.itertracks(yield_label=True):
+            self.segments[speaker].append(turn)
+            local = Segment(turn.start - offset, turn.end - offset)
+            piece = combine_speaker_audio_segments(audio, self.sr, [local])
+            if piece.size:
+                self.pending[speaker].append(piece)
+
+        for speaker in list(self.pending):
+            if sum(piece.size for piece in self.pending[speaker]) >= self.min_samples:
+                self._flush(speaker)
+
+    def _flush(self, speaker: str):
+        combined = np.concatenate(self.pending.pop(speaker))
+        embedding = extract_embedding_from_audio(combined, self.embedding_model, self.device)
+        if embedding is None:
+            return
+        weight = combined.size / self.sr
+        embedding = embedding.astype(np.float64)
+        weighted = embedding / max(np.linalg.norm(embedding), 1e-8) * weight
+        self.embedding_sums[speaker] = self.embedding_sums.get(speaker, 0.0) + weighted
+        self.embedding_weights[speaker] += weight
+
+    def finalize(self, min_speaker_duration: float) -> Tuple[Dict[str, List[Segment]], Dict[str, np.ndarray]]:
+        """
+        整集結束：處理剩餘音訊，回傳 (說話時間足夠的說話人片段, 說話人 embedding)
+        """
+        for speaker in list(self.pending):
+            # 剩餘音訊太短時只用於還沒有 embedding 的說話人
+            if (sum(piece.size for piece in self.pending[speaker]) >= self.min_samples
+                    or speaker not in self.embedding_sums):
+                self._flush(speaker)
+        self.pending.clear()
+
+        valid_speakers = {speaker: segments for speaker, segments in self.segments.items()
+                          if calculate_total_duration(segments) >= min_speaker_duration}
+        embeddings = {}
+        for speaker in valid_speakers:
+            if self.embedding_weights.get(speaker):
+                mean = self.embedding_sums[speaker] / self.embedding_weights[speaker]
+                embeddings[speaker] = (mean / max(np.linalg.norm(mean), 1e-8)).astype(np.float32)
+        return valid_speakers, embeddings
+
+
+def segment_by_speaker_level_streaming(
+    windows,
+    subtitles: List[Tuple[float, str]],
+    embedding_model,
+    device: torch.device,
+    db,
+    episode_num: int,
+    min_duration: float = 1.0,
+    max_duration: float = 15.0,
+    similarity_threshold: float = 0.40,
+    min_speaker_duration: float = 5.0
+) -> Tuple[List[Tuple[float, float, int]], Dict[str, int], Annotation]:
+    """
+    串流版說話人級別分段：diarization 每完成一個視窗就收集說話人音訊並提取 embedding，
+    跨集匹配（階段2）與字幕分段仍等整集完成後才進行
+
+    windows: chunked_diarization.iter_chunked_diarization(include_audio=True) 產出的視窗
+
+    Returns:
+        (最終分段, 本地 → Global Speaker ID, 整集 diarization)
+    """
+    try:
+        from src.chunked_diarization import merge_annotations
+    except ImportError:
+        from chunked_diarization import merge_annotations
+
+    print("   📊 階段1：逐視窗收集說話人音訊並提取 embedding")
+    accumulator = SpeakerAccumulator(embedding_model, device)
+    pieces = []
+    for window in windows:
+        with telemetry.span('embed', window=window['index']):
+            accumulator.add_window(window['annotation'], window['audio'], window['start'])
+        pieces.append(window['annotation'])
+
+    diarization = merge_annotations(pieces)
+    if not subtitles:
+        print("   ❌ 沒有字幕資料")
+        return [], {}, diarization
+    if not diarization:
+        print("   ❌ 沒有 diarization 結果")
+        return [], {}, diarization
+
+    with telemetry.span('embed', window='final'):
+        valid_speakers, speaker_embeddings = accumulator.finalize(min_speaker_duration)
+    filtered_count = len(accumulator.segments) - len(valid_speakers)
+    if filtered_count > 0:
+        print(f"   🗑️ 過濾了 {filtered_count} 個說話時間太短的說話人 (< {min_speaker_duration}s)")
+    print(f"   🧬 成功提取了 {len(speaker_embeddings)} 個說話人的 embedding")
+
+    print("   🔍 階段2：跨集說話人匹配")
+    with telemetry.span('match', speakers=len(speaker_embeddings)):
+        local_to_global_map = assign_global_speaker_ids_by_embedding(
+            speaker_embeddings, valid_speakers, db, episode_num, similarity_threshold
+        )
+
+    print("   📝 生成最終分段")
+    with telemetry.span('subtitle_segments', subtitles=len(subtitles)):
+        final_segments = generate_final_segments_with_subtitles(
+            subtitles, diarization, local_to_global_map, min_duration, max_duration
+        )
+    print(f"   ✅ 最終產生 {len(final_segments)} 個有效段落")
+    return final_segments, local_to_global_map, diarization
+
+
 def extract_speaker_segments_from_diarization(
     diarization: Annotation, 
     audio_path: str
@@ -119,18 +259,23 @@ def extract_speaker_level_embeddings(
     speaker_segments: Dict[str, List[Segment]],
     audio_path: str,
     embedding_model,
-    device: torch.device
+    device: torch.device,
+    waveform_16k: Optional[np.ndarray] = None
 ) -> Dict[str, np.ndarray]:
     """
     為每個說話人提取代表性的 embedding
     使用完整的說話段落而非短片段
     """
-    print("   🔊 載入音檔進行 embedding 提取...")
-    try:
-        waveform, sr = librosa.load(audio_path, sr=16000)
-    except Exception as e:
-        print(f"   ❌ 無法載入音檔: {e}")
-        return {}
+    sr = 16000
+    if waveform_16k is not None:
+        waveform = waveform_16k
+    else:
+        print("   🔊 載入音檔進行 embedding 提取...")
+        try:
+            waveform, sr = librosa.load(audio_path, sr=16000)
+        except Exception as e:
+            print(f"   ❌ 無法載入音檔: {e}")
+            return {}
     
     speaker_embeddings = {}
     
@@ -3,11 +3,310 @@ Split dataset into train and test sets
 """
 
 import os
+import json
 import shutil
 import random
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import argparse
-from typing import List, Dict, Tuple
+from typing import Iterator, List, Dict, Optional, Tuple
+
+try:
+    import soundfile as sf
+except ImportError:
+    sf = None
+
+try:
+    from src import telemetry
+except ImportError:
+    import telemetry
+
+LINK_MODES = ("copy", "hardlink", "symlink", "reflink")
+
+SPLIT_SUBSETS = ("train", "test")
+SPLITS_INFO_FILENAME = "splits.json"
+SPLIT_STATE_FILENAME = "split_state.json"
+SPLIT_ASSIGNMENTS_FILENAME = "split_assignments.jsonl"
+MANIFEST_FIELDS = ("id", "path", "speaker", "episode", "duration", "text")
+
+# Linux FICLONE ioctl (_IOW(0x94, 9, int)): share extents on btrfs/XFS without copying data
+FICLONE = 0x40049409
+
+_fallback_lock = threading.Lock()
+_fallback_warned = set()
+
+
+def _warn_fallback(link_mode: str, error: OSError):
+    """Print a one-time warning when a link mode falls back to copying."""
+    with _fallback_lock:
+        if link_mode in _fallback_warned:
+            return
+        _fallback_warned.add(link_mode)
+    print(f"⚠️  {link_mode} 無法使用 ({error})，改用複製")
+
+
+def copy_file(src: str, dst: str):
+    """Copy file contents with in-kernel transfer (copy_file_range, then sendfile).
+
+    Only the data is copied; no permission or metadata copy, which fails on some mounted volumes.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+
+        if hasattr(os, "copy_file_range"):
+            try:
+                while remaining > 0:
+                    copied = os.copy_file_range(in_fd, out_fd, remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                return
+            except OSError:
+                pass  # e.g. cross-filesystem on older kernels; continue at current offsets
+
+        if hasattr(os, "sendfile"):
+            try:
+                offset = fsrc.tell()
+                while remaining > 0:
+                    sent = os.sendfile(out_fd, in_fd, offset, remaining)
+                    if sent == 0:
+                        break
+                    offset += sent
+                    remaining -= sent
+                return
+            except OSError:
+                fsrc.seek(offset)
+
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+
+
+def _reflink(src: str, dst: str):
+    """Clone file extents (copy-on-write) via the FICLONE ioctl."""
+    import fcntl
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def place_file(src: str, dst: str, link_mode: str = "copy"):
+    """Place src at dst by copying or linking; falls back to copying when linking is unsupported.
+
+    An existing dst is removed first so a previous hardlink to src is never written through.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    try:
+        if link_mode == "hardlink":
+            os.link(src, dst)
+            return
+        if link_mode == "symlink":
+            os.symlink(os.path.abspath(src), dst)
+            return
+        if link_mode == "reflink":
+            _reflink(src, dst)
+            return
+    except (OSError, ImportError) as e:
+        _warn_fallback(link_mode, e)
+        if os.path.lexists(dst):
+            os.remove(dst)
+
+    copy_file(src, dst)
+
+
+def place_files(pairs: List[Tuple[str, str]], link_mode: str = "copy", max_workers: int = 8):
+    """Place many (src, dst) pairs in parallel, creating destination directories as needed."""
+    for dst_dir in {os.path.dirname(dst) for _, dst in pairs}:
+        os.makedirs(dst_dir, exist_ok=True)
+
+    if max_workers <= 1 or len(pairs) <= 1:
+        for src, dst in pairs:
+            place_file(src, dst, link_mode)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # list() re-raises the first failure
+        list(executor.map(lambda pair: place_file(pair[0], pair[1], link_mode), pairs))
+
+
+def audio_duration(path: str) -> float:
+    """Read an audio file's duration from its header (soundfile, else the wave module)."""
+    if sf is not None:
+        return float(sf.info(path).duration)
+    with wave.open(path, 'rb') as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def _assignment(subset: str, speaker: str, episode: str, src_dir: str, filename: str) -> Dict:
+    """One utterance's split decision."""
+    return {'subset': subset, 'speaker': speaker, 'episode': episode,
+            'src_dir': src_dir, 'filename': filename}
+
+
+def _manifest_row(assignment: Dict) -> Dict:
+    """Manifest row for an utterance: ID, absolute path, speaker, episode, duration and text."""
+    path = os.path.abspath(os.path.join(assignment['src_dir'], assignment['filename']))
+    try:
+        duration = round(audio_duration(path), 3)
+    except Exception:
+        duration = None
+
+    txt_path = path[:-len('.wav')] + '.normalized.txt'
+    text = ""
+    if os.path.exists(txt_path):
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            text = f.read().strip()
+
+    return {
+        'id': os.path.splitext(assignment['filename'])[0],
+        'path': path,
+        'speaker': assignment['speaker'],
+        'episode': assignment['episode'],
+        'duration': duration,
+        'text': text
+    }
+
+
+def load_split_manifest(manifest_path: str) -> Iterator[Dict]:
+    """Iterate over the rows of a split manifest (JSONL)."""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_splits_info(split_dir: str) -> Optional[Dict]:
+    """Read split_dir/splits.json written in manifest-only mode (None when absent)."""
+    info_path = os.path.join(split_dir, SPLITS_INFO_FILENAME)
+    if not os.path.exists(info_path):
+        return None
+    with open(info_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_atomic(path: str, lines: List[str]):
+    """Write lines to path through a temporary file so readers never see a partial manifest."""
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    os.replace(temp_path, path)
+
+
+def _tsv_line(row: Dict) -> str:
+    """TSV line for a manifest row (whitespace inside values collapsed to single spaces)."""
+    values = ["" if row[field] is None else str(row[field]) for field in MANIFEST_FIELDS]
+    return "\t".join(" ".join(value.split()) for value in values) + "\n"
+
+
+@telemetry.traced('write')
+def write_split_manifests(assignments: List[Dict], split_dir: str, root_dir: str,
+                          replace_episodes: Optional[List[str]] = None, max_workers: int = 8,
+                          append: bool = False):
+    """Write train/test manifests (JSONL + TSV) instead of copying audio.
+
+    Args:
+        assignments: split decisions from the split functions
+        split_dir: directory for {subset}.jsonl, {subset}.tsv and splits.json
+        root_dir: processed dataset root the audio stays in
+        replace_episodes: keep existing rows except these episodes (per-episode runs);
+                          None rewrites the manifests from scratch
+        max_workers: parallel workers for reading audio headers and text
+        append: append the new rows to existing manifests without reading them (incremental runs)
+    """
+    os.makedirs(split_dir, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        rows = list(executor.map(_manifest_row, assignments))
+
+    for subset in SPLIT_SUBSETS:
+        jsonl_path = os.path.join(split_dir, f"{subset}.jsonl")
+        tsv_path = os.path.join(split_dir, f"{subset}.tsv")
+        if append and os.path.exists(jsonl_path) and os.path.exists(tsv_path):
+            new_rows = [row for row, assignment in zip(rows, assignments) if assignment['subset'] == subset]
+            with open(jsonl_path, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in new_rows)
+            with open(tsv_path, 'a', encoding='utf-8') as f:
+                f.writelines(_tsv_line(row) for row in new_rows)
+            print(f"📝 {subset}.jsonl: +{len(new_rows)} 筆")
+            continue
+
+        subset_rows = []
+        if replace_episodes is not None and os.path.exists(jsonl_path):
+            subset_rows = [row for row in load_split_manifest(jsonl_path)
+                           if row['episode'] not in replace_episodes]
+        subset_rows.extend(row for row, assignment in zip(rows, assignments)
+                           if assignment['subset'] == subset)
+
+        _write_atomic(jsonl_path, [json.dumps(row, ensure_ascii=False) + "\n" for row in subset_rows])
+
+        tsv_lines = ["\t".join(MANIFEST_FIELDS) + "\n"]
+        tsv_lines.extend(_tsv_line(row) for row in subset_rows)
+        _write_atomic(tsv_path, tsv_lines)
+
+        print(f"📝 {subset}.jsonl: {len(subset_rows)} 筆")
+
+    info = {
+        'root': os.path.abspath(root_dir),
+        'manifests': {subset: f"{subset}.jsonl" for subset in SPLIT_SUBSETS}
+    }
+    with open(os.path.join(split_dir, SPLITS_INFO_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+
+
+def rewrite_manifest_paths(split_dir: str, paths: Dict[str, str]):
+    """Point manifest rows at replacement audio (e.g. enhanced copies written elsewhere).
+
+    The original location is kept under 'source_path' so the rows can be re-processed.
+
+    Args:
+        split_dir: directory holding {subset}.jsonl and {subset}.tsv
+        paths: source path -> new path; rows not listed keep their current path
+    """
+    for subset in SPLIT_SUBSETS:
+        jsonl_path = os.path.join(split_dir, f"{subset}.jsonl")
+        if not os.path.exists(jsonl_path):
+            continue
+
+        rows = list(load_split_manifest(jsonl_path))
+        changed = 0
+        for row in rows:
+            source = row.get('source_path', row['path'])
+            if source in paths and row['path'] != paths[source]:
+                row['source_path'] = source
+                row['path'] = paths[source]
+                changed += 1
+        if not changed:
+            continue
+
+        _write_atomic(jsonl_path, [json.dumps(row, ensure_ascii=False) + "\n" for row in rows])
+        tsv_lines = ["\t".join(MANIFEST_FIELDS) + "\n"]
+        tsv_lines.extend(_tsv_line(row) for row in rows)
+        _write_atomic(os.path.join(split_dir, f"{subset}.tsv"), tsv_lines)
+        print(f"📝 {subset}.jsonl: {changed} 筆路徑已更新")
+
+
+@telemetry.traced('place')
+def _place_assignments(assignments: List[Dict], split_dir: str, link_mode: str, max_workers: int):
+    """Materialize assignments as split_dir/{subset}/{speaker}/{episode}/ files."""
+    pairs = []
+    for assignment in assignments:
+        dst_dir = os.path.join(split_dir, assignment['subset'], assignment['speaker'], assignment['episode'])
+        pairs.extend(_utterance_pairs(assignment['src_dir'], dst_dir, assignment['filename']))
+
+    print(f"📦 放置 {len(pairs)} 個檔案 (模式: {link_mode})")
+    place_files(pairs, link_mode, max_workers)
+
+
+def _utterance_pairs(src_dir: str, dst_dir: str, filename: str) -> List[Tuple[str, str]]:
+    """(src, dst) pairs for an utterance's audio and, if present, its .normalized.txt."""
+    pairs = [(os.path.join(src_dir, filename), os.path.join(dst_dir, filename))]
+    txt_filename = filename.replace('.wav', '.normalized.txt')
+    if os.path.exists(os.path.join(src_dir, txt_filename)):
+        pairs.append((os.path.join(src_dir, txt_filename), os.path.join(dst_dir, txt_filename)))
+    return pairs
 
 def get_all_speakers(data_dir: str) -> List[str]:
     """Get all speaker IDs from the dataset."""
@@ -31,18 +330,15 @@ def get_speaker_files(data_dir: str, speaker_id: str) -> List[Tuple[str, str]]:
     
     return files
 
-def split_by_files(data_dir: str, output_dir: str, test_ratio: float = 0.2):
+@telemetry.traced('split')
+def split_by_files(data_dir: str, output_dir: str, test_ratio: float = 0.2,
+                   link_mode: str = "copy", max_workers: int = 8, manifest_only: bool = False):
     """Split dataset by files (each speaker has files in both train and test)."""
     speakers = get_all_speakers(data_dir)
     
-    # Create output directories
-    train_dir = os.path.join(output_dir, "train")
-    test_dir = os.path.join(output_dir, "test")
-    os.makedirs(train_dir, exist_ok=True)
-    os.makedirs(test_dir, exist_ok=True)
-    
     train_count = 0
     test_count = 0
+    assignments = []
     
     for speaker in speakers:
         files = get_speaker_files(data_dir, speaker)
@@ -54,54 +350,27 @@ def split_by_files(data_dir: str, output_dir: str, test_ratio: float = 0.2):
         
         print(f"📊 Speaker {speaker}: {len(train_files)} train, {len(test_files)} test")
         
-        # Copy train files
-        for chapter, filename in train_files:
-            src_dir = os.path.join(data_dir, speaker, chapter)
-            dst_dir = os.path.join(train_dir, speaker, chapter)
-            os.makedirs(dst_dir, exist_ok=True)
-            
-            # Copy audio file (使用最基本的複製方式避免權限問題)
-            with open(os.path.join(src_dir, filename), 'rb') as src, open(os.path.join(dst_dir, filename), 'wb') as dst:
-                dst.write(src.read())
-            
-            # Copy text file
-            txt_filename = filename.replace('.wav', '.normalized.txt')
-            if os.path.exists(os.path.join(src_dir, txt_filename)):
-                with open(os.path.join(src_dir, txt_filename), 'rb') as src, open(os.path.join(dst_dir, txt_filename), 'wb') as dst:
-                    dst.write(src.read())
-            
-            train_count += 1
+        for subset, subset_files in (("train", train_files), ("test", test_files)):
+            for chapter, filename in subset_files:
+                src_dir = os.path.join(data_dir, speaker, chapter)
+                assignments.append(_assignment(subset, speaker, chapter, src_dir, filename))
         
-        # Copy test files  
-        for chapter, filename in test_files:
-            src_dir = os.path.join(data_dir, speaker, chapter)
-            dst_dir = os.path.join(test_dir, speaker, chapter)
-            os.makedirs(dst_dir, exist_ok=True)
-            
-            # Copy audio file (使用最基本的複製方式避免權限問題)
-            with open(os.path.join(src_dir, filename), 'rb') as src, open(os.path.join(dst_dir, filename), 'wb') as dst:
-                dst.write(src.read())
-            
-            # Copy text file
-            txt_filename = filename.replace('.wav', '.normalized.txt')
-            if os.path.exists(os.path.join(src_dir, txt_filename)):
-                with open(os.path.join(src_dir, txt_filename), 'rb') as src, open(os.path.join(dst_dir, txt_filename), 'wb') as dst:
-                    dst.write(src.read())
-            
-            test_count += 1
+        train_count += len(train_files)
+        test_count += len(test_files)
+    
+    if manifest_only:
+        write_split_manifests(assignments, output_dir, data_dir, max_workers=max_workers)
+    else:
+        _place_assignments(assignments, output_dir, link_mode, max_workers)
     
     print(f"📊 Total: {train_count} train files, {test_count} test files")
 
-def split_by_episode(processed_dir: str, split_dir: str, episode_num: str, test_ratio: float = 0.2):
+@telemetry.traced('split')
+def split_by_episode(processed_dir: str, split_dir: str, episode_num: str, test_ratio: float = 0.2,
+                     link_mode: str = "copy", max_workers: int = 8, manifest_only: bool = False):
     """Split a specific episode's data into train and test sets."""
     print(f"按集數切分 - 處理第 {episode_num} 集")
     
-    # Create output directories
-    train_dir = os.path.join(split_dir, "train")
-    test_dir = os.path.join(split_dir, "test")
-    os.makedirs(train_dir, exist_ok=True)
-    os.makedirs(test_dir, exist_ok=True)
-    
     train_count = 0
     test_count = 0
     
@@ -143,6 +412,7 @@ def split_by_episode(processed_dir: str, split_dir: str, episode_num: str, test_
     print(f"第 {episode_num} 集包含 {len(episode_speakers)} 個語者: {', '.join(speaker_names)}")
     
     # For each speaker in this episode, split their files
+    assignments = []
     for speaker, episode_dir in episode_speakers:
         files = [f for f in os.listdir(episode_dir) if f.endswith('.wav')]
         
@@ -157,52 +427,203 @@ def split_by_episode(processed_dir: str, split_dir: str, episode_num: str, test_
         train_files = files[:split_point]
         test_files = files[split_point:]
         
-        # Copy train files
-        for filename in train_files:
-            train_speaker_episode_dir = os.path.join(train_dir, speaker, episode_padded)
-            os.makedirs(train_speaker_episode_dir, exist_ok=True)
-            
-            src_file = os.path.join(episode_dir, filename)
-            dst_file = os.path.join(train_speaker_episode_dir, filename)
-            
-            # Copy audio file
-            with open(src_file, 'rb') as src, open(dst_file, 'wb') as dst:
-                dst.write(src.read())
-            
-            # Copy text file if exists
-            txt_filename = filename.replace('.wav', '.normalized.txt')
-            src_txt = os.path.join(episode_dir, txt_filename)
-            if os.path.exists(src_txt):
-                dst_txt = os.path.join(train_speaker_episode_dir, txt_filename)
-                with open(src_txt, 'rb') as src, open(dst_txt, 'wb') as dst:
-                    dst.write(src.read())
-            
-            train_count += 1
+        for subset, subset_files in (("train", train_files), ("test", test_files)):
+            for filename in subset_files:
+                assignments.append(_assignment(subset, speaker, episode_padded, episode_dir, filename))
         
-        # Copy test files  
-        for filename in test_files:
-            test_speaker_episode_dir = os.path.join(test_dir, speaker, episode_padded)
-            os.makedirs(test_speaker_episode_dir, exist_ok=True)
-            
-            src_file = os.path.join(episode_dir, filename)
-            dst_file = os.path.join(test_speaker_episode_dir, filename)
-            
-            # Copy audio file
-            with open(src_file, 'rb') as src, open(dst_file, 'wb') as dst:
-                dst.write(src.read())
-            
-            # Copy text file if exists
-            txt_filename = filename.replace('.wav', '.normalized.txt')
-            src_txt = os.path.join(episode_dir, txt_filename)
-            if os.path.exists(src_txt):
-                dst_txt = os.path.join(test_speaker_episode_dir, txt_filename)
-                with open(src_txt, 'rb') as src, open(dst_txt, 'wb') as dst:
-                    dst.write(src.read())
-            
-            test_count += 1
+        train_count += len(train_files)
+        test_count += len(test_files)
+    
+    if manifest_only:
+        write_split_manifests(assignments, split_dir, processed_dir,
+                              replace_episodes=[episode_padded], max_workers=max_workers)
+    else:
+        _place_assignments(assignments, split_dir, link_mode, max_workers)
     
     print(f"第 {episode_num} 集切分完成: {train_count} train files, {test_count} test files")
 
+@telemetry.traced('split')
+def split_by_duration(processed_dir: str, split_dir: str, test_ratio: float = 0.2, seed: int = 42,
+                      episode_num: Optional[str] = None, link_mode: str = "copy", max_workers: int = 8,
+                      manifest_only: bool = False, refresh_index: bool = False):
+    """Split so each speaker's test set holds test_ratio of their audio duration.
+
+    Uses the utterance index (processed_dir/utterance_index.jsonl). The index is refreshed on every
+    run (only new or changed files are read), fully rescanned with refresh_index, and an episode
+    run rescans only that episode. Episode directories may be zero-padded or not.
+    """
+    try:
+        from src.utterance_index import build_utterance_index, duration_stratified_split, episode_key, summarize
+    except ImportError:
+        from utterance_index import build_utterance_index, duration_stratified_split, episode_key, summarize
+
+    rows = build_utterance_index(processed_dir, episode=episode_num, max_workers=max(16, max_workers),
+                                 rescan=refresh_index)
+
+    episode_padded = None
+    if episode_num is not None:
+        episode_padded = f"{int(episode_num):03d}"
+        rows = [row for row in rows if episode_key(row['episode']) == episode_padded]
+        print(f"按時長切分 - 處理第 {episode_num} 集")
+    if not rows:
+        print(f"❌ 找不到語句: {processed_dir}")
+        return
+
+    subsets = duration_stratified_split(rows, test_ratio, seed)
+    for speaker, entry in sorted(summarize(rows, subsets).items()):
+        test_duration = entry.get('test', 0.0)
+        print(f"📊 Speaker {speaker}: {(entry['duration'] - test_duration) / 60:.1f} min train, "
+              f"{test_duration / 60:.1f} min test ({test_duration / max(entry['duration'], 1e-9):.1%})")
+
+    assignments = []
+    for row, subset in zip(rows, subsets):
+        path = os.path.join(processed_dir, row['path'])
+        assignments.append(_assignment(subset, row['speaker'], episode_padded or row['episode'],
+                                       os.path.dirname(path), os.path.basename(path)))
+
+    if manifest_only:
+        write_split_manifests(assignments, split_dir, processed_dir,
+                              replace_episodes=[episode_padded] if episode_padded else None,
+                              max_workers=max_workers)
+    else:
+        _place_assignments(assignments, split_dir, link_mode, max_workers)
+
+    test_count = subsets.count("test")
+    print(f"📊 Total: {len(subsets) - test_count} train files, {test_count} test files")
+
+def load_split_state(split_dir: str, seed: int, test_ratio: float) -> Dict:
+    """Load split_dir/split_state.json, or start a new state with this seed and ratio.
+
+    An existing state keeps its own seed and ratio so earlier assignments stay valid.
+    """
+    state_path = os.path.join(split_dir, SPLIT_STATE_FILENAME)
+    if not os.path.exists(state_path):
+        return {'seed': seed, 'test_ratio': test_ratio, 'speakers': {}, 'episodes': {}, 'pending': []}
+
+    with open(state_path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    if state['seed'] != seed or state['test_ratio'] != test_ratio:
+        print(f"⚠️  沿用已保存的切分設定 (seed={state['seed']}, test_ratio={state['test_ratio']})")
+    state.setdefault('pending', [])
+    return state
+
+
+def _save_split_state(split_dir: str, state: Dict):
+    """Atomically write split_dir/split_state.json."""
+    os.makedirs(split_dir, exist_ok=True)
+    _write_atomic(os.path.join(split_dir, SPLIT_STATE_FILENAME),
+                  [json.dumps(state, ensure_ascii=False, indent=2) + "\n"])
+
+
+def _discover_episode_dirs(processed_dir: str, episode_num: Optional[str] = None) -> List[Tuple[str, str, str]]:
+    """(speaker, episode, episode_dir) for every speaker/episode directory; only lists directories."""
+    found = []
+    for speaker in get_all_speakers(processed_dir):
+        speaker_dir = os.path.join(processed_dir, speaker)
+        if episode_num is not None:
+            episode_padded = f"{int(episode_num):03d}"
+            for episode in (episode_padded, episode_num):
+                if os.path.isdir(os.path.join(speaker_dir, episode)):
+                    found.append((speaker, episode_padded, os.path.join(speaker_dir, episode)))
+                    break
+            continue
+        for episode in sorted(os.listdir(speaker_dir)):
+            if os.path.isdir(os.path.join(speaker_dir, episode)):
+                found.append((speaker, episode, os.path.join(speaker_dir, episode)))
+    return found
+
+
+@telemetry.traced('split')
+def split_incremental(processed_dir: str, split_dir: str, test_ratio: float = 0.2, seed: int = 42,
+                      episode_num: Optional[str] = None, link_mode: str = "copy", max_workers: int = 8,
+                      manifest_only: bool = False):
+    """Assign and place only speaker/episode directories not yet recorded in split_state.json.
+
+    Each new episode is shuffled with a seed derived from (seed, speaker, episode), and its test
+    count is chosen so the speaker's cumulative test share stays at test_ratio. Known episodes are
+    never reshuffled, so work scales with the new episodes rather than the corpus. Passing
+    episode_num re-splits that episode (deterministically the same when its files are unchanged).
+    """
+    state = load_split_state(split_dir, seed, test_ratio)
+    if not state['episodes'] and any(os.path.isdir(os.path.join(split_dir, subset)) for subset in SPLIT_SUBSETS):
+        print(f"⚠️  {split_dir} 尚無切分狀態，將以目前所有集數建立初始狀態（建議先清空舊的切分結果）")
+
+    discovered = _discover_episode_dirs(processed_dir, episode_num)
+
+    # Interrupted runs (pending) and an explicitly requested episode are re-split as whole episodes
+    redo_episodes = {key.split("/", 1)[1] for key in state['pending']}
+    if episode_num is not None:
+        redo_episodes.add(f"{int(episode_num):03d}")
+    selected = [(speaker, episode, episode_dir) for speaker, episode, episode_dir in discovered
+                if f"{speaker}/{episode}" not in state['episodes'] or episode in redo_episodes]
+    redo_keys = {f"{speaker}/{episode}" for speaker, episode, _ in selected
+                 if f"{speaker}/{episode}" in state['episodes']}
+
+    if not selected:
+        print("沒有新的集數需要切分")
+        return
+
+    assignments = []
+    for speaker, episode, episode_dir in selected:
+        key = f"{speaker}/{episode}"
+        counts = state['speakers'].setdefault(speaker, {'train': 0, 'test': 0})
+        previous = state['episodes'].pop(key, None)
+        if previous:
+            counts['train'] -= previous['train']
+            counts['test'] -= previous['test']
+
+        files = sorted(f for f in os.listdir(episode_dir) if f.endswith('.wav'))
+        if not files:
+            continue
+        random.Random(f"{state['seed']}:{speaker}:{episode}").shuffle(files)
+
+        # Keep the speaker's cumulative test share at test_ratio
+        target_test = round((counts['train'] + counts['test'] + len(files)) * state['test_ratio'])
+        test_count = min(len(files), max(0, target_test - counts['test']))
+        for index, filename in enumerate(files):
+            subset = "test" if index < test_count else "train"
+            assignments.append(_assignment(subset, speaker, episode, episode_dir, filename))
+
+        counts['train'] += len(files) - test_count
+        counts['test'] += test_count
+        state['episodes'][key] = {'train': len(files) - test_count, 'test': test_count}
+        print(f"📊 Speaker {speaker} / {episode}: {len(files) - test_count} train, {test_count} test "
+              f"(累計 {counts['train']} train, {counts['test']} test)")
+
+    # Mark the episodes pending until outputs are written so an interrupted run is redone next time
+    state['pending'] = sorted(f"{speaker}/{episode}" for speaker, episode, _ in selected)
+    _save_split_state(split_dir, state)
+
+    assignment_rows = [json.dumps({'id': os.path.splitext(a['filename'])[0], 'speaker': a['speaker'],
+                                   'episode': a['episode'], 'subset': a['subset']}, ensure_ascii=False) + "\n"
+                       for a in assignments]
+    assignments_path = os.path.join(split_dir, SPLIT_ASSIGNMENTS_FILENAME)
+    if redo_keys and os.path.exists(assignments_path):
+        kept = [json.dumps(row, ensure_ascii=False) + "\n" for row in load_split_manifest(assignments_path)
+                if f"{row['speaker']}/{row['episode']}" not in redo_keys]
+        _write_atomic(assignments_path, kept + assignment_rows)
+    else:
+        with open(assignments_path, 'a', encoding='utf-8') as f:
+            f.writelines(assignment_rows)
+
+    if manifest_only:
+        if redo_keys:
+            write_split_manifests(assignments, split_dir, processed_dir,
+                                  replace_episodes=sorted(redo_episodes), max_workers=max_workers)
+        else:
+            write_split_manifests(assignments, split_dir, processed_dir, max_workers=max_workers, append=True)
+    else:
+        for key in redo_keys:
+            for subset in SPLIT_SUBSETS:
+                shutil.rmtree(os.path.join(split_dir, subset, key), ignore_errors=True)
+        _place_assignments(assignments, split_dir, link_mode, max_workers)
+
+    state['pending'] = []
+    _save_split_state(split_dir, state)
+
+    test_count = sum(1 for a in assignments if a['subset'] == "test")
+    print(f"增量切分完成: {len(selected)} 個語者集數, {len(assignments) - test_count} train files, {test_count} test files")
+
 def main():
     parser = argparse.ArgumentParser(description="Split dataset into train and test sets")
     parser.add_argument("--processed_dir", default="data/output", help="Path to the processed dataset directory")
@@ -214,29 +635,67 @@ def main():
     parser.add_argument("--episodes", help="Specific episodes to split (e.g., '1,2,3')")
     parser.add_argument("--episode_num", help="Single episode to split (for episode method)")
     parser.add_argument("--auto_yes", action="store_true", help="Auto confirm all prompts")
+    parser.add_argument("--link_mode", "--link-mode", choices=LINK_MODES, default="copy",
+                       help="How files are placed into train/test: copy, hardlink, symlink or reflink "
+                            "(links fall back to copy when unsupported)")
+    parser.add_argument("--copy_workers", type=int, default=8, help="Parallel workers for placing files")
+    parser.add_argument("--manifest_only", action="store_true",
+                       default=os.environ.get('SPLIT_MANIFEST_ONLY', 'false').lower() == 'true',
+                       help="Write train/test manifests (JSONL + TSV) and leave audio in processed_dir")
+    parser.add_argument("--balance", choices=["count", "duration"],
+                       default=os.environ.get('SPLIT_BALANCE', 'count'),
+                       help="Balance each speaker's test set by file count or by audio duration "
+                            "(duration uses the utterance index)")
+    parser.add_argument("--refresh_index", action="store_true",
+                       help="Rescan all audio headers before a duration-balanced split")
+    parser.add_argument("--incremental", action="store_true",
+                       default=os.environ.get('SPLIT_INCREMENTAL', 'false').lower() == 'true',
+                       help="Only split speaker/episode directories not yet recorded in split_state.json "
+                            "(files/episode methods)")
     
     args = parser.parse_args()
-    
+    # Incremental runs assign new episodes by file count only
+    if args.incremental and args.balance == "duration" and args.method in ("files", "episode"):
+        parser.error("--incremental (SPLIT_INCREMENTAL) does not support --balance duration (SPLIT_BALANCE); "
+                     "use one or the other")
+
     # Set random seed
     random.seed(args.seed)
     
     if not os.path.exists(args.processed_dir):
         print(f"❌ Processed directory not found: {args.processed_dir}")
         return
+    if args.method == "episode" and not args.episode_num:
+        print("Episode method requires --episode_num parameter")
+        return
     
+    telemetry.start_run('split_dataset', method=args.method, balance=args.balance,
+                        incremental=args.incremental, manifest_only=args.manifest_only)
     print(f"切分資料集使用 '{args.method}' 方法...")
     print(f"輸入目錄: {args.processed_dir}")
     print(f"輸出目錄: {args.split_dir}")
     
-    if args.method == "files":
-        split_by_files(args.processed_dir, args.split_dir, args.test_ratio)
+    if args.incremental and args.method in ("files", "episode"):
+        split_incremental(args.processed_dir, args.split_dir, args.test_ratio, args.seed,
+                          episode_num=args.episode_num if args.method == "episode" else None,
+                          link_mode=args.link_mode, max_workers=args.copy_workers,
+                          manifest_only=args.manifest_only)
+    elif args.balance == "duration" and args.method in ("files", "episode"):
+        split_by_duration(args.processed_dir, args.split_dir, args.test_ratio, args.seed,
+                          episode_num=args.episode_num if args.method == "episode" else None,
+                          link_mode=args.link_mode, max_workers=args.copy_workers,
+                          manifest_only=args.manifest_only, refresh_index=args.refresh_index)
+    elif args.method == "files":
+        split_by_files(args.processed_dir, args.split_dir, args.test_ratio,
+                       link_mode=args.link_mode, max_workers=args.copy_workers,
+                       manifest_only=args.manifest_only)
     elif args.method == "episode":
-        if not args.episode_num:
-            print("Episode method requires --episode_num parameter")
-            return
-        split_by_episode(args.processed_dir, args.split_dir, args.episode_num, args.test_ratio)
+        split_by_episode(args.processed_dir, args.split_dir, args.episode_num, args.test_ratio,
+                         link_mode=args.link_mode, max_workers=args.copy_workers,
+                         manifest_only=args.manifest_only)
     else:
         print(f"Method '{args.method}' not implemented yet")
+        telemetry.end_run('error')
         return
     
     print("Dataset split completed!")
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+結構化的階段計時與資源遙測
+以巢狀 span（decode、diarize、embed、match、write、separate…）記錄每個處理階段的
+牆鐘時間、CPU 時間、RSS 與 GPU 記憶體峰值，每次執行寫成一個 JSONL 檔
+
+程式中使用：
+  telemetry.start_run('pyannote_speaker_segmentation', episode=1)
+  with telemetry.span('diarize', window_seconds=600):
+      ...
+  沒有呼叫 start_run（例如被其他程式當成函式庫匯入）時 span 不做任何事
+
+JSONL 每行一筆：
+- {'type': 'run', ...}：執行名稱、主機、命令列與屬性
+- {'type': 'span', ...}：name、path（含父 span 的路徑）、wall_s、cpu_s、rss_*_mb、gpu_peak_mb（取樣所得的程序 GPU 記憶體峰值）、attrs、status
+- {'type': 'run_end', ...}：整次執行的時間與峰值
+
+輸出目錄：TELEMETRY_DIR（空白 = data/telemetry，off = 停用）
+
+使用範例：
+  python src/telemetry.py summary data/telemetry                     # 依階段彙總全部執行
+  python src/telemetry.py summary data/telemetry/xxx.jsonl --by-run
+  python src/telemetry.py compare baseline.jsonl candidate.jsonl     # 比較兩組執行的各階段時間
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import argparse
+import atexit
+import functools
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+PROJECT_ROOT = Path(__file__).parent.parent
+# 記憶體取樣間隔（秒）：span 的 RSS 與 GPU 記憶體峰值由背景執行緒取樣得到
+SAMPLE_INTERVAL = float(os.environ.get('TELEMETRY_SAMPLE_INTERVAL', '0.2'))
+
+# 以 src.telemetry 與 telemetry 兩種名稱匯入時共用同一個模組，執行狀態只有一份
+if __name__ != '__main__':
+    sys.modules.setdefault('telemetry', sys.modules[__name__])
+    sys.modules.setdefault('src.telemetry', sys.modules[__name__])
+
+_lock = threading.Lock()
+_local = threading.local()
+_run: Optional[Dict] = None
+
+
+def telemetry_dir() -> Optional[Path]:
+    """輸出目錄（TELEMETRY_DIR=off 時回傳 None）"""
+    setting = os.environ.get('TELEMETRY_DIR', '').strip()
+    if setting.lower() == 'off':
+        return None
+    if setting:
+        path = Path(setting)
+        return path if path.is_absolute() else PROJECT_ROOT / path
+    return PROJECT_ROOT / "data" / "telemetry"
+
+
+def current_rss_mb() -> float:
+    """目前的常駐記憶體（MB）；沒有 /proc 時退回程序的 RSS 峰值"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _cuda():
+    """已匯入且可用的 torch.cuda（不主動匯入 torch，避免拖慢不需要 GPU 的入口）"""
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        return torch.cuda
+    return None
+
+
+def current_gpu_mb(cuda) -> float:
+    """目前全部 GPU 已配置的記憶體（MB）；CUDA 尚未初始化時為 0，不會建立 context"""
+    if not cuda.is_initialized():
+        return 0.0
+    return sum(cuda.memory_allocated(device) for device in range(cuda.device_count())) / 1024 ** 2
+
+
+def _write(record: Dict):
+    with _lock:
+        if _run is None:
+            return
+        _run['file'].write(json.dumps(record, ensure_ascii=False) + '\n')
+        _run['file'].flush()
+
+
+def _sample_memory(stop: threading.Event):
+    # 不使用 reset_peak_memory_stats：峰值計數器是整個程序共用的，
+    # 重設會干擾其他讀取峰值的元件（例如 uvr5_governor），多執行緒下每個 span 的峰值也沒有意義
+    while not stop.wait(SAMPLE_INTERVAL):
+        rss = current_rss_mb()
+        cuda = _cuda()
+        gpu = current_gpu_mb(cuda) if cuda is not None else None
+        with _lock:
+            if _run is None:
+                return
+            for open_span in _run['open_spans'].values():
+                open_span['rss_peak_mb'] = max(open_span['rss_peak_mb'], rss)
+                if gpu is not None:
+                    open_span['gpu_peak_mb'] = max(open_span['gpu_peak_mb'], gpu)
+
+
+def start_run(name: str, **attrs) -> Optional[Path]:
+    """
+    開始一次執行並建立 JSONL 檔（同一程序重複呼叫時先結束前一次執行）
+
+    Returns:
+        JSONL 路徑（停用時回傳 None）
+    """
+    global _run
+    end_run()
+    directory = telemetry_dir()
+    if directory is None:
+        return None
+    directory.mkdir(parents=True, exist_ok=True)
+    started_at = datetime.now()
+    run_id = f"{name}_{started_at.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+    path = directory / f"{run_id}.jsonl"
+
+    stop = threading.Event()
+    with _lock:
+        _run = {
+            'id': run_id, 'name': name, 'path': path, 'file': open(path, 'a', encoding='utf-8'),
+            'wall_start': time.perf_counter(), 'cpu_start': time.process_time(),
+            'next_span': 0, 'open_spans': {}, 'stop': stop
+        }
+    _write({'type': 'run', 'run_id': run_id, 'name': name, 'host': socket.gethostname(), 'pid': os.getpid(),
+            'started_at': started_at.isoformat(timespec='seconds'), 'argv': sys.argv, 'attrs': attrs})
+    threading.Thread(target=_sample_memory, args=(stop,), name='telemetry-memory', daemon=True).start()
+    return path
+
+
+def end_run(status: str = 'ok'):
+    """結束目前的執行（寫入 run_end 並關閉檔案）"""
+    global _run
+    if _run is None:
+        return
+    cuda = _cuda()
+    _write({'type': 'run_end', 'run_id': _run['id'], 'status': status,
+            'wall_s': round(time.perf_counter() - _run['wall_start'], 4),
+            'cpu_s': round(time.process_time() - _run['cpu_start'], 4),
+            'rss_end_mb': round(current_rss_mb(), 1),
+            'gpu_peak_mb': round(cuda.max_memory_allocated() / 1024 ** 2, 1) if cuda else None})
+    with _lock:
+        _run['stop'].set()
+        _run['file'].close()
+        _run = None
+
+
+def _end_run_at_exit():
+    # 程序因未捕捉的例外結束時，直譯器會在印出 traceback 時設定 sys.last_type
+    end_run('error' if getattr(sys, 'last_type', None) else 'ok')
+
+
+atexit.register(_end_run_at_exit)
+
+
+def _span_stack() -> List[Dict]:
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Dict]:
+    """
+    記錄一個處理階段；巢狀使用時記錄父 span（同一執行緒內）
+
+    yield 的 dict 可在階段內補充屬性：with span('embed') as s: s['attrs']['speakers'] = 3
+    """
+    if _run is None:
+        yield {'attrs': attrs}
+        return
+
+    stack = _span_stack()
+    parent = stack[-1] if stack else None
+    cuda = _cuda()
+    gpu = current_gpu_mb(cuda) if cuda is not None else 0.0
+    rss = current_rss_mb()
+    with _lock:
+        span_id = _run['next_span']
+        _run['next_span'] += 1
+        current = {
+            'id': span_id, 'name': name, 'attrs': attrs,
+            'path': f"{parent['path']}/{name}" if parent else name,
+            'parent_id': parent['id'] if parent else None,
+            'rss_start_mb': rss, 'rss_peak_mb': rss, 'gpu_peak_mb': gpu,
+            'wall_start': time.perf_counter(), 'cpu_start': time.process_time()
+        }
+        _run['open_spans'][span_id] = current
+    stack.append(current)
+
+    status = 'ok'
+    try:
+        yield current
+    except BaseException as e:
+        status = f"error: {type(e).__name__}"
+        raise
+    finally:
+        wall = time.perf_counter() - current['wall_start']
+        cpu = time.process_time() - current['cpu_start']
+        stack.pop()
+        rss = current_rss_mb()
+        with _lock:
+            if _run is not None:
+                _run['open_spans'].pop(span_id, None)
+        if cuda is not None:
+            current['gpu_peak_mb'] = max(current['gpu_peak_mb'], current_gpu_mb(cuda))
+        _write({
+            'type': 'span', 'run_id': _run['id'] if _run else None, 'span_id': span_id,
+            'parent_id': current['parent_id'], 'name': name, 'path': current['path'],
+            'thread': threading.current_thread().name, 'status': status,
+            'wall_s': round(wall, 4), 'cpu_s': round(cpu, 4),
+            'rss_start_mb': round(current['rss_start_mb'], 1), 'rss_end_mb': round(rss, 1),
+            'rss_peak_mb': round(max(current['rss_peak_mb'], rss), 1),
+            'gpu_peak_mb': round(current['gpu_peak_mb'], 1) if cuda is not None else None,
+            'attrs': current['attrs']
+        })
+
+
+def traced(name: str):
+    """以 span 包住整個函式的裝飾器：@telemetry.traced('write')"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---------------------------------------------------------------------------
+# 彙總與比較
+# ---------------------------------------------------------------------------
+
+def load_records(paths: List[str]) -> List[Dict]:
+    """讀取 JSONL 檔或目錄下全部 *.jsonl"""
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.glob('*.jsonl')) if path.is_dir() else [path])
+    records = []
+    for file in files:
+        with open(file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # 中斷的執行可能留下不完整的最後一行
+                        continue
+    return records
+
+
+def aggregate(records: List[Dict], by_run: bool = False) -> Dict[str, Dict]:
+    """
+    依 span 路徑彙總
+
+    Returns:
+        {路徑: {'count', 'errors', 'wall_s', 'wall_mean_s', 'cpu_s', 'rss_peak_mb', 'gpu_peak_mb'}}
+        by_run=True 時鍵為 '<run_id> <路徑>'
+    """
+    stats = defaultdict(lambda: {'count': 0, 'errors': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                 'rss_peak_mb': 0.0, 'gpu_peak_mb': None})
+    for record in records:
+        if record.get('type') != 'span':
+            continue
+        key = f"{record['run_id']} {record['path']}" if by_run else record['path']
+        entry = stats[key]
+        entry['count'] += 1
+        entry['errors'] += record['status'] != 'ok'
+        entry['wall_s'] += record['wall_s']
+        entry['cpu_s'] += record['cpu_s']
+        entry['rss_peak_mb'] = max(entry['rss_peak_mb'], record['rss_peak_mb'])
+        if record.get('gpu_peak_mb') is not None:
+            entry['gpu_peak_mb'] = max(entry['gpu_peak_mb'] or 0.0, record['gpu_peak_mb'])
+    for entry in stats.values():
+        entry['wall_mean_s'] = entry['wall_s'] / entry['count']
+    return dict(sorted(stats.items()))
+
+
+def print_summary(stats: Dict[str, Dict]):
+    print(f"{'階段':<48}{'次數':>6}{'總時間':>10}{'平均':>10}{'CPU':>10}{'RSS 峰值':>11}{'GPU 峰值':>11}")
+    for path, entry in stats.items():
+        gpu = f"{entry['gpu_peak_mb']:>9.0f}MB" if entry['gpu_peak_mb'] is not None else f"{'-':>11}"
+        errors = f"  ({entry['errors']} 失敗)" if entry['errors'] else ''
+        print(f"{path:<48}{entry['count']:>6}{entry['wall_s']:>9.1f}s{entry['wall_mean_s']:>9.2f}s"
+              f"{entry['cpu_s']:>9.1f}s{entry['rss_peak_mb']:>9.0f}MB{gpu}{errors}")
+
+
+def compare(baseline: Dict[str, Dict], candidate: Dict[str, Dict]) -> Dict[str, Dict]:
+    """各階段平均時間與峰值的差異（candidate 相對 baseline）"""
+    result = {}
+    for path in sorted(set(baseline) | set(candidate)):
+        before, after = baseline.get(path), candidate.get(path)
+        entry = {'baseline_s': before['wall_mean_s'] if before else None,
+                 'candidate_s': after['wall_mean_s'] if after else None,
+                 'change_pct': None, 'rss_change_mb': None}
+        if before and after:
+            if before['wall_mean_s'] > 0:
+                entry['change_pct'] = (after['wall_mean_s'] / before['wall_mean_s'] - 1) * 100
+            entry['rss_change_mb'] = after['rss_peak_mb'] - before['rss_peak_mb']
+        result[path] = entry
+    return result
+
+
+def print_comparison(result: Dict[str, Dict]):
+    print(f"{'階段':<48}{'基準':>10}{'比較':>10}{'變化':>10}{'RSS 變化':>11}")
+    for path, entry in result.items():
+        before = f"{entry['baseline_s']:>9.2f}s" if entry['baseline_s'] is not None else f"{'-':>10}"
+        after = f"{entry['candidate_s']:>9.2f}s" if entry['candidate_s'] is not None else f"{'-':>10}"
+        change = f"{entry['change_pct']:>+9.1f}%" if entry['change_pct'] is not None else f"{'-':>10}"
+        rss = f"{entry['rss_change_mb']:>+9.0f}MB" if entry['rss_change_mb'] is not None else f"{'-':>11}"
+        print(f"{path:<48}{before}{after}{change}{rss}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="彙總與比較階段遙測 (JSONL)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    summary_parser = subparsers.add_parser('summary', help='依階段彙總')
+    summary_parser.add_argument('paths', nargs='+', help='JSONL 檔或目錄')
+    summary_parser.add_argument('--by-run', action='store_true', help='每次執行分開列出')
+    summary_parser.add_argument('--json', help='將結果寫入 JSON 檔')
+
+    compare_parser = subparsers.add_parser('compare', help='比較兩組執行')
+    compare_parser.add_argument('baseline', help='基準 JSONL 檔或目錄')
+    compare_parser.add_argument('candidate', help='比較 JSONL 檔或目錄')
+    compare_parser.add_argument('--json', help='將結果寫入 JSON 檔')
+    args = parser.parse_args()
+
+    if args.command == 'summary':
+        result = aggregate(load_records(args.paths), args.by_run)
+        if not result:
+            print("⚠️ 沒有 span 記錄")
+            return 1
+        print_summary(result)
+    else:
+        result = compare(aggregate(load_records([args.baseline])), aggregate(load_records([args.candidate])))
+        print_comparison(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"📄 結果已寫入 {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+語句索引
+並行讀取音檔檔頭，建立一次 speaker/episode/utterance 索引，供切分等步驟重複使用
+
+主要功能：
+- 並行檔頭掃描（長度、文字長度），不解碼音訊
+- 增量更新：大小與修改時間未變的語句沿用舊記錄
+- 依說話人的時長比例切分（NumPy 累積和，一次處理所有說話人）
+
+使用範例：
+  python utterance_index.py data/output                 # 建立或更新索引並顯示統計
+  python utterance_index.py data/output --episode 12    # 只更新第 12 集
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    from src.split_dataset import audio_duration, get_all_speakers
+except ImportError:
+    from split_dataset import audio_duration, get_all_speakers
+
+INDEX_FILENAME = "utterance_index.jsonl"
+
+
+def default_index_path(root_dir: str) -> str:
+    """索引預設位置（處理後目錄根部，不會被當成說話人目錄）"""
+    return os.path.join(root_dir, INDEX_FILENAME)
+
+
+def load_utterance_index(root_dir: str, index_path: Optional[str] = None) -> Optional[List[Dict]]:
+    """讀取索引（不存在時回傳 None）"""
+    index_path = index_path or default_index_path(root_dir)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def episode_key(name: str) -> str:
+    """集數目錄名稱正規化（12 與 012 視為同一集）"""
+    return f"{int(name):03d}" if name.isdigit() else name
+
+
+def _scan_utterance(root_dir: str, speaker: str, episode: str, entry: os.DirEntry) -> Dict:
+    """讀取單一語句的檔頭與文字長度"""
+    stat = entry.stat()
+    try:
+        duration = round(audio_duration(entry.path), 3)
+    except Exception:
+        duration = 0.0
+
+    txt_path = entry.path[:-len('.wav')] + '.normalized.txt'
+    text_length = 0
+    if os.path.exists(txt_path):
+        with open(txt_path, 'r', encoding='utf-8') as f:
+            text_length = len(f.read().strip())
+
+    return {
+        'id': entry.name[:-len('.wav')],
+        'path': os.path.relpath(entry.path, root_dir),
+        'speaker': speaker,
+        'episode': episode,
+        'duration': duration,
+        'text_length': text_length,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime
+    }
+
+
+def build_utterance_index(root_dir: str, index_path: Optional[str] = None,
+                          episode: Optional[str] = None, max_workers: int = 16,
+                          rescan: bool = False) -> List[Dict]:
+    """
+    建立或更新語句索引
+
+    Args:
+        root_dir: LibriTTS 輸出目錄（speaker/episode/utterance.wav）
+        index_path: 索引路徑（None = root_dir/utterance_index.jsonl）
+        episode: 只重新掃描此集數（其他集數沿用舊記錄；目錄名稱有無補零皆可）
+        max_workers: 並行讀取檔頭的執行緒數
+        rescan: 忽略大小/修改時間相同的舊記錄，重新讀取全部檔頭
+
+    Returns:
+        List[Dict]: 全部語句（依 path 排序）
+    """
+    index_path = index_path or default_index_path(root_dir)
+    existing = {row['path']: row for row in (load_utterance_index(root_dir, index_path) or [])}
+    if episode is not None:
+        episode = episode_key(episode)
+
+    rows: Dict[str, Dict] = {}
+    if episode is not None:
+        rows = {path: row for path, row in existing.items() if episode_key(row['episode']) != episode}
+    if rescan:
+        existing = {}
+
+    to_scan = []
+    for speaker in get_all_speakers(root_dir):
+        speaker_dir = os.path.join(root_dir, speaker)
+        with os.scandir(speaker_dir) as episode_entries:
+            episode_dirs = [entry for entry in episode_entries if entry.is_dir()
+                            and (episode is None or episode_key(entry.name) == episode)]
+        for episode_entry in episode_dirs:
+            with os.scandir(episode_entry.path) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.wav'):
+                        continue
+                    path = os.path.relpath(entry.path, root_dir)
+                    known = existing.get(path)
+                    stat = entry.stat()
+                    if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+                        rows[path] = known
+                    else:
+                        to_scan.append((speaker, episode_entry.name, entry))
+
+    if to_scan:
+        print(f"🔍 讀取 {len(to_scan)} 個音檔檔頭 (沿用 {len(rows)} 筆)")
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            for row in executor.map(lambda item: _scan_utterance(root_dir, *item), to_scan):
+                rows[row['path']] = row
+
+    ordered = [rows[path] for path in sorted(rows)]
+    temp_path = index_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in ordered)
+    os.replace(temp_path, index_path)
+    return ordered
+
+
+def duration_stratified_split(rows: List[Dict], test_ratio: float = 0.2, seed: int = 42) -> List[str]:
+    """
+    依每位說話人的總時長切分
+
+    每位說話人的語句隨機排列後累加時長，中點落在 test_ratio × 總時長之前的語句分到測試集，
+    使測試集時長最接近目標比例。所有說話人以一次排序與累積和同時計算。
+
+    Args:
+        rows: 索引記錄（需有 id/speaker/duration）
+        test_ratio: 每位說話人的測試集時長比例
+        seed: 隨機種子
+
+    Returns:
+        List[str]: 與 rows 對應的 "train" / "test"
+    """
+    if not rows:
+        return []
+
+    ids = [row['id'] for row in rows]
+    speakers, speaker_codes = np.unique([row['speaker'] for row in rows], return_inverse=True)
+    durations = np.array([row['duration'] or 0.0 for row in rows], dtype=np.float64)
+
+    # 隨機鍵依語句 ID 排序後產生，與 rows 的順序無關
+    rng = np.random.default_rng(seed)
+    random_keys = np.empty(len(rows))
+    random_keys[np.argsort(ids, kind='stable')] = rng.random(len(rows))
+
+    order = np.lexsort((random_keys, speaker_codes))
+    sorted_durations = durations[order]
+    sorted_codes = speaker_codes[order]
+
+    _, starts, counts = np.unique(sorted_codes, return_index=True, return_counts=True)
+    totals = np.add.reduceat(sorted_durations, starts)
+    cumulative = np.cumsum(sorted_durations)
+    group_offset = np.repeat(cumulative[starts] - sorted_durations[starts], counts)
+    within = cumulative - group_offset
+    targets = np.repeat(totals * test_ratio, counts)
+
+    is_test = np.empty(len(rows), dtype=bool)
+    is_test[order] = within - sorted_durations / 2 < targets
+    return ["test" if flag else "train" for flag in is_test]
+
+
+def summarize(rows: List[Dict], subsets: Optional[List[str]] = None) -> Dict[str, Dict]:
+    """每位說話人的語句數與時長（給定 subsets 時分開統計）"""
+    summary: Dict[str, Dict] = {}
+    for index, row in enumerate(rows):
+        entry = summary.setdefault(row['speaker'], {'count': 0, 'duration': 0.0})
+        entry['count'] += 1
+        entry['duration'] += row['duration'] or 0.0
+        if subsets is not None:
+            entry[subsets[index]] = entry.get(subsets[index], 0.0) + (row['duration'] or 0.0)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="建立語句索引")
+    parser.add_argument('root_dir', help='LibriTTS 輸出目錄')
+    parser.add_argument('--index-path', help='索引路徑（預設為 root_dir/utterance_index.jsonl）')
+    parser.add_argument('--episode', help='只重新掃描此集數')
+    parser.add_argument('--workers', type=int, default=16, help='並行讀取檔頭的執行緒數')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root_dir):
+        print(f"❌ 目錄不存在: {args.root_dir}")
+        return 1
+
+    rows = build_utterance_index(args.root_dir, args.index_path, args.episode, args.workers)
+    total = sum(row['duration'] for row in rows)
+    print(f"✅ 索引完成: {len(rows)} 個語句, {total / 3600:.2f} 小時")
+    for speaker, entry in sorted(summarize(rows).items()):
+        print(f"  說話人 {speaker}: {entry['count']} 語句, {entry['duration'] / 60:.1f} 分鐘")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,7 +8,7 @@ UVR5 專用命令行工具
   python uvr5_cli.py data/audio/                  # 整個目錄
   python uvr5_cli.py "back*.wav"                  # 萬用字元匹配
   python uvr5_cli.py data/test/ --pattern "*.mp3" # 指定格式
-  python uvr5_cli.py input.wav --backup           # 備份原檔
+  python uvr5_cli.py input.wav --backup           # 保留原檔（存放於 .uvr5_originals/）
   python uvr5_cli.py data/ --threads 2            # 多執行緒
 
 Author:  TTS ETL Pipeline
@@ -16,65 +16,66 @@ Version: 1.0
 """
 
 import argparse
+import itertools
 import sys
 import time
 import os
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Sequence
 import glob
 
 # 導入 UVR5 處理器
 try:
     from src.uvr5_processor import UVR5Processor, ThreadedUVR5Processor
+    from src.uvr5_discovery import AUDIO_PATTERNS, iter_audio_files, read_file_list
+    from src import telemetry
 except ImportError:
     try:
         from uvr5_processor import UVR5Processor, ThreadedUVR5Processor
+        from uvr5_discovery import AUDIO_PATTERNS, iter_audio_files, read_file_list
+        import telemetry
     except ImportError:
         print("❌ 無法導入 UVR5Processor，請確認 src/uvr5_processor.py 存在")
         sys.exit(1)
 
 
-def find_audio_files(pattern: str) -> List[Path]:
+def find_audio_files(pattern: str, dir_patterns: Sequence[str] = AUDIO_PATTERNS) -> Iterator[Path]:
     """
-    根據模式尋找音檔
+    根據模式尋找音檔（邊找邊產出，目錄模式不需先建立完整清單）
     
     Args:
         pattern: 檔案路徑、目錄路徑或萬用字元模式
+        dir_patterns: 目錄模式下的檔名匹配模式
         
-    Returns:
-        List[Path]: 找到的音檔列表
+    Yields:
+        Path: 找到的音檔
     """
     pattern = str(pattern).strip()
-    audio_files = []
     
     # 如果是具體檔案路徑
     if Path(pattern).is_file():
-        audio_files = [Path(pattern)]
         print(f"📄 找到單一檔案: {pattern}")
+        yield Path(pattern)
     
-    # 如果是目錄路徑
+    # 如果是目錄路徑：單次走訪同時匹配所有格式
     elif Path(pattern).is_dir():
-        directory = Path(pattern)
-        audio_files = list(directory.rglob("*.wav")) + list(directory.rglob("*.mp3")) + list(directory.rglob("*.flac"))
         print(f"📁 掃描目錄: {pattern}")
-        print(f"🎵 找到 {len(audio_files)} 個音檔")
+        yield from iter_audio_files(pattern, dir_patterns)
     
     # 如果包含萬用字元
     elif '*' in pattern or '?' in pattern or '[' in pattern:
-        matched_files = glob.glob(pattern, recursive=True)
-        audio_files = [Path(f) for f in matched_files if Path(f).is_file()]
         print(f"🔍 萬用字元匹配: {pattern}")
-        print(f"🎵 找到 {len(audio_files)} 個檔案")
+        for matched_file in glob.iglob(pattern, recursive=True):
+            if Path(matched_file).is_file():
+                yield Path(matched_file)
     
     # 嘗試作為檔案路徑（可能不存在）
     else:
         file_path = Path(pattern)
         if file_path.exists():
-            audio_files = [file_path]
+            yield file_path
         else:
             print(f"❌ 找不到檔案或目錄: {pattern}")
-    
-    return audio_files
 
 
 def main():
@@ -91,6 +92,9 @@ def main():
   %(prog)s input.wav --backup                  # 備份原始檔案
   %(prog)s data/ --threads 3                   # 多執行緒處理
   %(prog)s input.wav --min-duration 5         # 自訂最小長度
+  %(prog)s data/ --save-file-list files.txt    # 走訪時保存檔案清單
+  %(prog)s data/ --file-list files.txt         # 以檔案清單快速重啟（不走訪目錄）
+  %(prog)s data/ -o out/ --yes                 # 輸出到其他目錄，不詢問確認
         """
     )
     
@@ -109,13 +113,13 @@ def main():
         '--backup', '-b',
         action='store_true',
         default=True,  # 預設自動備份
-        help='備份原始檔案為 .bak (預設: True)'
+        help='保留原始檔案於輸出目錄的 .uvr5_originals/，由工作清單管理 (預設: True)'
     )
     
     parser.add_argument(
         '--no-backup',
         action='store_true',
-        help='不備份原始檔案'
+        help='不保留原始檔案'
     )
     
     parser.add_argument(
@@ -161,6 +165,22 @@ def main():
         help='處理裝置 (預設: auto)'
     )
     
+    parser.add_argument(
+        '--file-list',
+        help='預先建立的檔案清單（每行一個路徑，相對於輸入目錄），指定時不走訪目錄'
+    )
+    
+    parser.add_argument(
+        '--save-file-list',
+        help='目錄模式走訪時同步寫出檔案清單，供下次以 --file-list 快速重啟'
+    )
+    
+    parser.add_argument(
+        '--yes', '-y',
+        action='store_true',
+        help='超過 5 個檔案時不詢問確認'
+    )
+    
     parser.add_argument(
         '--dry-run',
         action='store_true',
@@ -176,37 +196,57 @@ def main():
     print("🎯 UVR5 專用處理工具")
     print("=" * 50)
     
-    # 尋找要處理的檔案
-    if Path(args.input).is_dir():
-        # 目錄模式：使用 pattern 參數
-        audio_files = list(Path(args.input).rglob(args.pattern))
+    # 目錄模式：音檔由處理器邊走訪邊處理，不預先建立清單
+    directory_mode = Path(args.input).is_dir()
+    
+    if directory_mode:
+        if args.dry_run:
+            if args.file_list:
+                file_count = sum(1 for _ in read_file_list(args.file_list, args.input))
+            else:
+                file_count = sum(1 for _ in iter_audio_files(args.input, [args.pattern]))
+            print(f"\n✅ Dry run 完成，共 {file_count} 個檔案會被處理（已完成的檔案將依工作清單跳過）")
+            return 0
+        
+        # 與檔案模式相同，超過 5 個檔案才詢問（最多走訪到第 6 個檔案即停止）
+        if not args.yes:
+            if args.file_list:
+                source = read_file_list(args.file_list, args.input)
+            else:
+                source = iter_audio_files(args.input, [args.pattern])
+            if sum(1 for _ in itertools.islice(source, 6)) > 5:
+                response = input(f"\n❓ 確定要處理目錄 {args.input} 下所有匹配 {args.pattern} 的音檔嗎？(y/N): ")
+                if response.lower() not in ['y', 'yes']:
+                    print("❌ 使用者取消")
+                    return 0
+        audio_files = []
     else:
         # 檔案或萬用字元模式
-        audio_files = find_audio_files(args.input)
-    
-    if not audio_files:
-        print("❌ 沒有找到任何音檔")
-        return 1
-    
-    # 顯示找到的檔案
-    print(f"\n📋 找到 {len(audio_files)} 個音檔:")
-    for i, file_path in enumerate(audio_files[:10], 1):  # 只顯示前10個
-        print(f"  {i:2d}. {file_path}")
-    
-    if len(audio_files) > 10:
-        print(f"  ... 還有 {len(audio_files) - 10} 個檔案")
-    
-    # Dry run 模式
-    if args.dry_run:
-        print(f"\n✅ Dry run 完成，共 {len(audio_files)} 個檔案會被處理")
-        return 0
-    
-    # 確認處理
-    if len(audio_files) > 5:
-        response = input(f"\n❓ 確定要處理 {len(audio_files)} 個檔案嗎？(y/N): ")
-        if response.lower() not in ['y', 'yes']:
-            print("❌ 使用者取消")
+        audio_files = list(find_audio_files(args.input))
+        
+        if not audio_files:
+            print("❌ 沒有找到任何音檔")
+            return 1
+        
+        # 顯示找到的檔案
+        print(f"\n📋 找到 {len(audio_files)} 個音檔:")
+        for i, file_path in enumerate(audio_files[:10], 1):  # 只顯示前10個
+            print(f"  {i:2d}. {file_path}")
+        
+        if len(audio_files) > 10:
+            print(f"  ... 還有 {len(audio_files) - 10} 個檔案")
+        
+        # Dry run 模式
+        if args.dry_run:
+            print(f"\n✅ Dry run 完成，共 {len(audio_files)} 個檔案會被處理")
             return 0
+        
+        # 確認處理
+        if len(audio_files) > 5 and not args.yes:
+            response = input(f"\n❓ 確定要處理 {len(audio_files)} 個檔案嗎？(y/N): ")
+            if response.lower() not in ['y', 'yes']:
+                print("❌ 使用者取消")
+                return 0
     
     # 初始化處理器參數
     processor_kwargs = {
@@ -221,6 +261,7 @@ def main():
     if args.target_duration is not None:
         processor_kwargs['target_duration'] = args.target_duration
     
+    telemetry.start_run('uvr5_cli', input=args.input, threads=args.threads, device=args.device)
     try:
         # 選擇處理器類型
         if args.threads > 1:
@@ -249,7 +290,21 @@ def main():
         start_time = time.time()
         
         # 處理檔案
-        if len(audio_files) == 1:
+        if directory_mode:
+            # 目錄批量處理：邊走訪邊送入處理（或讀取預建檔案清單）
+            result = processor.batch_enhance(
+                args.input,
+                pattern=args.pattern,
+                backup_original=args.backup,
+                file_list=args.file_list,
+                save_file_list=args.save_file_list,
+                output_dir=args.output_dir
+            )
+            if not result.get('success'):
+                print(f"❌ 處理失敗: {result.get('error', 'Unknown error')}")
+                return 1
+        
+        elif len(audio_files) == 1:
             # 單檔處理
             output_path = None
             if args.output_dir:
@@ -282,7 +337,8 @@ def main():
                 result = processor.batch_enhance(
                     str(input_dir),
                     pattern=args.pattern,
-                    backup_original=args.backup
+                    backup_original=args.backup,
+                    output_dir=args.output_dir
                 )
             else:
                 # 檔案分散在不同目錄，逐個處理
@@ -291,8 +347,13 @@ def main():
                 
                 for audio_file in audio_files:
                     print(f"🎵 處理: {audio_file.name}")
+                    output_path = None
+                    if args.output_dir:
+                        os.makedirs(args.output_dir, exist_ok=True)
+                        output_path = os.path.join(args.output_dir, audio_file.name)
                     result = processor.enhance_audio(
                         str(audio_file),
+                        output_path=output_path,
                         backup_original=args.backup
                     )
                     
@@ -323,6 +384,7 @@ def main():
     finally:
         if 'processor' in locals():
             processor.cleanup()
+        telemetry.end_run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+UVR5 音檔探索
+單次 os.scandir 走訪目錄樹，邊找邊產出音檔路徑，不需先建立完整清單
+
+主要功能：
+- 單次走訪同時匹配多種格式（取代多次 rglob）
+- 略過工作清單內部目錄（.uvr5_*）
+- 預先建立的檔案清單：重新啟動時直接讀取，不需再走訪目錄
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import json
+import os
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence, Union
+
+AUDIO_PATTERNS = ("*.wav", "*.mp3", "*.flac")
+
+INTERNAL_PREFIX = ".uvr5_"
+
+
+def iter_audio_files(root_dir: Union[str, Path],
+                     patterns: Sequence[str] = AUDIO_PATTERNS) -> Iterator[Path]:
+    """
+    走訪目錄樹並逐一產出符合模式的檔案
+
+    Args:
+        root_dir: 根目錄
+        patterns: 檔名匹配模式（與 rglob 相同，只比對檔名）
+
+    Yields:
+        Path: 音檔路徑（目錄內依名稱排序，結果可重現）
+    """
+    pending_dirs = [str(root_dir)]
+    while pending_dirs:
+        directory = pending_dirs.pop()
+        try:
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith(INTERNAL_PREFIX):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif any(fnmatchcase(entry.name, pattern) for pattern in patterns):
+                yield Path(entry.path)
+
+        # 反向加入堆疊，使子目錄依名稱順序走訪
+        pending_dirs.extend(reversed(subdirs))
+
+
+def read_file_list(list_path: Union[str, Path], root_dir: Union[str, Path, None] = None) -> Iterator[Path]:
+    """
+    讀取預先建立的檔案清單（每行一個路徑，相對路徑以 root_dir 為基準）
+
+    .jsonl 檔案視為切分清單（split_dataset.py --manifest_only），讀取每行的 path 欄位。
+
+    Yields:
+        Path: 音檔路徑
+    """
+    base = Path(root_dir) if root_dir is not None else Path(list_path).parent
+    is_jsonl = str(list_path).endswith('.jsonl')
+    with open(list_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            path = Path(json.loads(line)['path'] if is_jsonl else line)
+            yield path if path.is_absolute() else base / path
+
+
+def tee_file_list(audio_files: Iterable[Path], list_path: Union[str, Path],
+                  root_dir: Union[str, Path]) -> Iterator[Path]:
+    """
+    邊產出音檔邊寫入檔案清單，走訪完成後才替換正式檔案（中斷時不留下不完整的清單）
+
+    Yields:
+        Path: 原樣產出的音檔路徑
+    """
+    list_path = Path(list_path)
+    root_dir = Path(os.path.abspath(root_dir))
+    temp_path = list_path.with_name(list_path.name + ".partial")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for audio_file in audio_files:
+            absolute = os.path.abspath(audio_file)
+            try:
+                f.write(Path(absolute).relative_to(root_dir).as_posix() + "\n")
+            except ValueError:
+                f.write(absolute + "\n")
+            yield audio_file
+    os.replace(temp_path, list_path)
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+UVR5 GPU 記憶體調節器
+在批次處理過程中持續量測記憶體，動態調整同時進行的人聲分離數量
+
+主要功能：
+- 量測每個進行中工作的峰值記憶體
+- 依可用記憶體即時增減並行數
+- 發生 OOM 時立即降載
+- CPU 模擬模式，無 GPU 也能驗證調節邏輯
+
+使用範例：
+  python uvr5_governor.py --total-gb 24 --job-gb 3.5 --jobs 200   # 模擬 24GB 卡
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import argparse
+import logging
+import math
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+MB = 1024 ** 2
+GB = 1024 ** 3
+
+
+class SimulatedOutOfMemory(RuntimeError):
+    """模擬 GPU 記憶體不足"""
+
+
+class CudaMemoryBackend:
+    """CUDA 記憶體量測（透過 torch.cuda）"""
+
+    def __init__(self, device_index: int = 0):
+        import torch
+        self.torch = torch
+        self.device_index = device_index
+
+    def total_memory(self) -> int:
+        return self.torch.cuda.get_device_properties(self.device_index).total_memory
+
+    def free_memory(self) -> int:
+        free, _ = self.torch.cuda.mem_get_info(self.device_index)
+        return free
+
+    def allocated_memory(self) -> int:
+        return self.torch.cuda.memory_allocated(self.device_index)
+
+    def peak_allocated(self) -> int:
+        return self.torch.cuda.max_memory_allocated(self.device_index)
+
+    def reset_peak(self):
+        self.torch.cuda.reset_peak_memory_stats(self.device_index)
+
+
+class SimulatedMemoryBackend:
+    """模擬 GPU 記憶體 - 供 CPU 環境測試調節邏輯
+
+    模擬工作透過 allocate()/release() 佔用與釋放記憶體，
+    超過總容量時拋出 SimulatedOutOfMemory。
+    """
+
+    def __init__(self, total_bytes: int, base_bytes: int = 0):
+        self._total = int(total_bytes)
+        self._allocated = int(base_bytes)
+        self._peak = self._allocated
+        self._lock = threading.Lock()
+
+    def allocate(self, nbytes: int):
+        with self._lock:
+            if self._allocated + nbytes > self._total:
+                raise SimulatedOutOfMemory(
+                    f"CUDA out of memory (simulated): tried to allocate {nbytes / MB:.0f}MB, "
+                    f"{(self._total - self._allocated) / MB:.0f}MB free"
+                )
+            self._allocated += nbytes
+            self._peak = max(self._peak, self._allocated)
+
+    def release(self, nbytes: int):
+        with self._lock:
+            self._allocated = max(0, self._allocated - nbytes)
+
+    def total_memory(self) -> int:
+        return self._total
+
+    def free_memory(self) -> int:
+        with self._lock:
+            return self._total - self._allocated
+
+    def allocated_memory(self) -> int:
+        with self._lock:
+            return self._allocated
+
+    def peak_allocated(self) -> int:
+        with self._lock:
+            return self._peak
+
+    def reset_peak(self):
+        with self._lock:
+            self._peak = self._allocated
+
+
+class GPUMemoryGovernor:
+    """GPU 記憶體調節器 - 控制同時進行的分離工作數
+
+    設計原則：
+    - 量測為準：每個工作的記憶體用量由實際峰值估算，而非固定對照表
+    - 快降慢升：記憶體不足立即降載，有餘裕時每次只增加一個
+    - 隨時可調：每個工作結束後重新評估並行上限
+    """
+
+    def __init__(self,
+                 max_workers: int,
+                 initial_workers: Optional[int] = None,
+                 min_workers: int = 1,
+                 backend=None,
+                 headroom: float = 0.1,
+                 initial_job_bytes: Optional[int] = None,
+                 logger: Optional[logging.Logger] = None):
+        """
+        初始化調節器
+
+        Args:
+            max_workers: 並行上限（使用者設定）
+            initial_workers: 起始並行數（None = max_workers）
+            min_workers: 並行下限
+            backend: 記憶體量測後端（CudaMemoryBackend / SimulatedMemoryBackend）
+            headroom: 保留的記憶體比例（相對總容量）
+            initial_job_bytes: 每個工作的初始記憶體估計（None = 尚未量測）
+            logger: 記錄器
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.min_workers = max(1, min(int(min_workers), self.max_workers))
+        self.backend = backend
+        self.headroom = headroom
+        self.logger = logger or logging.getLogger(__name__)
+
+        start = initial_workers if initial_workers is not None else self.max_workers
+        self.limit = max(self.min_workers, min(int(start), self.max_workers))
+
+        self.job_bytes_estimate = initial_job_bytes
+        self.in_flight = 0
+        self._window_max_in_flight = 0
+        self._baseline_bytes = backend.allocated_memory() if backend else 0
+
+        self.history: List[Dict] = []
+        self.oom_count = 0
+        self._condition = threading.Condition()
+
+        if backend is not None:
+            backend.reset_peak()
+
+    @classmethod
+    def for_device(cls, device: str, max_workers: int, **kwargs) -> "GPUMemoryGovernor":
+        """依裝置建立調節器（CPU 模式不量測記憶體，固定使用 max_workers）"""
+        backend = CudaMemoryBackend() if device == 'cuda' else None
+        return cls(max_workers=max_workers, backend=backend, **kwargs)
+
+    @contextmanager
+    def slot(self):
+        """取得一個執行名額（超過目前上限時等待）"""
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+            self._window_max_in_flight = max(self._window_max_in_flight, self.in_flight)
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._observe()
+                self._condition.notify_all()
+
+    def report_oom(self):
+        """回報記憶體不足：立即降低上限並放大每個工作的估計值"""
+        with self._condition:
+            self.oom_count += 1
+            old_limit = self.limit
+            self.limit = max(self.min_workers, min(self.limit - 1, max(self.in_flight, 1)))
+            if self.job_bytes_estimate:
+                self.job_bytes_estimate = int(self.job_bytes_estimate * 1.25)
+            self._record('oom', old_limit)
+            self.logger.warning(f"⚠️  GPU 記憶體不足，並行數 {old_limit} → {self.limit}")
+            self._condition.notify_all()
+
+    def _observe(self):
+        """量測記憶體並調整上限（需持有 _condition）"""
+        if self.backend is None:
+            return
+
+        if self.in_flight == 0:
+            # 無工作進行時的用量即為基準（模型權重等常駐記憶體）
+            self._baseline_bytes = self.backend.allocated_memory()
+
+        peak = self.backend.peak_allocated()
+        jobs_in_window = max(1, self._window_max_in_flight)
+        sample = max(0, peak - self._baseline_bytes) / jobs_in_window
+
+        if sample > 0:
+            if self.job_bytes_estimate is None or sample > self.job_bytes_estimate:
+                # 估計值往上立即跟進（保守）
+                self.job_bytes_estimate = int(sample)
+            else:
+                # 往下緩慢收斂
+                self.job_bytes_estimate = int(0.8 * self.job_bytes_estimate + 0.2 * sample)
+
+        self.backend.reset_peak()
+        self._window_max_in_flight = self.in_flight
+
+        if not self.job_bytes_estimate:
+            return
+
+        reserve = self.headroom * self.backend.total_memory()
+        free = self.backend.free_memory()
+        extra_jobs = math.floor(max(0.0, free - reserve) / self.job_bytes_estimate)
+        capacity = self.in_flight + extra_jobs
+
+        old_limit = self.limit
+        if capacity < self.limit:
+            self.limit = max(self.min_workers, capacity)
+        elif capacity > self.limit:
+            self.limit = min(self.max_workers, self.limit + 1)
+
+        if self.limit != old_limit:
+            self._record('adjust', old_limit)
+            self.logger.info(
+                f"🔧 GPU 調節: 並行數 {old_limit} → {self.limit} "
+                f"(每工作 {self.job_bytes_estimate / GB:.2f}GB, 可用 {free / GB:.1f}GB)"
+            )
+
+    def _record(self, event: str, old_limit: int):
+        self.history.append({
+            'time': time.time(),
+            'event': event,
+            'old_limit': old_limit,
+            'new_limit': self.limit,
+            'in_flight': self.in_flight,
+            'job_bytes_estimate': self.job_bytes_estimate
+        })
+
+    def summary(self) -> Dict:
+        """調節統計"""
+        limits = [entry['new_limit'] for entry in self.history] or [self.limit]
+        return {
+            'final_limit': self.limit,
+            'max_limit_reached': max(limits + [self.limit]),
+            'min_limit_reached': min(limits + [self.limit]),
+            'adjustments': sum(1 for entry in self.history if entry['event'] == 'adjust'),
+            'oom_count': self.oom_count,
+            'job_bytes_estimate': self.job_bytes_estimate
+        }
+
+
+def is_out_of_memory_error(error: BaseException) -> bool:
+    """判斷例外是否為 GPU 記憶體不足"""
+    if isinstance(error, SimulatedOutOfMemory):
+        return True
+    torch = sys.modules.get('torch')
+    oom_type = getattr(getattr(torch, 'cuda', None), 'OutOfMemoryError', None) if torch else None
+    if oom_type is not None and isinstance(error, oom_type):
+        return True
+    return 'out of memory' in str(error).lower()
+
+
+def simulate_batch(total_gb: float = 24.0,
+                   base_gb: float = 1.0,
+                   job_gb: float = 3.5,
+                   jitter: float = 0.2,
+                   jobs: int = 100,
+                   max_workers: int = 16,
+                   initial_workers: Optional[int] = None,
+                   job_seconds: float = 0.02,
+                   seed: int = 42) -> Dict:
+    """以模擬記憶體執行一個批次，回傳調節統計
+
+    Args:
+        total_gb: 模擬 GPU 總記憶體
+        base_gb: 常駐記憶體（模型權重）
+        job_gb: 每個工作的平均峰值記憶體
+        jitter: 每個工作記憶體的隨機變化比例
+        jobs: 工作數量
+        max_workers: 並行上限
+        initial_workers: 起始並行數（None = max_workers，模擬過度樂觀的初始猜測）
+        job_seconds: 每個模擬工作的執行時間
+        seed: 隨機種子
+    """
+    rng = random.Random(seed)
+    backend = SimulatedMemoryBackend(total_gb * GB, base_gb * GB)
+    governor = GPUMemoryGovernor(max_workers=max_workers, initial_workers=initial_workers,
+                                 backend=backend)
+
+    job_sizes = [int(job_gb * GB * (1 + rng.uniform(-jitter, jitter))) for _ in range(jobs)]
+    stats = {'completed': 0, 'retries': 0}
+    stats_lock = threading.Lock()
+
+    def run_job(nbytes: int):
+        while True:
+            with governor.slot():
+                try:
+                    backend.allocate(nbytes)
+                except SimulatedOutOfMemory:
+                    oom = True
+                else:
+                    oom = False
+                    time.sleep(job_seconds)
+                    backend.release(nbytes)
+            if not oom:
+                with stats_lock:
+                    stats['completed'] += 1
+                return
+            governor.report_oom()
+            with stats_lock:
+                stats['retries'] += 1
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(run_job, job_sizes))
+
+    result = governor.summary()
+    result.update(stats)
+    result['elapsed'] = time.time() - start_time
+    result['ideal_workers'] = int(((1 - governor.headroom) * total_gb - base_gb) // job_gb)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UVR5 GPU 記憶體調節器 CPU 模擬")
+    parser.add_argument('--total-gb', type=float, default=24.0, help='模擬 GPU 總記憶體 (GB)')
+    parser.add_argument('--base-gb', type=float, default=1.0, help='常駐記憶體 (GB)')
+    parser.add_argument('--job-gb', type=float, default=3.5, help='每個工作峰值記憶體 (GB)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='工作記憶體隨機變化比例')
+    parser.add_argument('--jobs', type=int, default=100, help='工作數量')
+    parser.add_argument('--max-workers', type=int, default=16, help='並行上限')
+    parser.add_argument('--initial-workers', type=int, help='起始並行數 (預設: 並行上限)')
+    parser.add_argument('--seed', type=int, default=42, help='隨機種子')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - GOVERNOR - %(levelname)s - %(message)s')
+
+    print("🎯 UVR5 GPU 記憶體調節器模擬")
+    print("=" * 50)
+    result = simulate_batch(
+        total_gb=args.total_gb, base_gb=args.base_gb, job_gb=args.job_gb,
+        jitter=args.jitter, jobs=args.jobs, max_workers=args.max_workers,
+        initial_workers=args.initial_workers, seed=args.seed
+    )
+
+    print("\n📊 模擬結果:")
+    print(f"  完成工作: {result['completed']}/{args.jobs}")
+    print(f"  OOM 重試: {result['retries']}")
+    print(f"  調整次數: {result['adjustments']}")
+    print(f"  最終並行數: {result['final_limit']} (理想值約 {result['ideal_workers']})")
+    print(f"  並行數範圍: {result['min_limit_reached']} - {result['max_limit_reached']}")
+    if result['job_bytes_estimate']:
+        print(f"  每工作估計: {result['job_bytes_estimate'] / GB:.2f} GB")
+
+    return 0 if result['completed'] == args.jobs else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+UVR5 批次工作清單
+以單一 SQLite 檔案記錄每個音檔的處理狀態，取代逐檔的 .bak/.bak.completed 標記
+
+主要功能：
+- 記錄每個檔案的狀態、輸入雜湊、輸出路徑與輸出檔的大小/修改時間
+- 重新啟動時以一次索引查詢取得已完成清單（檔案被替換時不視為已完成）
+- 管理原始檔案保留（集中存放於清單目錄下）
+- 中斷處理的原始檔案復原
+- 第一次開啟時併入舊版 .bak.completed / .bak 標記
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+
+class UVR5JobManifest:
+    """UVR5 工作清單 - 每個輸出目錄一個 SQLite 檔案
+
+    設計原則：
+    - 單一檔案：狀態集中於清單，不在音檔旁產生標記檔
+    - 索引查詢：重新啟動時一次讀出已完成的檔案
+    - 可攜路徑：以相對於清單根目錄的路徑作為主鍵
+    """
+
+    MANIFEST_FILENAME = ".uvr5_manifest.db"
+    ORIGINALS_DIRNAME = ".uvr5_originals"
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+
+    # 舊版逐檔標記：處理完成的原始檔 x.bak.completed、處理中斷的原始檔 x.bak
+    LEGACY_COMPLETED_SUFFIX = ".bak.completed"
+    LEGACY_BACKUP_SUFFIX = ".bak"
+    LEGACY_AUDIO_SUFFIXES = (".wav", ".flac", ".mp3", ".m4a", ".ogg")
+
+    def __init__(self, root_dir: Union[str, Path], manifest_path: Optional[Union[str, Path]] = None):
+        """
+        初始化工作清單
+
+        Args:
+            root_dir: 清單根目錄（批次處理的輸出目錄）
+            manifest_path: 清單檔案路徑（預設為 root_dir/.uvr5_manifest.db）
+        """
+        self.root_dir = Path(os.path.abspath(root_dir))
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = Path(manifest_path) if manifest_path else self.root_dir / self.MANIFEST_FILENAME
+        self.originals_dir = self.root_dir / self.ORIGINALS_DIRNAME
+        self.init_manifest()
+
+    @classmethod
+    def for_directory(cls, root_dir: Union[str, Path]) -> "UVR5JobManifest":
+        """取得指定目錄的工作清單（第一次開啟時併入舊版標記）"""
+        manifest = cls(root_dir)
+        manifest.migrate_legacy_markers()
+        return manifest
+
+    @classmethod
+    def for_output_directory(cls, input_dir: Union[str, Path], output_dir: Union[str, Path]) -> "UVR5JobManifest":
+        """輸出到其他目錄時的工作清單：存放於輸出目錄，主鍵仍相對於輸入目錄（不寫入輸入目錄）"""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        return cls(input_dir, manifest_path=output_dir / cls.MANIFEST_FILENAME)
+
+    @classmethod
+    def is_internal_path(cls, path: Union[str, Path]) -> bool:
+        """判斷路徑是否為清單內部使用的檔案（清單本身或保留的原始檔）"""
+        return any(part.startswith(".uvr5_") for part in Path(path).parts)
+
+    def _connect(self) -> sqlite3.Connection:
+        """建立資料庫連線（多執行緒同時寫入時等待鎖定）"""
+        return sqlite3.connect(self.manifest_path, timeout=30)
+
+    def init_manifest(self):
+        """建立工作清單資料表"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    rel_path TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    input_hash TEXT,
+                    output_path TEXT,
+                    original_path TEXT,
+                    error TEXT,
+                    processing_time REAL DEFAULT 0,
+                    audio_duration REAL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # 舊版清單補上音檔長度欄位（供排程器估算處理速度）
+            cursor.execute("PRAGMA table_info(jobs)")
+            columns = {row[1] for row in cursor.fetchall()}
+            if 'audio_duration' not in columns:
+                cursor.execute("ALTER TABLE jobs ADD COLUMN audio_duration REAL")
+            # 完成時輸出檔的大小與修改時間（偵測檔案在完成後被替換）
+            if 'output_size' not in columns:
+                cursor.execute("ALTER TABLE jobs ADD COLUMN output_size INTEGER")
+            if 'output_mtime_ns' not in columns:
+                cursor.execute("ALTER TABLE jobs ADD COLUMN output_mtime_ns INTEGER")
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+
+            conn.commit()
+
+    def key_for(self, path: Union[str, Path]) -> str:
+        """將檔案路徑轉換為清單主鍵（相對於根目錄的 POSIX 路徑，不觸發檔案系統查詢）"""
+        path = Path(os.path.abspath(path))
+        try:
+            return path.relative_to(self.root_dir).as_posix()
+        except ValueError:
+            # 不在根目錄下的檔案使用絕對路徑
+            return path.as_posix()
+
+    def retained_original_path(self, path: Union[str, Path]) -> Path:
+        """原始檔案保留位置（集中存放於 .uvr5_originals/ 下，保留相對目錄結構）"""
+        key = self.key_for(path)
+        return self.originals_dir / key.lstrip("/")
+
+    def completed_outputs(self) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+        """取得所有已完成檔案的主鍵與完成時輸出檔的 (大小, 修改時間)（一次索引查詢）"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT rel_path, output_size, output_mtime_ns FROM jobs WHERE status = ?",
+                           (self.STATUS_COMPLETED,))
+            return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    @staticmethod
+    def output_unchanged(output_stat: Tuple[Optional[int], Optional[int]], path: Union[str, Path]) -> bool:
+        """檔案是否仍是完成時的輸出（舊記錄沒有大小/修改時間時只檢查存在）"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        size, mtime_ns = output_stat
+        if size is None:
+            return True
+        return stat.st_size == size and stat.st_mtime_ns == mtime_ns
+
+    def completed_record(self, path: Union[str, Path],
+                         output_path: Union[str, Path]) -> Optional[Dict]:
+        """
+        取得仍然有效的已完成記錄（否則回傳 None）
+
+        - 記錄的輸出路徑相同，且輸出檔仍是完成時寫出的檔案（大小與修改時間相同）
+        - 輸出到其他位置時，輸入檔內容須與處理時相同（同名的新輸入不會被當成已完成）
+        """
+        record = self.get(path)
+        if not record or record['status'] != self.STATUS_COMPLETED \
+                or record['output_path'] != os.path.abspath(output_path):
+            return None
+        if not self.output_unchanged((record['output_size'], record['output_mtime_ns']), output_path):
+            return None
+        if os.path.abspath(path) != os.path.abspath(output_path):
+            if not record['input_hash'] or not os.path.exists(path) \
+                    or compute_file_hash(path) != record['input_hash']:
+                return None
+        return record
+
+    def get(self, path: Union[str, Path]) -> Optional[Dict]:
+        """取得單一檔案的清單記錄"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT rel_path, status, input_hash, output_path, original_path, error, processing_time,
+                       output_size, output_mtime_ns
+                FROM jobs WHERE rel_path = ?
+            """, (self.key_for(path),))
+            row = cursor.fetchone()
+
+        if not row:
+            return None
+
+        return {
+            'rel_path': row[0],
+            'status': row[1],
+            'input_hash': row[2],
+            'output_path': row[3],
+            'original_path': row[4],
+            'error': row[5],
+            'processing_time': row[6],
+            'output_size': row[7],
+            'output_mtime_ns': row[8]
+        }
+
+    def mark_running(self, path: Union[str, Path], input_hash: Optional[str] = None,
+                     output_path: Optional[Union[str, Path]] = None,
+                     original_path: Optional[Union[str, Path]] = None):
+        """標記檔案開始處理"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR REPLACE INTO jobs
+                (rel_path, status, input_hash, output_path, original_path, error, processing_time, updated_at)
+                VALUES (?, ?, ?, ?, ?, NULL, 0, CURRENT_TIMESTAMP)
+            """, (
+                self.key_for(path),
+                self.STATUS_RUNNING,
+                input_hash,
+                os.path.abspath(output_path) if output_path else None,
+                os.path.abspath(original_path) if original_path else None
+            ))
+            conn.commit()
+
+    def mark_completed(self, path: Union[str, Path], output_path: Optional[Union[str, Path]] = None,
+                       processing_time: float = 0.0, audio_duration: Optional[float] = None):
+        """標記檔案處理完成（同時記錄輸出檔的大小與修改時間）"""
+        record = self.get(path)
+        final_output = output_path or (record['output_path'] if record else None)
+        output_stat = os.stat(final_output) if final_output and os.path.exists(final_output) else None
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE jobs
+                SET status = ?, output_path = COALESCE(?, output_path), error = NULL,
+                    processing_time = ?, audio_duration = COALESCE(?, audio_duration),
+                    output_size = ?, output_mtime_ns = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE rel_path = ?
+            """, (
+                self.STATUS_COMPLETED,
+                os.path.abspath(output_path) if output_path else None,
+                processing_time,
+                audio_duration,
+                output_stat.st_size if output_stat else None,
+                output_stat.st_mtime_ns if output_stat else None,
+                self.key_for(path)
+            ))
+            conn.commit()
+
+    def mark_failed(self, path: Union[str, Path], error: str, processing_time: float = 0.0):
+        """標記檔案處理失敗（原始檔案已還原，保留路徑清空）"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE jobs
+                SET status = ?, original_path = NULL, error = ?,
+                    processing_time = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE rel_path = ?
+            """, (self.STATUS_FAILED, error, processing_time, self.key_for(path)))
+            conn.commit()
+
+    def recover_interrupted(self, path: Union[str, Path]) -> bool:
+        """從保留的原始檔案復原中斷的處理
+
+        Returns:
+            bool: 是否進行了復原
+        """
+        record = self.get(path)
+        if not record or record['status'] != self.STATUS_RUNNING or not record['original_path']:
+            return False
+
+        original_path = Path(record['original_path'])
+        if not original_path.exists():
+            return False
+
+        path = Path(path)
+        if path.exists():
+            path.unlink()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(original_path), str(path))
+        return True
+
+    def completed_timings(self) -> List[Tuple[float, float]]:
+        """取得已完成工作的 (音檔長度, 處理時間)，供排程器估算各長度區間的處理速度"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT audio_duration, processing_time FROM jobs
+                WHERE status = ? AND audio_duration IS NOT NULL AND processing_time > 0
+            """, (self.STATUS_COMPLETED,))
+            return cursor.fetchall()
+
+    def _legacy_audio_path(self, marker: Path, suffix: str) -> Optional[Path]:
+        """舊版標記對應的音檔（標記以 with_suffix 產生，原副檔名需逐一嘗試）"""
+        stem = marker.name[:-len(suffix)]
+        for audio_suffix in self.LEGACY_AUDIO_SUFFIXES:
+            candidate = marker.with_name(stem + audio_suffix)
+            if candidate.exists():
+                return candidate
+        return marker.with_name(stem + self.LEGACY_AUDIO_SUFFIXES[0])
+
+    def migrate_legacy_markers(self) -> Dict[str, int]:
+        """
+        併入舊版逐檔標記（每份清單只走訪一次）
+
+        - x.bak.completed：x 已處理完成，記為完成並以標記檔作為保留的原始檔
+        - x.bak（且 x 存在）：處理中斷，以備份還原 x 後重新處理
+
+        Returns:
+            Dict: {'completed': 併入數, 'recovered': 還原數}
+        """
+        counts = {'completed': 0, 'recovered': 0}
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM meta WHERE key = 'legacy_markers_migrated'")
+            if cursor.fetchone():
+                return counts
+
+        for dirpath, dirnames, filenames in os.walk(self.root_dir):
+            dirnames[:] = [name for name in dirnames if not self.is_internal_path(name)]
+            for filename in filenames:
+                marker = Path(dirpath) / filename
+                if filename.endswith(self.LEGACY_COMPLETED_SUFFIX):
+                    audio_path = self._legacy_audio_path(marker, self.LEGACY_COMPLETED_SUFFIX)
+                    if not audio_path.exists() or self.get(audio_path):
+                        continue
+                    self.mark_running(audio_path, output_path=audio_path, original_path=marker)
+                    self.mark_completed(audio_path, output_path=audio_path)
+                    counts['completed'] += 1
+                elif filename.endswith(self.LEGACY_BACKUP_SUFFIX):
+                    # 與舊版相同：只有同名音檔（未完成的輸出）存在時才視為中斷的處理
+                    audio_path = self._legacy_audio_path(marker, self.LEGACY_BACKUP_SUFFIX)
+                    if not audio_path.exists():
+                        continue
+                    audio_path.unlink()
+                    shutil.move(str(marker), str(audio_path))
+                    counts['recovered'] += 1
+
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_markers_migrated', ?)",
+                         (str(counts['completed']),))
+            conn.commit()
+        return counts
+
+    def summary(self) -> Dict[str, int]:
+        """各狀態的檔案數量統計"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            return {status: count for status, count in cursor.fetchall()}
+
+
+def compute_file_hash(file_path: Union[str, Path], chunk_size: int = 1024 * 1024) -> str:
+    """計算檔案內容雜湊（BLAKE2b，128 位元）"""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
@@ -14,36 +14,72 @@ Version: 1.0
 """
 
 import gc
+import inspect
+import itertools
 import json
 import logging
 import os
+import queue
+import random
 import sys
 import time
 import traceback
 import shutil
 import tempfile
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import threading
 import numpy as np
 
-try:
-    import torch
-    import torchaudio
-except ImportError:
-    print("❌ 請安裝 PyTorch: pip install torch torchaudio")
-    sys.exit(1)
+# torch / torchaudio / audio-separator 於第一次建立處理器時才載入（_init_runtime），
+# 只需掃描或統計的 CLI 指令不必承擔匯入與 CUDA 初始化的時間
+torch = None
+torchaudio = None
+Separator = None
 
-try:
-    from audio_separator.separator import Separator
-except ImportError:
-    print("❌ 請安裝 audio-separator: pip install 'audio-separator[gpu]'")
-    sys.exit(1)
+
+def _init_runtime():
+    """載入 torch、torchaudio 與 audio-separator（只執行一次）"""
+    global torch, torchaudio, Separator
+    if Separator is not None:
+        return
+
+    try:
+        import torch as torch_module
+        import torchaudio as torchaudio_module
+    except ImportError:
+        print("❌ 請安裝 PyTorch: pip install torch torchaudio")
+        sys.exit(1)
+
+    try:
+        from audio_separator.separator import Separator as separator_class
+    except ImportError:
+        print("❌ 請安裝 audio-separator: pip install 'audio-separator[gpu]'")
+        sys.exit(1)
+
+    torch, torchaudio, Separator = torch_module, torchaudio_module, separator_class
 
 from tqdm import tqdm
 import psutil
 
+try:
+    from src.uvr5_manifest import UVR5JobManifest, compute_file_hash
+    from src.uvr5_governor import GPUMemoryGovernor, is_out_of_memory_error
+    from src.uvr5_scheduler import LengthBucketScheduler, probe_duration
+    from src.uvr5_prescreen import AudioPrescreener
+    from src.uvr5_discovery import iter_audio_files, read_file_list, tee_file_list
+    from src.split_dataset import SPLIT_SUBSETS, load_split_manifest, load_splits_info, rewrite_manifest_paths
+    from src import telemetry
+except ImportError:
+    from uvr5_manifest import UVR5JobManifest, compute_file_hash
+    from uvr5_governor import GPUMemoryGovernor, is_out_of_memory_error
+    from uvr5_scheduler import LengthBucketScheduler, probe_duration
+    from uvr5_prescreen import AudioPrescreener
+    from uvr5_discovery import iter_audio_files, read_file_list, tee_file_list
+    from split_dataset import SPLIT_SUBSETS, load_split_manifest, load_splits_info, rewrite_manifest_paths
+    import telemetry
+
 
 class UVR5Processor:
     """UVR5 音頻增強處理器 - 專門處理切分後的短音檔
@@ -55,6 +91,15 @@ class UVR5Processor:
     - 配置靈活：透過參數控制處理行為
     """
     
+    # 工作暫存目錄內的固定檔名
+    JOB_INPUT_NAME = "input.wav"
+    JOB_VOCALS_NAME = "vocals.wav"
+    JOB_INSTRUMENTAL_NAME = "instrumental.wav"
+    JOB_RESTORED_NAME = "restored.wav"
+
+    # 切分清單模式的預設輸出目錄（位於切分目錄下）
+    SPLIT_ENHANCED_DIRNAME = "enhanced"
+
     def __init__(self, 
                  model_path: str = "models/uvr5",
                  vocal_model: str = "model_bs_roformer_ep_317_sdr_12.9755.ckpt",
@@ -62,10 +107,15 @@ class UVR5Processor:
                  batch_size: int = 1,
                  min_duration: float = None,
                  target_duration: float = None,
-                 processing_timeout: int = None):
+                 processing_timeout: int = None,
+                 cleanup_temp: bool = True):
         """
         初始化 UVR5 處理器
+
+        cleanup_temp: 啟動時清空暫存目錄；多執行緒處理器池的實例傳入 False，
+                      避免批次中途建立的實例刪除其他執行中工作的目錄（各工作結束時自行清理）
         """
+        _init_runtime()
         self.model_path = Path(model_path)
         self.vocal_model = vocal_model
         self.batch_size = batch_size
@@ -80,12 +130,21 @@ class UVR5Processor:
         # --- 建立並清理專用的暫存目錄 ---
         self.temp_dir = Path.cwd() / "data" / "temp"
         self.temp_dir.mkdir(parents=True, exist_ok=True)
-        self._cleanup_temp_dir(initial_cleanup=True)
+        if cleanup_temp:
+            self._cleanup_temp_dir(initial_cleanup=True)
 
         self.device = self._setup_device(device)
         self.separator = None
         self._setup_separator()
-        
+
+        # 工作清單（批次處理時由 batch_enhance 指定，單檔處理時依輸出目錄建立）
+        self.manifest = None
+        self._manifests = {}
+        self.schedule_plan = None  # 最近一次批次的長度分桶計劃
+
+        # 預篩器：乾淨語音略過人聲分離（UVR5_PRESCREEN=true 啟用）
+        self.prescreener = AudioPrescreener() if os.getenv('UVR5_PRESCREEN', 'false').lower() == 'true' else None
+
         self.stats = {
             'processed_files': 0,
             'failed_files': 0,
@@ -191,18 +250,18 @@ class UVR5Processor:
             float: 音頻長度（秒）
         """
         try:
-            waveform, sample_rate = torchaudio.load(audio_path)
-            duration = waveform.shape[1] / sample_rate
-            return duration
+            # 只讀取檔頭，不解碼整個音檔
+            return probe_duration(audio_path)
         except Exception as e:
             self.logger.warning(f"⚠️  無法獲取音頻長度 {audio_path}: {e}")
             return 0.0
     
-    def pad_audio_for_uvr5(self, input_path: str) -> Optional[str]:
+    def pad_audio_for_uvr5(self, input_path: str, output_dir: Optional[Path] = None) -> Optional[str]:
         """為短音頻檔案進行補零預處理，並統一音頻格式
         
         Args:
             input_path: 輸入音頻檔案路徑
+            output_dir: 補零檔案輸出目錄 (None = 暫存目錄，檔名加上唯一識別)
             
         Returns:
             Optional[str]: 預處理後的臨時檔案路徑，如果不需要預處理則返回 None
@@ -246,16 +305,17 @@ class UVR5Processor:
             
             # 如果需要補零預處理，創建臨時檔案
             if needs_padding:
-                import os
-                import threading
-                
-                input_path_obj = Path(input_path)
-                process_id = os.getpid()
-                thread_id = threading.get_ident()
-                timestamp = int(time.time() * 1000000)  # 微秒級精度
-                
-                temp_filename = f"processed_p{process_id}_t{thread_id}_{timestamp}_{input_path_obj.name}"
-                temp_path = self.temp_dir / temp_filename
+                if output_dir is not None:
+                    # 工作目錄內使用固定檔名
+                    temp_path = Path(output_dir) / self.JOB_INPUT_NAME
+                else:
+                    input_path_obj = Path(input_path)
+                    process_id = os.getpid()
+                    thread_id = threading.get_ident()
+                    timestamp = int(time.time() * 1000000)  # 微秒級精度
+                    
+                    temp_filename = f"processed_p{process_id}_t{thread_id}_{timestamp}_{input_path_obj.name}"
+                    temp_path = self.temp_dir / temp_filename
                 
                 # 保存預處理後的音頻
                 torchaudio.save(str(temp_path), waveform, sample_rate)
@@ -269,17 +329,118 @@ class UVR5Processor:
         except Exception as e:
             self.logger.error(f"❌ 音頻預處理失敗 {input_path}: {e}")
             return None
-    
-    def enhance_audio(self, input_path: str, output_path: Optional[str] = None, 
-                     backup_original: any = False) -> Dict:
+
+    def _create_job_dir(self) -> Path:
+        """建立單一檔案專用的工作暫存目錄
+        
+        使用進程ID + 執行緒ID + 時間戳 + 隨機數避免高並發衝突
         """
-        對單個音檔進行 UVR5 增強處理
+        process_id = os.getpid()
+        thread_id = threading.get_ident()
+        timestamp = int(time.time() * 1000000)  # 微秒級精度
+        random_id = random.randint(1000, 9999)
+        
+        job_dir = self.temp_dir / f"uvr5_p{process_id}_t{thread_id}_{timestamp}_{random_id}"
+        job_dir.mkdir(parents=True, exist_ok=True)
+        return job_dir
+
+    def _separate_vocals(self, input_file: Path, job_dir: Path) -> Path:
+        """在工作目錄中執行人聲分離，並回傳固定命名的人聲檔案路徑
         
+        Args:
+            input_file: 分離器輸入檔案
+            job_dir: 此檔案的工作暫存目錄
+            
+        Returns:
+            Path: 人聲檔案路徑（job_dir/vocals.wav）
+        """
+        # 分離器與已載入的模型實例都需指向工作目錄
+        self.separator.output_dir = str(job_dir)
+        model_instance = getattr(self.separator, 'model_instance', None)
+        if model_instance is not None and hasattr(model_instance, 'output_dir'):
+            model_instance.output_dir = str(job_dir)
+        
+        if 'custom_output_names' in inspect.signature(self.separator.separate).parameters:
+            output_files = self.separator.separate(
+                str(input_file),
+                custom_output_names={
+                    'Vocals': Path(self.JOB_VOCALS_NAME).stem,
+                    'Instrumental': Path(self.JOB_INSTRUMENTAL_NAME).stem
+                }
+            )
+            vocals_path = job_dir / self.JOB_VOCALS_NAME
+        else:
+            # 舊版 audio-separator 不支援 custom_output_names，改用回傳檔名（同樣位於工作目錄）
+            output_files = self.separator.separate(str(input_file))
+            vocals_file = next((f for f in output_files if f and '(vocals)' in Path(str(f)).name.lower()), None)
+            if vocals_file is None:
+                raise RuntimeError("人聲檔案生成失敗")
+            vocals_path = job_dir / Path(str(vocals_file)).name
+        
+        if not vocals_path.exists():
+            raise FileNotFoundError(f"Vocals 檔案不存在: {vocals_path} (分離器輸出: {output_files})")
+        
+        return vocals_path
+
+    def _get_manifest(self, directory: Path) -> UVR5JobManifest:
+        """取得（並快取）指定目錄的工作清單"""
+        directory = Path(os.path.abspath(directory))
+        if directory not in self._manifests:
+            self._manifests[directory] = UVR5JobManifest.for_directory(directory)
+        return self._manifests[directory]
+
+    def _separate_to_output(self, actual_input_path: Path, job_dir: Path, output_path: Path,
+                            preprocessed_file: Optional[str], original_duration: float, input_name: str):
+        """人聲分離並寫入輸出路徑（補零過的音檔還原為原始長度）"""
+        # 分離人聲（輸出檔名由工作目錄決定，不需搜尋）
+        with telemetry.span('separate', file=input_name, duration=round(original_duration, 2)):
+            vocals_path = self._separate_vocals(actual_input_path, job_dir)
+
+        # 如果進行了預處理（補零），需要還原到原始長度
+        if preprocessed_file and original_duration > 0:
+            self.logger.debug(f"🔧 還原音頻長度: {self.target_duration:.2f}s → {original_duration:.2f}s")
+
+            # 載入處理後的人聲檔案
+            processed_waveform, processed_sample_rate = torchaudio.load(str(vocals_path))
+
+            # 計算原始音頻的樣本數
+            original_samples = int(original_duration * processed_sample_rate)
+
+            # 從補零音頻中提取原始長度部分（移除前後補零）
+            # 補零是前後平均分配的，所以從中間提取原始長度
+            total_samples = processed_waveform.shape[1]
+            padding_samples = total_samples - original_samples
+            padding_before = padding_samples // 2
+
+            # 提取原始音頻部分
+            restored_waveform = processed_waveform[:, padding_before:padding_before + original_samples]
+
+            # 保存還原長度的音頻
+            temp_restored_file = job_dir / self.JOB_RESTORED_NAME
+            torchaudio.save(str(temp_restored_file), restored_waveform, processed_sample_rate)
+
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(temp_restored_file), str(output_path))
+            self.logger.info(f"✅ 人聲分離完成: {input_name} (還原: {original_duration:.2f}s)")
+        else:
+            # 沒有預處理的情況，直接移動
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(vocals_path), str(output_path))
+            self.logger.info(f"✅ 人聲分離完成: {input_name} (原始: {original_duration:.2f}s)")
+
+    def enhance_audio(self, input_path: str, output_path: Optional[str] = None,
+                     backup_original: any = False,
+                     manifest: Optional[UVR5JobManifest] = None) -> Dict:
+        """
+        對單個音檔進行 UVR5 增強處理
+
         Args:
             input_path: 輸入音檔路徑
             output_path: 輸出路徑 (None = 原地替換)
-            backup_original: 是否備份原始檔案 (可接受 'true'/'false' 字串)
-            
+            backup_original: 是否保留原始檔案 (可接受 'true'/'false' 字串)，
+                             原始檔案由工作清單集中保存於 .uvr5_originals/
+            manifest: 工作清單 (None = 使用批次清單或輸出目錄的清單)
+
         Returns:
             Dict: 處理結果
         """
@@ -295,7 +456,6 @@ class UVR5Processor:
             output_path = input_path  # 原地替換
         else:
             output_path = Path(output_path)
-            output_path.parent.mkdir(parents=True, exist_ok=True)
         
         result = {
             'input_file': str(input_path),
@@ -309,218 +469,124 @@ class UVR5Processor:
         
         start_time = time.time()
         initial_memory = psutil.Process().memory_info().rss / (1024**2)
-        
+
         preprocessed_file = None
         actual_input_path = input_path
         temp_output_dir = None
-        
+        job_path = input_path  # 工作清單中的檔案路徑（保留原始檔時 input_path 會改指向保留位置）
+        in_place = output_path == input_path
+
+        if manifest is None:
+            manifest = self.manifest or self._get_manifest(output_path.parent)
+
         try:
-            # --- 🚀 優先檢查是否已處理過（真正快速跳過） ---
-            if backup_original and output_path == input_path:
-                backup_path = input_path.with_suffix('.bak')
-                completed_backup_path = input_path.with_suffix('.bak.completed')
-                
-                # 檢查處理狀態
-                if completed_backup_path.exists():
-                    # 已完成處理，跳過
-                    result['success'] = True
-                    result['enhanced'] = False
-                    result['already_processed'] = True
-                    result['backup_file'] = str(completed_backup_path)
-                    result['processing_time'] = time.time() - start_time
-                    self.logger.debug(f"⏭️ 檔案已處理完成: {input_path.name}")
-                    return result
-                elif backup_path.exists():
-                    # 有備份但未完成標記 = 之前處理中斷，需要恢復
-                    self.logger.warning(f"⚠️ 發現中斷的處理，從備份恢復: {input_path.name}")
-                    
-                    # 刪除可能損壞的原檔案
-                    if input_path.exists():
-                        input_path.unlink()
-                    
-                    # 從備份恢復原檔案
-                    backup_path.rename(input_path)
-                    
-                    self.logger.info(f"✅ 已從備份恢復，重新開始處理")
-                    
-                    # 重置備份路徑，後續會重新備份
-                    backup_path = input_path.with_suffix('.bak')
-            
+            # --- 🚀 優先檢查是否已處理過（清單記錄 + 輸出檔/輸入雜湊驗證） ---
+            record = manifest.completed_record(job_path, output_path)
+            if record:
+                result['success'] = True
+                result['enhanced'] = False
+                result['already_processed'] = True
+                if record['original_path']:
+                    result['backup_file'] = record['original_path']
+                result['processing_time'] = time.time() - start_time
+                self.logger.debug(f"⏭️ 檔案已處理完成: {input_path.name}")
+                return result
+
+            record = manifest.get(job_path)
+            if record and record['status'] == UVR5JobManifest.STATUS_RUNNING:
+                # 清單中為處理中 = 之前處理中斷，如有保留原始檔則恢復
+                if manifest.recover_interrupted(job_path):
+                    self.logger.warning(f"⚠️ 發現中斷的處理，已從保留的原始檔案恢復: {input_path.name}")
+
             # --- 只有未處理的檔案才進行音檔分析 ---
             original_duration = self.get_audio_duration(str(input_path))
             result['original_duration'] = original_duration
-            
-            # 所有音檔都需要格式檢查和標準化（不只是短音檔）
-            preprocessed_file = self.pad_audio_for_uvr5(str(input_path))
+
+            # 預篩：乾淨語音直接通過、平穩雜訊輕度降噪，其餘才進行人聲分離
+            route = AudioPrescreener.ROUTE_SEPARATE
+            if self.prescreener is not None:
+                screening = self.prescreener.screen_file(input_path)
+                route = screening['route']
+                result['prescreen'] = route
+                result['prescreen_features'] = {k: v for k, v in screening.items() if k != 'route'}
+
+            # 每個檔案使用獨立的工作暫存目錄，所有中間檔案都在此目錄內，結束時整個移除
+            temp_output_dir = self._create_job_dir()
+
+            # 需要人聲分離的音檔都要格式檢查和標準化（不只是短音檔）
+            if route == AudioPrescreener.ROUTE_SEPARATE:
+                preprocessed_file = self.pad_audio_for_uvr5(str(input_path), output_dir=temp_output_dir)
             if preprocessed_file:
                 actual_input_path = Path(preprocessed_file)
                 result['preprocessed'] = True
             else:
                 self.logger.debug(f"ℹ️  音頻無需預處理: {input_path.name}")
 
-            # 備份原始檔案（只有需要處理的檔案才備份）
-            if backup_original and output_path == input_path:
-                backup_path = input_path.with_suffix('.bak')
-                input_path.rename(backup_path)
-                input_path = backup_path
-                result['backup_file'] = str(backup_path)
-                self.logger.info(f"💾 已備份原始檔案: {backup_path.name}")
-                
-                # 更新actual_input_path，如果之前是預處理檔案則不變，否則更新為備份檔案
+            input_hash = compute_file_hash(input_path)
+
+            # 保留原始檔案（只有內容會改變的檔案才保留，集中存放於清單目錄）
+            original_path = None
+            if backup_original and in_place and route != AudioPrescreener.ROUTE_PASSTHROUGH:
+                original_path = manifest.retained_original_path(job_path)
+                original_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(input_path), str(original_path))
+                input_path = original_path
+                result['backup_file'] = str(original_path)
+                self.logger.info(f"💾 已保留原始檔案: {original_path}")
+
+                # 更新actual_input_path，如果之前是預處理檔案則不變，否則更新為保留的原始檔案
                 if not preprocessed_file:
-                    actual_input_path = backup_path
+                    actual_input_path = original_path
 
-            # 使用專用暫存目錄，避免在根目錄產生散落檔案
-            # 使用進程ID + 執行緒ID + 時間戳 + 隨機數避免高並發衝突
-            import random
-            import os
-            import threading
-            
-            process_id = os.getpid()
-            thread_id = threading.get_ident()
-            timestamp = int(time.time() * 1000000)  # 微秒級精度
-            random_id = random.randint(1000, 9999)
-            
-            temp_output_dir = self.temp_dir / f"uvr5_p{process_id}_t{thread_id}_{timestamp}_{random_id}"
-            temp_output_dir.mkdir(parents=True, exist_ok=True)
-            
-            self.separator.output_dir = str(temp_output_dir)
-            output_files = self.separator.separate(str(actual_input_path))
-            
-            # 尋找 Vocals 檔案
-            vocals_file = next((f for f in output_files if f is not None and str(f) and ('vocals' in str(f).lower() or '(vocals)' in str(f).lower())), None)
-            
-            if vocals_file:
-                # 檢查多個可能的位置
-                possible_locations = [
-                    temp_output_dir / str(vocals_file),                    # 指定的暫存目錄
-                    self.temp_dir / str(vocals_file),                     # 主暫存目錄
-                    Path.cwd() / str(vocals_file),                        # 工作目錄
-                    Path(str(vocals_file))                                # 絕對路徑
-                ]
-                
-                vocals_path = None
-                for location in possible_locations:
-                    if location.exists():
-                        vocals_path = location
-                        break
-                
-                if vocals_path is None:
-                    # 如果還是找不到，嘗試搜尋整個暫存目錄
-                    vocals_filename = Path(vocals_file).name
-                    
-                    # 搜尋所有可能的位置
-                    for search_dir in [temp_output_dir, self.temp_dir, Path.cwd()]:
-                        for found_file in search_dir.rglob(vocals_filename):
-                            if found_file.exists():
-                                vocals_path = found_file
-                                break
-                        if vocals_path:
-                            break
-                
-                if vocals_path is None:
-                    self.logger.error(f"❌ 完全找不到 Vocals 檔案: {vocals_file}")
-                
-                if vocals_path:
-                    # 如果進行了預處理（補零），需要還原到原始長度
-                    if preprocessed_file and original_duration > 0:
-                        self.logger.debug(f"🔧 還原音頻長度: 15.00s → {original_duration:.2f}s")
-                        
-                        # 載入處理後的人聲檔案
-                        processed_waveform, processed_sample_rate = torchaudio.load(str(vocals_path))
-                        
-                        # 計算原始音頻的樣本數
-                        original_samples = int(original_duration * processed_sample_rate)
-                        
-                        # 從補零音頻中提取原始長度部分（移除前後補零）
-                        # 補零是前後平均分配的，所以從中間提取原始長度
-                        total_samples = processed_waveform.shape[1]
-                        padding_samples = total_samples - original_samples
-                        padding_before = padding_samples // 2
-                        
-                        # 提取原始音頻部分
-                        restored_waveform = processed_waveform[:, padding_before:padding_before + original_samples]
-                        
-                        # 保存還原長度的音頻
-                        temp_restored_file = temp_output_dir / f"restored_{Path(vocals_file).name}"
-                        torchaudio.save(str(temp_restored_file), restored_waveform, processed_sample_rate)
-                        
-                        # 確保還原檔案存在再移動
-                        if temp_restored_file.exists():
-                            # 確保輸出目錄存在
-                            output_path.parent.mkdir(parents=True, exist_ok=True)
-                            shutil.move(str(temp_restored_file), str(output_path))
-                        else:
-                            raise FileNotFoundError(f"還原檔案生成失敗: {temp_restored_file}")
-                        self.logger.info(f"✅ 人聲分離完成: {input_path.name} (還原: {original_duration:.2f}s)")
-                    else:
-                        # 沒有預處理的情況，直接移動
-                        if vocals_path.exists():
-                            # 確保輸出目錄存在
-                            output_path.parent.mkdir(parents=True, exist_ok=True)
-                            shutil.move(str(vocals_path), str(output_path))
-                        else:
-                            raise FileNotFoundError(f"Vocals 檔案不存在: {vocals_path}")
-                        self.logger.info(f"✅ 人聲分離完成: {input_path.name} (原始: {original_duration:.2f}s)")
-                    
-                    result['enhanced'] = True
+            manifest.mark_running(job_path, input_hash=input_hash,
+                                  output_path=output_path, original_path=original_path)
+
+            if route == AudioPrescreener.ROUTE_PASSTHROUGH:
+                # 乾淨語音：原地處理時檔案不變，否則直接複製
+                if not in_place:
+                    output_path.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(str(input_path), str(output_path))
+                self.logger.info(f"⏩ 預篩為乾淨語音，略過人聲分離: {input_path.name}")
+            elif route == AudioPrescreener.ROUTE_DENOISE:
+                denoised_path = self.prescreener.denoise_file(actual_input_path, temp_output_dir / self.JOB_VOCALS_NAME)
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(denoised_path), str(output_path))
+                self.logger.info(f"🔉 預篩為平穩雜訊，輕度降噪完成: {input_path.name}")
             else:
-                raise RuntimeError("人聲檔案生成失敗")
+                self._separate_to_output(actual_input_path, temp_output_dir, output_path,
+                                         preprocessed_file, original_duration, input_path.name)
 
+            result['enhanced'] = route != AudioPrescreener.ROUTE_PASSTHROUGH
             result['success'] = True
-            
-            # 處理成功後，創建完成標記
-            if backup_original and output_path == input_path and 'backup_file' in result:
-                backup_path = Path(result['backup_file'])
-                completed_backup_path = input_path.with_suffix('.bak.completed')
-                
-                # 將 .bak 重命名為 .bak.completed 表示處理完成
-                if backup_path.exists():
-                    backup_path.rename(completed_backup_path)
-                    result['backup_file'] = str(completed_backup_path)
-                    self.logger.debug(f"✅ 標記處理完成: {completed_backup_path.name}")
+
+            # 處理成功後，於工作清單標記完成
+            manifest.mark_completed(job_path, output_path=output_path,
+                                    processing_time=time.time() - start_time,
+                                    audio_duration=original_duration)
+            self.logger.debug(f"✅ 標記處理完成: {job_path.name}")
 
         except Exception as e:
             # --- 錯誤處理 ---
             result['error'] = str(e)
+            result['out_of_memory'] = is_out_of_memory_error(e)
             self.logger.error(f"❌ 人聲分離失敗 {input_path.name}: {e}")
             self.logger.debug(f"Exception traceback: {traceback.format_exc()}")
-            
+
             if backup_original and 'backup_file' in result:
-                backup_path = Path(result['backup_file'])
-                if backup_path.exists():
-                    backup_path.rename(output_path)
-        
+                original_path = Path(result.pop('backup_file'))
+                if original_path.exists():
+                    shutil.move(str(original_path), str(output_path))
+
+            try:
+                manifest.mark_failed(job_path, str(e), processing_time=time.time() - start_time)
+            except Exception as manifest_error:
+                self.logger.warning(f"⚠️ 更新工作清單失敗: {manifest_error}")
+
         finally:
-            # --- 資源清理 ---
-            if temp_output_dir and temp_output_dir.exists():
+            # --- 資源清理：只移除此檔案的工作目錄（補零檔、伴奏、人聲皆在其中） ---
+            if temp_output_dir is not None:
                 shutil.rmtree(temp_output_dir, ignore_errors=True)
-            
-            if preprocessed_file and Path(preprocessed_file).exists():
-                try:
-                    Path(preprocessed_file).unlink()
-                except OSError as e:
-                    self.logger.warning(f"⚠️  清理預處理檔案失敗: {e}")
-            
-            # 額外清理：清除可能散落在工作目錄的伴奏檔案
-            try:
-                current_dir = Path.cwd()
-                for pattern in ['*_(Instrumental)_*.wav', 'padded_*_(Instrumental)_*.wav']:
-                    for leftover_file in current_dir.glob(pattern):
-                        leftover_file.unlink()
-                        self.logger.debug(f"🧹 清理散落檔案: {leftover_file.name}")
-            except Exception as e:
-                self.logger.debug(f"清理散落檔案時出現錯誤: {e}")
-            
-            # 清理此檔案相關的 temp 檔案
-            try:
-                input_filename = input_path.stem
-                for temp_file in self.temp_dir.glob(f"*{input_filename}*"):
-                    temp_file.unlink()
-                    self.logger.debug(f"🧹 清理暫存檔案: {temp_file.name}")
-            except Exception as e:
-                self.logger.debug(f"清理暫存檔案時出現錯誤: {e}")
-            
+
             if self.device == 'cuda':
                 torch.cuda.empty_cache()
             gc.collect()
@@ -532,25 +598,32 @@ class UVR5Processor:
         
         return result
     
+    @staticmethod
+    def _count_directory(dir_stats: Dict[str, int], input_dir: Path, audio_file: Path):
+        """累計音檔所在子目錄的檔案數量"""
+        # 取得相對於輸入目錄的路徑
+        try:
+            relative_parent = audio_file.parent.relative_to(input_dir)
+        except ValueError:
+            relative_parent = audio_file.parent
+        parent_dir = str(relative_parent) if relative_parent != Path('.') else '根目錄'
+        dir_stats[parent_dir] = dir_stats.get(parent_dir, 0) + 1
+    
     def _analyze_directory_structure(self, input_dir: Path, audio_files: List[Path]):
         """分析並顯示目錄結構統計"""
+        dir_stats = {}
+        for audio_file in audio_files:
+            self._count_directory(dir_stats, input_dir, audio_file)
+        self._print_directory_structure(input_dir, dir_stats, len(audio_files))
+    
+    def _print_directory_structure(self, input_dir: Path, dir_stats: Dict[str, int], total_files: int):
+        """顯示目錄結構統計"""
         print("\n" + "="*60)
         print("📊 目錄結構分析")
         print("="*60)
         
-        # 統計每個子目錄的檔案數量
-        dir_stats = {}
-        for audio_file in audio_files:
-            # 取得相對於輸入目錄的路徑
-            relative_path = audio_file.relative_to(input_dir)
-            parent_dir = str(relative_path.parent) if relative_path.parent != Path('.') else '根目錄'
-            
-            if parent_dir not in dir_stats:
-                dir_stats[parent_dir] = 0
-            dir_stats[parent_dir] += 1
-        
         print(f"📁 基礎目錄: {input_dir}")
-        print(f"🎵 總音檔數: {len(audio_files)}")
+        print(f"🎵 總音檔數: {total_files}")
         print(f"📂 子目錄數: {len(dir_stats)}")
         print("\n📋 各目錄檔案分布:")
         
@@ -562,14 +635,23 @@ class UVR5Processor:
         print("="*60)
     
     def batch_enhance(self, input_dir: str, pattern: str = "*.wav",
-                     backup_original: bool = False) -> Dict:
+                     backup_original: bool = False,
+                     file_list: Optional[str] = None,
+                     save_file_list: Optional[str] = None,
+                     output_dir: Optional[str] = None) -> Dict:
         """
         批量處理目錄下的音檔
         
+        音檔邊走訪邊送入處理，不需先建立完整清單；已完成的檔案依工作清單跳過。
+        指定 output_dir 時輸出寫到該目錄（保留子目錄結構），原始檔案不變。
+        
         Args:
             input_dir: 輸入目錄
             pattern: 檔案匹配模式
             backup_original: 是否備份原始檔案
+            file_list: 預先建立的檔案清單（每行一個路徑，相對於 input_dir），指定時不走訪目錄
+            save_file_list: 走訪時同步寫出檔案清單，供下次以 file_list 快速重啟
+            output_dir: 輸出目錄（None = 原地處理）
             
         Returns:
             Dict: 批量處理結果
@@ -578,20 +660,101 @@ class UVR5Processor:
         if not input_dir.exists():
             raise FileNotFoundError(f"輸入目錄不存在: {input_dir}")
         
-        # 尋找音檔 - 支援巢狀目錄搜尋 (rglob 會遞迴搜尋所有子目錄)
-        audio_files = list(input_dir.rglob(pattern))
-        if not audio_files:
-            self.logger.warning(f"在 {input_dir} 中未找到匹配 {pattern} 的音檔")
-            return {'success': False, 'error': 'No audio files found'}
-        
-        # 分析目錄結構
-        self._analyze_directory_structure(input_dir, audio_files)
-        
-        self.logger.info(f"📁 找到 {len(audio_files)} 個音檔進行處理")
-        
+        # 音檔來源：預建檔案清單，或單次 scandir 走訪（支援巢狀目錄，略過 .uvr5_* 內部目錄）
+        if file_list:
+            self.logger.info(f"📄 讀取檔案清單: {file_list}")
+            source = read_file_list(file_list, input_dir)
+        else:
+            source = iter_audio_files(input_dir, [pattern])
+        if save_file_list:
+            source = tee_file_list(source, save_file_list, input_dir)
+        
+        # 工作清單：一次索引查詢取得已完成的檔案，走訪時直接跳過
+        # 指定輸出目錄時清單存放於輸出目錄，不寫入（可能唯讀的）輸入目錄
+        output_root = (input_dir, Path(output_dir)) if output_dir else None
+        if output_root:
+            self.manifest = UVR5JobManifest.for_output_directory(*output_root)
+        else:
+            self.manifest = UVR5JobManifest.for_directory(input_dir)
+        completed = self.manifest.completed_outputs()
+        discovery = {'found': 0, 'skipped': 0, 'dirs': {}}
+        
+        def is_completed(audio_file: Path) -> bool:
+            output_stat = completed.get(self.manifest.key_for(audio_file)) if completed else None
+            if not output_stat:
+                return False
+            if output_root is None:
+                return self.manifest.output_unchanged(output_stat, audio_file)
+            # 輸出到其他目錄：同時確認輸入檔未被替換
+            return self.manifest.completed_record(audio_file, self._mapped_output(audio_file, output_root)) is not None
+        
+        def pending_files():
+            for audio_file in source:
+                discovery['found'] += 1
+                self._count_directory(discovery['dirs'], input_dir, audio_file)
+                if is_completed(audio_file):
+                    discovery['skipped'] += 1
+                    continue
+                yield audio_file
+        
+        pending = pending_files()
+        first_file = next(pending, None)
+        if first_file is None:
+            if discovery['found'] == 0:
+                self.logger.warning(f"在 {input_dir} 中未找到匹配 {pattern} 的音檔")
+                return {'success': False, 'error': 'No audio files found'}
+            self.logger.info(f"⏭️ 工作清單顯示全部 {discovery['found']} 個檔案已完成")
+            self._print_directory_structure(input_dir, discovery['dirs'], discovery['found'])
+            return {
+                'success': True,
+                'stats': {'processed_files': discovery['found'], 'already_processed': discovery['found'],
+                          'failed_files': 0, 'total_time': 0, 'failed_list': []},
+                'total_files': discovery['found'],
+                'processed_files': discovery['found'],
+                'failed_files': 0
+            }
+        
+        work = self._schedule_stream(itertools.chain([first_file], pending))
+        result = self._run_work_list(work, backup_original, lambda: discovery['skipped'],
+                                     output_root=output_root)
+        
+        # 分析目錄結構（走訪完成後才有完整統計）
+        self._print_directory_structure(input_dir, discovery['dirs'], discovery['found'])
+        if discovery['skipped']:
+            self.logger.info(f"⏭️ 工作清單顯示 {discovery['skipped']} 個檔案已完成，跳過處理")
+        
+        result['total_files'] = discovery['found']
+        return result
+
+    @staticmethod
+    def _mapped_output(audio_file: Path, output_root: Optional[Tuple[Path, Path]]) -> Optional[str]:
+        """輸出目錄模式的輸出路徑（保留相對於輸入目錄的子目錄結構，目錄於寫出時才建立）；原地處理時回傳 None"""
+        if output_root is None:
+            return None
+        input_dir, output_dir = output_root
+        return str(output_dir / os.path.relpath(audio_file, input_dir))
+
+    def _run_work_list(self, audio_files: Iterable[Path], backup_original: bool,
+                       already_processed: Union[int, Callable[[], int]] = 0,
+                       on_result: Optional[Callable[[Path, Dict], None]] = None,
+                       output_root: Optional[Tuple[Path, Path]] = None) -> Dict:
+        """
+        處理已排程的工作清單
+
+        Args:
+            audio_files: 待處理音檔（已過濾完成檔案並排序，可為邊走訪邊產出的產生器）
+            backup_original: 是否備份原始檔案
+            already_processed: 工作清單中已完成而跳過的檔案數（串流走訪時為處理結束後才確定的計數函式）
+            on_result: 每個檔案處理完成時的回呼 (音檔, 結果)，供呼叫端歸屬統計
+            output_root: (輸入目錄, 輸出目錄)，None = 原地處理
+
+        Returns:
+            Dict: 批量處理結果
+        """
         # 重置統計
         self.stats = {
             'processed_files': 0,
+            'already_processed': 0,
             'failed_files': 0,
             'total_time': 0,
             'failed_list': [],
@@ -603,12 +766,16 @@ class UVR5Processor:
         start_time = time.time()
         
         # 批量處理
-        for audio_file in tqdm(audio_files, desc="🎵 UVR5 人聲分離"):
+        for audio_file in tqdm(audio_files, desc="🎵 UVR5 人聲分離", total=self._work_count(audio_files)):
             try:
-                result = self.enhance_audio(str(audio_file), backup_original=backup_original)
+                result = self.enhance_audio(str(audio_file), self._mapped_output(audio_file, output_root),
+                                            backup_original=backup_original, manifest=self.manifest)
+                if on_result:
+                    on_result(audio_file, result)
                 
                 if result['success']:
                     self.stats['processed_files'] += 1
+                    self._record_prescreen(self.stats, result)
                     # 統計預處理資訊
                     if result.get('preprocessed', False):
                         self.stats['preprocessed_files'] += 1
@@ -632,6 +799,8 @@ class UVR5Processor:
             except Exception as e:
                 self.stats['failed_files'] += 1
                 error_msg = f"Unexpected error: {str(e)}"
+                if on_result:
+                    on_result(audio_file, {'success': False, 'error': error_msg})
                 self.stats['failed_list'].append({
                     'file': str(audio_file),
                     'error': error_msg,
@@ -642,6 +811,7 @@ class UVR5Processor:
                 self.logger.debug(f"Exception traceback: {traceback.format_exc()}")
         
         self.stats['total_time'] = time.time() - start_time
+        self._add_already_processed(self.stats, already_processed)
         
         # 生成報告
         self._generate_batch_report()
@@ -649,73 +819,269 @@ class UVR5Processor:
         return {
             'success': True,
             'stats': self.stats,
-            'total_files': len(audio_files),
+            'total_files': self.stats['processed_files'] + self.stats['failed_files'],
             'processed_files': self.stats['processed_files'],
             'failed_files': self.stats['failed_files']
         }
+
+    @staticmethod
+    def _work_count(audio_files: Iterable[Path]) -> Optional[int]:
+        """工作數量（串流來源無法預知時為 None）"""
+        return len(audio_files) if hasattr(audio_files, '__len__') else None
+
+    @staticmethod
+    def _add_already_processed(stats: Dict, already_processed: Union[int, Callable[[], int]]):
+        """將工作清單跳過的檔案計入統計（串流走訪結束後才確定數量）"""
+        skipped = already_processed() if callable(already_processed) else already_processed
+        stats['already_processed'] = skipped
+        stats['processed_files'] += skipped
+
+    def _find_audio_files(self, input_dir: Path, pattern: str) -> List[Path]:
+        """尋找待處理音檔（單次走訪，排除工作清單內部檔案，例如保留的原始檔）"""
+        return list(iter_audio_files(input_dir, [pattern]))
+
+    def _filter_completed(self, audio_files: List[Path], manifest: UVR5JobManifest,
+                          output_root: Optional[Tuple[Path, Path]] = None) -> List[Path]:
+        """依工作清單過濾已完成的檔案（只對清單中已完成的檔案 stat，檔案被替換時重新處理）"""
+        completed = manifest.completed_outputs()
+        if not completed:
+            return audio_files
+
+        def is_completed(audio_file: Path) -> bool:
+            output_stat = completed.get(manifest.key_for(audio_file))
+            if not output_stat:
+                return False
+            if output_root is None:
+                return manifest.output_unchanged(output_stat, audio_file)
+            return manifest.completed_record(audio_file, self._mapped_output(audio_file, output_root)) is not None
+
+        pending = [f for f in audio_files if not is_completed(f)]
+        skipped = len(audio_files) - len(pending)
+        if skipped:
+            self.logger.info(f"⏭️ 工作清單顯示 {skipped} 個檔案已完成，跳過處理")
+        return pending
+    
+    def _schedule_by_length(self, audio_files: List[Path]) -> List[Path]:
+        """依檔頭長度分桶排序待處理檔案，並以工作清單的歷史速度預估處理時間"""
+        if not audio_files or os.getenv('UVR5_LENGTH_BUCKETS', 'true').lower() != 'true':
+            return audio_files
+
+        scheduler = LengthBucketScheduler(self.min_duration, self.target_duration, logger=self.logger)
+        plan = scheduler.plan(audio_files)
+        throughput = scheduler.measure_throughput(self.manifest.completed_timings())
+        prediction = scheduler.predict(plan, throughput, workers=getattr(self, 'max_workers', 1))
+        scheduler.print_plan(plan, prediction)
+        self.schedule_plan = plan
+        return scheduler.ordered_files(plan)
+
+    def _schedule_stream(self, audio_files: Iterable[Path]) -> Iterable[Path]:
+        """串流來源的長度分桶：每累積一窗（UVR5_SCHEDULE_WINDOW，預設 2000）排程一次"""
+        if os.getenv('UVR5_LENGTH_BUCKETS', 'true').lower() != 'true':
+            return audio_files
+
+        scheduler = LengthBucketScheduler(self.min_duration, self.target_duration, logger=self.logger)
+        throughput = scheduler.measure_throughput(self.manifest.completed_timings())
+        workers = getattr(self, 'max_workers', 1)
+
+        def report_plan(window_index: int, plan: List[Dict]):
+            self.schedule_plan = plan
+            if window_index == 0:
+                scheduler.print_plan(plan, scheduler.predict(plan, throughput, workers=workers))
+            else:
+                prediction = scheduler.predict(plan, throughput, workers=workers)
+                if prediction['wall_seconds'] is not None:
+                    self.logger.info(f"📦 第 {window_index + 1} 批排程: {sum(len(b['files']) for b in plan)} 檔案, "
+                                     f"預估 {prediction['wall_seconds']:.0f} 秒")
+
+        window_size = int(os.getenv('UVR5_SCHEDULE_WINDOW', '2000'))
+        return scheduler.schedule_stream(audio_files, window_size=window_size, on_plan=report_plan)
+
+    @staticmethod
+    def _new_speaker_entry(speaker: str, file_count: int) -> Dict:
+        """說話人統計初始值"""
+        entry = {
+            'speaker': speaker,
+            'success': bool(file_count),
+            'total_files': file_count,
+            'processed_files': 0,
+            'already_processed': 0,
+            'failed_files': 0
+        }
+        if not file_count:
+            entry['error'] = 'No audio files found'
+        return entry
     
-    def enhance_split_dataset(self, split_dir: str, backup_original: bool = False) -> Dict:
+    def _collect_split_directory_work(self, split_dir: Path) -> Dict:
+        """掃描 train/test 目錄，建立全域工作清單與說話人歸屬"""
+        work = {'results': {}, 'speaker_results': {}, 'attribution': {},
+                'all_files': [], 'root': split_dir}
+        
+        for subset in SPLIT_SUBSETS:
+            subset_dir = split_dir / subset
+            if not subset_dir.exists():
+                self.logger.warning(f"⚠️  {subset} 目錄不存在: {subset_dir}")
+                continue
+            
+            work['results'][subset] = []
+            for speaker_dir in sorted(d for d in subset_dir.iterdir() if d.is_dir()):
+                if UVR5JobManifest.is_internal_path(speaker_dir.name):
+                    continue
+                
+                key = (subset, speaker_dir.name)
+                audio_files = self._find_audio_files(speaker_dir, "*.wav")
+                entry = self._new_speaker_entry(speaker_dir.name, len(audio_files))
+                
+                work['speaker_results'][key] = entry
+                work['results'][subset].append(entry)
+                for audio_file in audio_files:
+                    work['attribution'][audio_file] = key
+                work['all_files'].extend(audio_files)
+        
+        return work
+    
+    def _collect_split_manifest_work(self, split_dir: Path, splits_info: Dict) -> Dict:
+        """讀取切分清單（train.jsonl/test.jsonl），建立全域工作清單與說話人歸屬"""
+        root = Path(splits_info['root'])
+        work = {'results': {}, 'speaker_results': {}, 'attribution': {},
+                'all_files': [], 'root': root}
+        self.logger.info(f"📄 使用切分清單，音檔位於: {root}")
+        
+        for subset, manifest_name in splits_info.get('manifests', {}).items():
+            manifest_path = split_dir / manifest_name
+            if not manifest_path.exists():
+                self.logger.warning(f"⚠️  {subset} 切分清單不存在: {manifest_path}")
+                continue
+            
+            speaker_files = {}
+            for row in load_split_manifest(str(manifest_path)):
+                # 已改寫為增強輸出的列，從原始音檔重新比對
+                speaker_files.setdefault(row['speaker'], []).append(Path(row.get('source_path', row['path'])))
+            
+            work['results'][subset] = []
+            for speaker in sorted(speaker_files):
+                key = (subset, speaker)
+                entry = self._new_speaker_entry(speaker, len(speaker_files[speaker]))
+                work['speaker_results'][key] = entry
+                work['results'][subset].append(entry)
+                for audio_file in speaker_files[speaker]:
+                    work['attribution'][audio_file] = key
+                work['all_files'].extend(speaker_files[speaker])
+        
+        return work
+    
+    def enhance_split_dataset(self, split_dir: str, backup_original: bool = False,
+                              output_dir: Optional[str] = None) -> Dict:
         """
         對切分後的訓練/測試集進行增強處理
         
+        所有子集與說話人的音檔合併為單一工作清單，一次排程處理，
+        避免逐個說話人呼叫 batch_enhance 時 GPU 在小批次之間閒置。
+        切分目錄只有切分清單（splits.json）時，清單列出的是原始語料，不原地覆寫：
+        人聲寫到輸出目錄（預設 <split_dir>/enhanced），並將清單的 path 欄位改指向輸出檔。
+        
         Args:
-            split_dir: split_dataset 目錄路徑
-            backup_original: 是否備份原始檔案
+            split_dir: split_dataset 目錄路徑（train/test 目錄或切分清單）
+            backup_original: 是否備份原始檔案（原地處理時）
+            output_dir: 輸出目錄（None = train/test 目錄原地處理、切分清單寫到 <split_dir>/enhanced）
             
         Returns:
-            Dict: 處理結果
+            Dict: 處理結果（依子集列出每個說話人的統計）
         """
         split_dir = Path(split_dir)
         if not split_dir.exists():
             raise FileNotFoundError(f"切分資料集目錄不存在: {split_dir}")
         
-        results = {}
+        # 切分清單模式（split_dataset.py --manifest_only）：音檔留在原處，依清單處理
+        splits_info = load_splits_info(str(split_dir))
+        manifest_mode = bool(splits_info) and not any((split_dir / subset).is_dir() for subset in SPLIT_SUBSETS)
+        if manifest_mode:
+            work = self._collect_split_manifest_work(split_dir, splits_info)
+            output_dir = output_dir or split_dir / self.SPLIT_ENHANCED_DIRNAME
+        else:
+            work = self._collect_split_directory_work(split_dir)
+        output_root = (work['root'], Path(output_dir)) if output_dir else None
+        if output_root:
+            self.logger.info(f"📂 輸出目錄: {output_root[1]}（原始音檔不變）")
+        
+        results = work['results']
+        speaker_results = work['speaker_results']
+        attribution = work['attribution']
+        all_files = work['all_files']
+        
+        if not all_files:
+            self.logger.warning(f"在 {split_dir} 中未找到任何說話人音檔")
+            self._generate_split_dataset_report(results)
+            return {'success': True, 'results': results}
+        
+        self._analyze_directory_structure(work['root'], all_files)
+        self.logger.info(f"📁 {len(speaker_results)} 個說話人共 {len(all_files)} 個音檔，合併為單一工作清單")
+        
+        # 工作清單置於資料集根目錄（第一次開啟時併入舊版 .bak.completed 標記），輸出到其他目錄時置於輸出目錄
+        if output_root:
+            self.manifest = UVR5JobManifest.for_output_directory(*output_root)
+        else:
+            self.manifest = UVR5JobManifest.for_directory(work['root'])
+        
+        pending = self._filter_completed(all_files, self.manifest, output_root)
+        pending_set = set(pending)
+        enhanced = []
+        for audio_file in all_files:
+            if audio_file not in pending_set:
+                entry = speaker_results[attribution[audio_file]]
+                entry['already_processed'] += 1
+                entry['processed_files'] += 1
+                enhanced.append(audio_file)
+        pending = self._schedule_by_length(pending)
+        
+        def attribute_result(audio_file: Path, result: Dict):
+            entry = speaker_results[attribution[audio_file]]
+            if result.get('success'):
+                entry['processed_files'] += 1
+                enhanced.append(audio_file)
+            else:
+                entry['failed_files'] += 1
+                entry['success'] = False
+                entry['error'] = f"{entry['failed_files']} 個檔案處理失敗 (最近: {result.get('error', 'Unknown error')})"
+        
+        run_result = self._run_work_list(pending, backup_original,
+                                         len(all_files) - len(pending), on_result=attribute_result,
+                                         output_root=output_root)
         
-        # 處理 train 和 test 目錄
-        for subset in ['train', 'test']:
-            subset_dir = split_dir / subset
-            if not subset_dir.exists():
-                self.logger.warning(f"⚠️  {subset} 目錄不存在: {subset_dir}")
-                continue
-            
-            self.logger.info(f"📊 開始處理 {subset} 資料集...")
-            
-            # 處理每個說話人目錄
-            speaker_dirs = [d for d in subset_dir.iterdir() if d.is_dir()]
-            subset_results = []
-            
-            for speaker_dir in speaker_dirs:
-                self.logger.info(f"👤 處理說話人: {speaker_dir.name}")
-                
-                try:
-                    result = self.batch_enhance(
-                        str(speaker_dir), 
-                        pattern="*.wav",
-                        backup_original=backup_original
-                    )
-                    result['speaker'] = speaker_dir.name
-                    subset_results.append(result)
-                    
-                except Exception as e:
-                    self.logger.error(f"❌ 說話人 {speaker_dir.name} 處理失敗: {e}")
-                    # 記錄完整的錯誤堆疊追蹤
-                    self.logger.debug(f"Exception traceback: {traceback.format_exc()}")
-                    subset_results.append({
-                        'speaker': speaker_dir.name,
-                        'success': False,
-                        'error': str(e)
-                    })
-            
-            results[subset] = subset_results
+        # 切分清單改指向增強後的音檔（失敗的檔案保留原路徑）
+        if manifest_mode:
+            rewrite_manifest_paths(str(split_dir), {str(audio_file): self._mapped_output(audio_file, output_root)
+                                                    for audio_file in enhanced})
         
         # 生成整體報告
         self._generate_split_dataset_report(results)
         
         return {
             'success': True,
-            'results': results
+            'results': results,
+            'stats': run_result.get('stats', {})
         }
     
+    @staticmethod
+    def _record_prescreen(stats: Dict, result: Dict):
+        """累計預篩分流結果"""
+        route = result.get('prescreen')
+        if route:
+            routes = stats.setdefault('prescreen', {})
+            routes[route] = routes.get(route, 0) + 1
+
+    @staticmethod
+    def _print_prescreen_summary(stats: Dict):
+        """顯示預篩分流統計"""
+        routes = stats.get('prescreen')
+        if not routes:
+            return
+        screened = sum(routes.values())
+        skipped = screened - routes.get(AudioPrescreener.ROUTE_SEPARATE, 0)
+        print(f"  預篩分流: 直接通過 {routes.get(AudioPrescreener.ROUTE_PASSTHROUGH, 0)}, "
+              f"輕度降噪 {routes.get(AudioPrescreener.ROUTE_DENOISE, 0)}, "
+              f"人聲分離 {routes.get(AudioPrescreener.ROUTE_SEPARATE, 0)} "
+              f"(略過分離 {skipped / screened:.1%})")
+
     def _generate_batch_report(self):
         """生成批量處理報告 - 按目錄結構分組顯示"""
         print("\n" + "="*80)
@@ -723,11 +1089,15 @@ class UVR5Processor:
         print("="*80)
         print(f"📊 處理統計:")
         print(f"  成功處理: {self.stats['processed_files']} 檔案")
+        if self.stats.get('already_processed'):
+            print(f"  已完成跳過: {self.stats['already_processed']} 檔案")
         print(f"  處理失敗: {self.stats['failed_files']} 檔案")
         print(f"  總處理時間: {self.stats['total_time']:.2f} 秒")
+        self._print_prescreen_summary(self.stats)
         
-        if self.stats['processed_files'] > 0:
-            avg_time = self.stats['total_time'] / self.stats['processed_files']
+        newly_processed = self.stats['processed_files'] - self.stats.get('already_processed', 0)
+        if newly_processed > 0:
+            avg_time = self.stats['total_time'] / newly_processed
             print(f"  平均處理時間: {avg_time:.2f} 秒/檔")
         
         if self.stats['failed_files'] > 0:
@@ -762,11 +1132,14 @@ class UVR5Processor:
             
             total_speakers = len(subset_results)
             successful_speakers = sum(1 for r in subset_results if r.get('success', False))
-            total_files = sum(r.get('processed_files', 0) for r in subset_results if r.get('success', False))
+            total_files = sum(r.get('processed_files', 0) for r in subset_results)
             
             print(f"  說話人總數: {total_speakers}")
             print(f"  成功處理說話人: {successful_speakers}")
             print(f"  總處理檔案數: {total_files}")
+            failed_files = sum(r.get('failed_files', 0) for r in subset_results)
+            if failed_files:
+                print(f"  失敗檔案數: {failed_files}")
             
             # 顯示失敗的說話人
             failed_speakers = [r for r in subset_results if not r.get('success', False)]
@@ -812,6 +1185,9 @@ class UVR5Processor:
 class ThreadedUVR5Processor(UVR5Processor):
     """多執行緒 UVR5 處理器 - 支援並行處理以提升大批量檔案的處理速度"""
     
+    OOM_MAX_RETRIES = 2  # 記憶體不足時單檔最多重新排入次數
+    SUBMIT_QUEUE_FACTOR = 4  # 排隊中任務數上限 = 並行上限 × 此倍數
+    
     def __init__(self, max_workers: int = 1, **kwargs):
         """
         初始化多執行緒 UVR5 處理器
@@ -824,49 +1200,29 @@ class ThreadedUVR5Processor(UVR5Processor):
         self.max_workers = max(1, int(max_workers))  # 確保至少為 1
         self.logger.info(f"🚀 多執行緒 UVR5 處理器初始化完成，並行數: {self.max_workers}")
     
-    def batch_enhance(self, input_dir: str, pattern: str = "*.wav",
-                     backup_original: bool = False) -> Dict:
-        """
-        多執行緒批量處理目錄下的音檔
-        
-        Args:
-            input_dir: 輸入目錄
-            pattern: 檔案匹配模式
-            backup_original: 是否備份原始檔案
-            
-        Returns:
-            Dict: 批量處理結果
-        """
-        input_dir = Path(input_dir)
-        if not input_dir.exists():
-            raise FileNotFoundError(f"輸入目錄不存在: {input_dir}")
-        
-        # 尋找音檔 - 支援巢狀目錄搜尋 (rglob 會遞迴搜尋所有子目錄)
-        audio_files = list(input_dir.rglob(pattern))
-        if not audio_files:
-            self.logger.warning(f"在 {input_dir} 中未找到匹配 {pattern} 的音檔")
-            return {'success': False, 'error': 'No audio files found'}
-        
-        total_files = len(audio_files)
-        
-        # 分析目錄結構
-        self._analyze_directory_structure(input_dir, audio_files)
-        
-        self.logger.info(f"📁 找到 {total_files} 個音檔進行處理")
-        
-        # 根據並行數選擇處理方式
+    def _run_work_list(self, audio_files: List[Path], backup_original: bool,
+                       already_processed: int = 0,
+                       on_result: Optional[Callable[[Path, Dict], None]] = None,
+                       output_root: Optional[Tuple[Path, Path]] = None) -> Dict:
+        """依並行數選擇單執行緒或多執行緒處理工作清單"""
         if self.max_workers <= 1:
             self.logger.info("🔄 使用單執行緒模式處理")
-            return self._single_thread_batch_enhance(audio_files, backup_original)
-        else:
-            self.logger.info(f"🚀 使用多執行緒模式處理，並行數: {self.max_workers}")
-            return self._multi_thread_batch_enhance(audio_files, backup_original)
+            return self._single_thread_batch_enhance(audio_files, backup_original, already_processed,
+                                                     on_result, output_root)
+
+        self.logger.info(f"🚀 使用多執行緒模式處理，並行數: {self.max_workers}")
+        return self._multi_thread_batch_enhance(audio_files, backup_original, already_processed,
+                                                on_result, output_root)
     
-    def _single_thread_batch_enhance(self, audio_files: List[Path], backup_original: bool) -> Dict:
+    def _single_thread_batch_enhance(self, audio_files: Iterable[Path], backup_original: bool,
+                                     already_processed: Union[int, Callable[[], int]] = 0,
+                                     on_result: Optional[Callable[[Path, Dict], None]] = None,
+                                     output_root: Optional[Tuple[Path, Path]] = None) -> Dict:
         """單執行緒批量處理（原有邏輯）"""
         # 重置統計
         self.stats = {
             'processed_files': 0,
+            'already_processed': 0,
             'failed_files': 0,
             'total_time': 0,
             'failed_list': [],
@@ -877,12 +1233,16 @@ class ThreadedUVR5Processor(UVR5Processor):
         start_time = time.time()
         
         # 批量處理
-        for audio_file in tqdm(audio_files, desc="🎵 UVR5 人聲分離"):
+        for audio_file in tqdm(audio_files, desc="🎵 UVR5 人聲分離", total=self._work_count(audio_files)):
             try:
-                result = self.enhance_audio(str(audio_file), backup_original=backup_original)
+                result = self.enhance_audio(str(audio_file), self._mapped_output(audio_file, output_root),
+                                            backup_original=backup_original, manifest=self.manifest)
+                if on_result:
+                    on_result(audio_file, result)
                 
                 if result['success']:
                     self.stats['processed_files'] += 1
+                    self._record_prescreen(self.stats, result)
                 else:
                     self.stats['failed_files'] += 1
                     self.stats['failed_list'].append({
@@ -896,9 +1256,12 @@ class ThreadedUVR5Processor(UVR5Processor):
                     'file': str(audio_file),
                     'error': str(e)
                 })
+                if on_result:
+                    on_result(audio_file, {'success': False, 'error': str(e)})
                 self.logger.error(f"❌ 處理失敗 {audio_file.name}: {e}")
         
         self.stats['total_time'] = time.time() - start_time
+        self._add_already_processed(self.stats, already_processed)
         
         # 生成報告
         self._generate_batch_report()
@@ -906,85 +1269,121 @@ class ThreadedUVR5Processor(UVR5Processor):
         return {
             'success': True,
             'stats': self.stats,
-            'total_files': len(audio_files),
+            'total_files': self.stats['processed_files'] + self.stats['failed_files'],
             'processed_files': self.stats['processed_files'],
             'failed_files': self.stats['failed_files']
         }
     
-    def _multi_thread_batch_enhance(self, audio_files: List[Path], backup_original: bool) -> Dict:
-        """多執行緒批量處理"""
+    def _multi_thread_batch_enhance(self, audio_files: Iterable[Path], backup_original: bool,
+                                    already_processed: Union[int, Callable[[], int]] = 0,
+                                    on_result: Optional[Callable[[Path, Dict], None]] = None,
+                                    output_root: Optional[Tuple[Path, Path]] = None) -> Dict:
+        """多執行緒批量處理（並行數由 GPU 記憶體調節器動態控制）"""
         start_time = time.time()
         
-        # 檢查 GPU 記憶體並動態調整執行緒數
-        actual_workers = self._check_gpu_memory()
-        if actual_workers <= 1:
-            self.logger.warning("⚠️  GPU 記憶體不足，降級到單執行緒模式")
-            return self._single_thread_batch_enhance(audio_files, backup_original)
-        elif actual_workers < self.max_workers:
-            # 動態調整執行緒數
-            original_workers = self.max_workers
-            self.max_workers = actual_workers
-            self.logger.info(f"🔧 動態調整執行緒數: {original_workers} → {actual_workers}")
+        # 靜態檢查只決定起始並行數，之後由調節器依實測記憶體增減
+        initial_workers = max(1, self._check_gpu_memory())
+        governor = GPUMemoryGovernor.for_device(
+            self.device,
+            max_workers=self.max_workers,
+            initial_workers=initial_workers,
+            headroom=float(os.getenv('UVR5_GPU_HEADROOM', '0.1')),
+            logger=self.logger
+        )
+        if initial_workers < self.max_workers:
+            self.logger.info(f"🔧 起始並行數: {initial_workers}（上限 {self.max_workers}，依實測記憶體動態調整）")
         
         # 初始化統計
         stats = {
             'processed_files': 0,
+            'already_processed': 0,
             'failed_files': 0,
+            'oom_retries': 0,
             'total_time': 0,
             'failed_list': []
         }
         
-        # 創建執行緒池和 UVR5 處理器實例
+        # UVR5 處理器實例池：先建立起始數量，調節器提高並行數時再按需建立
         processors = []
-        try:
-            self.logger.info(f"🔧 創建 {self.max_workers} 個 UVR5 處理器實例...")
-            for i in range(self.max_workers):
-                processor = UVR5Processor(
-                    model_path=str(self.model_path),
-                    vocal_model=self.vocal_model,
-                    device=self.device,
-                    batch_size=self.batch_size,
-                    min_duration=self.min_duration,
-                    target_duration=self.target_duration
-                )
+        idle_processors = queue.Queue()
+        processors_lock = threading.Lock()
+        
+        def create_processor() -> UVR5Processor:
+            processor = UVR5Processor(
+                model_path=str(self.model_path),
+                vocal_model=self.vocal_model,
+                device=self.device,
+                batch_size=self.batch_size,
+                min_duration=self.min_duration,
+                target_duration=self.target_duration,
+                cleanup_temp=False
+            )
+            with processors_lock:
                 processors.append(processor)
+            return processor
+        
+        def acquire_processor() -> UVR5Processor:
+            try:
+                return idle_processors.get_nowait()
+            except queue.Empty:
+                self.logger.info(f"🔧 並行數提高，建立第 {len(processors) + 1} 個 UVR5 處理器實例")
+                return create_processor()
+        
+        def process_file(audio_file: Path) -> Dict:
+            for attempt in range(self.OOM_MAX_RETRIES + 1):
+                with governor.slot():
+                    processor = acquire_processor()
+                    try:
+                        result = processor.enhance_audio(
+                            str(audio_file),
+                            output_path=self._mapped_output(audio_file, output_root),
+                            backup_original=backup_original,
+                            manifest=self.manifest
+                        )
+                    finally:
+                        idle_processors.put(processor)
+                
+                if not result.get('out_of_memory') or attempt == self.OOM_MAX_RETRIES:
+                    return result
+                
+                # 記憶體不足：降低並行數後重新排入
+                governor.report_oom()
+                result['oom_retries'] = attempt + 1
+                self.logger.warning(f"🔁 記憶體不足，重新排入 {audio_file.name} ({attempt + 1}/{self.OOM_MAX_RETRIES})")
+            return result
+        
+        try:
+            self.logger.info(f"🔧 創建 {governor.limit} 個 UVR5 處理器實例...")
+            for _ in range(governor.limit):
+                idle_processors.put(create_processor())
             
-            # 多執行緒處理
+            # 執行緒池大小為並行上限，實際同時處理的數量由調節器控制
             with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                # 提交任務
+                # 邊走訪邊提交任務，排隊中的任務數有上限，不需先建立完整清單
+                work_iter = iter(audio_files)
+                max_queued = self.max_workers * self.SUBMIT_QUEUE_FACTOR
                 future_to_file = {}
-                for i, audio_file in enumerate(audio_files):
-                    processor = processors[i % self.max_workers]
-                    future = executor.submit(
-                        processor.enhance_audio, 
-                        str(audio_file), 
-                        backup_original=backup_original
-                    )
-                    future_to_file[future] = audio_file
+                
+                def submit_next() -> bool:
+                    audio_file = next(work_iter, None)
+                    if audio_file is None:
+                        return False
+                    future_to_file[executor.submit(process_file, audio_file)] = audio_file
+                    return True
+                
+                while len(future_to_file) < max_queued and submit_next():
+                    pass
                 
                 # 收集結果並顯示進度
-                progress_bar = tqdm(total=len(audio_files), desc="🚀 多執行緒 UVR5 人聲分離")
-                for future in as_completed(future_to_file):
-                    audio_file = future_to_file[future]
-                    try:
-                        result = future.result()
-                        if result['success']:
-                            stats['processed_files'] += 1
-                        else:
-                            stats['failed_files'] += 1
-                            stats['failed_list'].append({
-                                'file': str(audio_file),
-                                'error': result.get('error', 'Unknown error')
-                            })
-                    except Exception as e:
-                        stats['failed_files'] += 1
-                        stats['failed_list'].append({
-                            'file': str(audio_file),
-                            'error': str(e)
-                        })
-                        self.logger.error(f"❌ 多執行緒處理失敗 {audio_file.name}: {e}")
-                    
-                    progress_bar.update(1)
+                progress_bar = tqdm(total=self._work_count(audio_files), desc="🚀 多執行緒 UVR5 人聲分離")
+                while future_to_file:
+                    done, _ = wait(future_to_file, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        audio_file = future_to_file.pop(future)
+                        submit_next()
+                        self._collect_threaded_result(stats, future, audio_file, on_result)
+                        progress_bar.set_postfix(workers=governor.limit)
+                        progress_bar.update(1)
                 
                 progress_bar.close()
             
@@ -998,20 +1397,50 @@ class ThreadedUVR5Processor(UVR5Processor):
                     self.logger.debug(f"Cleanup exception traceback: {traceback.format_exc()}")
         
         stats['total_time'] = time.time() - start_time
+        stats['governor'] = governor.summary()
+        new_files = stats['processed_files'] + stats['failed_files']
+        self._add_already_processed(stats, already_processed)
         
         # 生成報告
-        self._generate_threaded_batch_report(stats, len(audio_files))
+        self._generate_threaded_batch_report(stats, new_files)
         
         return {
             'success': True,
             'stats': stats,
-            'total_files': len(audio_files),
+            'total_files': stats['processed_files'] + stats['failed_files'],
             'processed_files': stats['processed_files'],
             'failed_files': stats['failed_files']
         }
     
+    def _collect_threaded_result(self, stats: Dict, future, audio_file: Path,
+                                 on_result: Optional[Callable[[Path, Dict], None]] = None):
+        """彙整單一多執行緒任務的結果"""
+        try:
+            result = future.result()
+            if on_result:
+                on_result(audio_file, result)
+            stats['oom_retries'] += result.get('oom_retries', 0)
+            if result['success']:
+                stats['processed_files'] += 1
+                self._record_prescreen(stats, result)
+            else:
+                stats['failed_files'] += 1
+                stats['failed_list'].append({
+                    'file': str(audio_file),
+                    'error': result.get('error', 'Unknown error')
+                })
+        except Exception as e:
+            stats['failed_files'] += 1
+            stats['failed_list'].append({
+                'file': str(audio_file),
+                'error': str(e)
+            })
+            if on_result:
+                on_result(audio_file, {'success': False, 'error': str(e)})
+            self.logger.error(f"❌ 多執行緒處理失敗 {audio_file.name}: {e}")
+    
     def _check_gpu_memory(self) -> int:
-        """檢查 GPU 記憶體並返回建議的執行緒數"""
+        """檢查 GPU 記憶體並返回建議的起始執行緒數（批次中由 GPUMemoryGovernor 依實測值調整）"""
         if self.device != 'cuda' or not torch.cuda.is_available():
             return self.max_workers  # CPU 模式使用原始設定
         
@@ -1074,12 +1503,22 @@ class ThreadedUVR5Processor(UVR5Processor):
         print("="*80)
         print(f"📊 處理統計:")
         print(f"  並行執行緒數: {self.max_workers}")
+        governor_stats = stats.get('governor')
+        if governor_stats and governor_stats['adjustments'] + governor_stats['oom_count'] > 0:
+            print(f"  動態並行數: {governor_stats['min_limit_reached']}-{governor_stats['max_limit_reached']} "
+                  f"(最終 {governor_stats['final_limit']}, 調整 {governor_stats['adjustments']} 次)")
+            if governor_stats['oom_count']:
+                print(f"  記憶體不足重試: {stats.get('oom_retries', 0)} 次")
         print(f"  成功處理: {stats['processed_files']} 檔案")
+        if stats.get('already_processed'):
+            print(f"  已完成跳過: {stats['already_processed']} 檔案")
         print(f"  處理失敗: {stats['failed_files']} 檔案")
         print(f"  總處理時間: {stats['total_time']:.2f} 秒")
+        self._print_prescreen_summary(stats)
         
-        if stats['processed_files'] > 0:
-            avg_time = stats['total_time'] / stats['processed_files']
+        newly_processed = stats['processed_files'] - stats.get('already_processed', 0)
+        if newly_processed > 0:
+            avg_time = stats['total_time'] / newly_processed
             print(f"  平均處理時間: {avg_time:.2f} 秒/檔")
             
             # 估算加速比（相對於單執行緒）
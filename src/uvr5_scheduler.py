@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+UVR5 長度分桶排程器
+處理前先讀取音檔檔頭取得長度，依長度分桶後同桶連續處理，並預估總處理時間
+
+主要功能：
+- 只讀檔頭的快速長度探測（不解碼音訊）
+- 依長度區間分桶，同桶檔案連續派送
+- 由工作清單的歷史記錄量測各桶處理速度
+- 預估批次總處理時間
+
+Author:  TTS ETL Pipeline
+Version: 1.0
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+# 長度區間上界（秒），最後一桶為 80 秒以上
+DEFAULT_BUCKET_EDGES = (5.0, 10.0, 20.0, 40.0, 80.0)
+
+PADDED_BUCKET = "padded"
+
+
+def probe_duration(audio_path: Union[str, Path]) -> float:
+    """只讀取檔頭取得音檔長度（秒）"""
+    try:
+        import soundfile as sf
+        return float(sf.info(str(audio_path)).duration)
+    except ImportError:
+        import torchaudio
+        info = torchaudio.info(str(audio_path))
+        return info.num_frames / info.sample_rate
+
+
+def probe_durations(audio_files: Sequence[Path], max_workers: int = 8) -> Dict[Path, float]:
+    """並行探測多個音檔長度（無法讀取的檔案記為 0，交由後續處理回報錯誤）"""
+    def safe_probe(audio_file: Path) -> float:
+        try:
+            return probe_duration(audio_file)
+        except Exception:
+            return 0.0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(audio_files, executor.map(safe_probe, audio_files)))
+
+
+class LengthBucketScheduler:
+    """長度分桶排程器
+
+    設計原則：
+    - 補零一致：短於 min_duration 的音檔都會補零到 target_duration，處理成本相同，歸為同一桶
+    - 同桶連續：同長度區間的檔案一起派送，並行時進行中的工作長度相近
+    - 實測估算：處理速度取自工作清單中已完成工作的實際耗時
+    """
+
+    def __init__(self,
+                 min_duration: float,
+                 target_duration: float,
+                 edges: Iterable[float] = DEFAULT_BUCKET_EDGES,
+                 logger: Optional[logging.Logger] = None):
+        """
+        初始化排程器
+
+        Args:
+            min_duration: 補零門檻（秒），與 UVR5Processor 相同
+            target_duration: 補零目標長度（秒）
+            edges: 長度區間上界（秒）
+            logger: 記錄器
+        """
+        self.min_duration = min_duration
+        self.target_duration = target_duration
+        self.edges = sorted(edge for edge in edges if edge > min_duration)
+        self.logger = logger or logging.getLogger(__name__)
+
+    @property
+    def bucket_labels(self) -> List[str]:
+        """所有桶的標籤（依長度遞增）"""
+        labels = [PADDED_BUCKET]
+        lower = self.min_duration
+        for edge in self.edges:
+            labels.append(f"{lower:g}-{edge:g}s")
+            lower = edge
+        labels.append(f"{lower:g}s+")
+        return labels
+
+    def bucket_for(self, duration: float) -> str:
+        """取得長度所屬的桶"""
+        if duration < self.min_duration:
+            return PADDED_BUCKET
+        labels = self.bucket_labels
+        for index, edge in enumerate(self.edges):
+            if duration < edge:
+                return labels[index + 1]
+        return labels[-1]
+
+    def effective_duration(self, duration: float) -> float:
+        """實際送入模型的長度（短音檔補零後為 target_duration）"""
+        return self.target_duration if duration < self.min_duration else duration
+
+    def plan(self, audio_files: Sequence[Path],
+             durations: Optional[Dict[Path, float]] = None) -> List[Dict]:
+        """
+        建立分桶計劃
+
+        Args:
+            audio_files: 待處理音檔
+            durations: 已知長度（None = 探測檔頭）
+
+        Returns:
+            List[Dict]: 依長度遞增的桶，每桶包含 label/files/durations/total_duration
+        """
+        if durations is None:
+            durations = probe_durations(audio_files)
+
+        buckets = {label: [] for label in self.bucket_labels}
+        for audio_file in audio_files:
+            duration = durations.get(audio_file, 0.0)
+            buckets[self.bucket_for(duration)].append((duration, audio_file))
+
+        plan = []
+        for label, entries in buckets.items():
+            if not entries:
+                continue
+            entries.sort(key=lambda entry: entry[0])
+            plan.append({
+                'label': label,
+                'files': [audio_file for _, audio_file in entries],
+                'durations': [duration for duration, _ in entries],
+                'total_duration': sum(duration for duration, _ in entries),
+                'effective_duration': sum(self.effective_duration(duration) for duration, _ in entries)
+            })
+        return plan
+
+    @staticmethod
+    def ordered_files(plan: List[Dict]) -> List[Path]:
+        """依桶順序展開為派送順序"""
+        return [audio_file for bucket in plan for audio_file in bucket['files']]
+
+    def schedule_stream(self, audio_files: Iterable[Path], window_size: int = 2000,
+                        on_plan: Optional[Callable[[int, List[Dict]], None]] = None) -> Iterator[Path]:
+        """
+        分窗排程：邊探索邊排程，每累積 window_size 個檔案分桶一次後依序產出
+
+        Args:
+            audio_files: 音檔來源（可為產生器）
+            window_size: 每窗檔案數
+            on_plan: 每窗分桶後的回呼 (窗序號, 分桶計劃)
+
+        Yields:
+            Path: 依桶順序排列的音檔
+        """
+        window = []
+        window_index = 0
+        for audio_file in audio_files:
+            window.append(audio_file)
+            if len(window) >= window_size:
+                plan = self.plan(window)
+                if on_plan:
+                    on_plan(window_index, plan)
+                yield from self.ordered_files(plan)
+                window = []
+                window_index += 1
+
+        if window:
+            plan = self.plan(window)
+            if on_plan:
+                on_plan(window_index, plan)
+            yield from self.ordered_files(plan)
+
+    def measure_throughput(self, timings: Iterable[Tuple[float, float]]) -> Dict[str, float]:
+        """
+        由歷史記錄量測各桶處理速度
+
+        Args:
+            timings: (音檔長度, 處理時間) 列表，通常來自 UVR5JobManifest.completed_timings()
+
+        Returns:
+            Dict[str, float]: 每秒（補零後）音訊所需處理秒數；'overall' 為全部平均
+        """
+        totals: Dict[str, List[float]] = {}
+        for duration, processing_time in timings:
+            for label in (self.bucket_for(duration), 'overall'):
+                entry = totals.setdefault(label, [0.0, 0.0])
+                entry[0] += processing_time
+                entry[1] += self.effective_duration(duration)
+
+        return {
+            label: processing / audio
+            for label, (processing, audio) in totals.items()
+            if audio > 0
+        }
+
+    def predict(self, plan: List[Dict], throughput: Dict[str, float], workers: int = 1) -> Dict:
+        """
+        預估處理時間
+
+        Args:
+            plan: 分桶計劃
+            throughput: measure_throughput() 的結果
+            workers: 並行數（以線性加速粗估）
+
+        Returns:
+            Dict: 各桶與總預估時間（無量測資料時為 None）
+        """
+        fallback = throughput.get('overall')
+        per_bucket = {}
+        measured = True
+        for bucket in plan:
+            rate = throughput.get(bucket['label'], fallback)
+            if rate is None:
+                per_bucket[bucket['label']] = None
+                measured = False
+            else:
+                per_bucket[bucket['label']] = rate * bucket['effective_duration']
+
+        total = sum(seconds for seconds in per_bucket.values() if seconds is not None) if measured else None
+        return {
+            'per_bucket': per_bucket,
+            'total_seconds': total,
+            'wall_seconds': total / max(1, workers) if total is not None else None,
+            'workers': max(1, workers),
+            'measured_buckets': sum(1 for bucket in plan if bucket['label'] in throughput)
+        }
+
+    def print_plan(self, plan: List[Dict], prediction: Optional[Dict] = None):
+        """顯示分桶計劃與預估時間"""
+        print("\n" + "=" * 60)
+        print("📦 長度分桶排程")
+        print("=" * 60)
+        for bucket in plan:
+            line = f"  {bucket['label']:>10}: {len(bucket['files']):6d} 檔案, {bucket['total_duration'] / 60:8.1f} 分鐘"
+            if prediction and prediction['per_bucket'].get(bucket['label']) is not None:
+                line += f", 預估 {_format_seconds(prediction['per_bucket'][bucket['label']])}"
+            print(line)
+
+        if prediction:
+            if prediction['wall_seconds'] is None:
+                print("⏱️  尚無處理速度記錄，完成部分檔案後重新執行即可取得預估時間")
+            else:
+                print(f"⏱️  預估處理時間: {_format_seconds(prediction['wall_seconds'])}"
+                      f" (並行數 {prediction['workers']}，依 {prediction['measured_buckets']} 個桶的實測速度)")
+        print("=" * 60)
+
+
+def _format_seconds(seconds: float) -> str:
+    """將秒數格式化為 時:分:秒"""
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{secs:02d}s"
+    if minutes:
+        return f"{minutes}m{secs:02d}s"
+    return f"{secs}s"
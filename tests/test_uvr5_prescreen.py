@@ -0,0 +1,70 @@
+"""
+UVR5 預篩器測試：以已知音量的訊號驗證 dBFS 量測與分流門檻
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from uvr5_prescreen import AudioPrescreener  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+def _white_noise(rms: float, seconds: float = 5.0, seed: int = 0) -> np.ndarray:
+    return rms * np.random.default_rng(seed).standard_normal(int(SAMPLE_RATE * seconds))
+
+
+def _with_speech_bursts(background: np.ndarray, amplitude: float = 0.3) -> np.ndarray:
+    """每秒前半秒加入 220 Hz 諧波音（模擬對白），後半秒只有背景"""
+    t = np.arange(len(background)) / SAMPLE_RATE
+    voiced = (t % 1.0) < 0.5
+    tone = amplitude * (np.sin(2 * np.pi * 220 * t) + 0.5 * np.sin(2 * np.pi * 440 * t)) / 1.5
+    return background + tone * voiced
+
+
+@pytest.mark.parametrize("rms_dbfs", [-60.0, -40.0, -20.0])
+def test_white_noise_level(rms_dbfs):
+    features = AudioPrescreener().analyze(_white_noise(10 ** (rms_dbfs / 20)), SAMPLE_RATE)
+    assert features['background_db'] == pytest.approx(rms_dbfs, abs=1.0)
+
+
+@pytest.mark.parametrize("amplitude", [0.5, 0.1, 0.01])
+def test_sine_level(amplitude):
+    t = np.arange(SAMPLE_RATE * 5) / SAMPLE_RATE
+    features = AudioPrescreener().analyze(amplitude * np.sin(2 * np.pi * 440 * t), SAMPLE_RATE)
+    # 正弦波的均方值為 A^2 / 2
+    assert features['background_db'] == pytest.approx(10 * np.log10(amplitude ** 2 / 2), abs=0.1)
+
+
+def test_level_independent_of_fft_size():
+    noise = _white_noise(0.01)
+    levels = [AudioPrescreener(n_fft=n_fft).analyze(noise, SAMPLE_RATE)['background_db']
+              for n_fft in (512, 1024, 2048)]
+    assert max(levels) - min(levels) < 0.5
+
+
+def test_routes_follow_dbfs_thresholds():
+    prescreener = AudioPrescreener()
+    routes = {
+        rms_dbfs: prescreener.classify(prescreener.analyze(
+            _with_speech_bursts(_white_noise(10 ** (rms_dbfs / 20))), SAMPLE_RATE))
+        for rms_dbfs in (-60.0, -45.0, -25.0)
+    }
+    # 背景 -60 dBFS 低於 -50 門檻 → 直接通過；-45 介於 -50 與 -35 之間的寬頻雜訊 → 輕度降噪；-25 → 分離
+    assert routes == {-60.0: AudioPrescreener.ROUTE_PASSTHROUGH,
+                      -45.0: AudioPrescreener.ROUTE_DENOISE,
+                      -25.0: AudioPrescreener.ROUTE_SEPARATE}
+
+
+def test_tonal_background_is_separated():
+    t = np.arange(SAMPLE_RATE * 5) / SAMPLE_RATE
+    music = 10 ** (-45 / 20) * np.sqrt(2) * np.sin(2 * np.pi * 330 * t)
+    prescreener = AudioPrescreener()
+    features = prescreener.analyze(_with_speech_bursts(music), SAMPLE_RATE)
+    assert features['background_db'] == pytest.approx(-45.0, abs=1.0)
+    assert prescreener.classify(features) == AudioPrescreener.ROUTE_SEPARATE